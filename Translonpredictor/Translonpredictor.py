@@ -5,13 +5,13 @@ import click
 import polars as pl
 import warnings
 
-from .readfiles import readbam
-from .fileprocessor import dftobed, bedtobigwig
-from .getcandidates import gettranscripts, preporfs, orfrelativeposition
+from .fileprocessor import bamtobed, beddftobigwig, bedtobigwig
+from .getcandidates import gettranscripts, streamorfs, orfrelativeposition, workerpool
 from .filewriter import saveorfsandexons
 from .bigwigtodf import scoring
 from .plotting import plottop10
 from .report import getparameters
+from .batch import readsamplesheet, preparecandidates, runbatch
 
 warnings.filterwarnings("ignore")
 
@@ -33,6 +33,14 @@ warnings.filterwarnings("ignore")
 )
 @click.option("--minlen", "-min", default=0, help="Provide the minimum length")
 @click.option("--maxlen", "-max", default=1000000, help="Provide the maximum length")
+@click.option(
+    "--orfengine",
+    "-oe",
+    default="automaton",
+    type=click.Choice(["automaton", "numpy"]),
+    help="Select how candidate ORFs are found: 'automaton' scans one transcript at a time, \
+             'numpy' scans batches of transcripts with array operations, Default = automaton",
+)
 @click.option("--bigwig", "-bw", help="Provide a Bigwig file to convert")
 @click.option("--exon", "-ex", help="Provide a file containing exon positions")
 @click.option("--bedfile", "-bw", help="Provide a Bigwig file to convert")
@@ -52,7 +60,89 @@ warnings.filterwarnings("ignore")
              the Start Rise Up score. This sets the amount of nucleotides before and after \
              the stop codon will regarded when calculating",
 )
-@click.option("--offsets", "-ofs", help="Provide a file containing offset parameters")
+@click.option(
+    "--offsets",
+    "-ofs",
+    help="Provide a file containing offset parameters (e.g. the '_offsets.tsv' file of an earlier run)",
+)
+@click.option(
+    "--streaming",
+    "-str",
+    is_flag=True,
+    default=False,
+    help="Stream the BAM file in batches instead of reading it into memory at once, \
+             not combined with more than one thread",
+)
+@click.option(
+    "--batchsize",
+    "-bs",
+    default=None,
+    type=int,
+    help="Provide the approximate size of a batch in compressed BAM bytes when streaming, \
+             Default = one reference sequence per batch",
+)
+@click.option(
+    "--indexdir",
+    "-idx",
+    help="Provide a directory for the BAM index if the directory of the BAM file is not writable, \
+             Default = ~/.cache/Translonpredictor",
+)
+@click.option(
+    "--mapq", "-mq", default=0, help="Provide the minimum mapping quality of reads, Default = 0"
+)
+@click.option(
+    "--flagmask",
+    "-fm",
+    default=0,
+    help="Provide a SAM flag mask, reads with any of these flag bits set are removed, Default = 0",
+)
+@click.option(
+    "--minreadlen", "-minr", type=int, help="Provide the minimum read length (end - pos)"
+)
+@click.option(
+    "--maxreadlen", "-maxr", type=int, help="Provide the maximum read length (end - pos)"
+)
+@click.option(
+    "--countpattern",
+    "-cp",
+    default="collapsed",
+    help="Provide how read counts are stored in the read names: 'collapsed' (read_x15), \
+             'none' (every read counts once) or a regular expression with one capture group, Default = collapsed",
+)
+@click.option(
+    "--offsetsample",
+    "-ofss",
+    type=int,
+    help="Provide the maximum number of reads per read length near annotated CDS starts used to \
+             estimate offsets; reading stops early once the offsets are stable and every read \
+             length has at least 1000 reads. Default = all reads",
+)
+@click.option(
+    "--writebedgraph",
+    "-wbg",
+    is_flag=True,
+    help="Also write the A-site counts of a BAM file to a '.bedGraph' file",
+)
+@click.option(
+    "--writetranscripts",
+    "-wtr",
+    is_flag=True,
+    help="Also write the transcript sequences extracted from the genome to a '.fa' file",
+)
+@click.option(
+    "--samplesheet",
+    "-ss",
+    help="Provide a tab-separated sample sheet with the columns 'sample' and 'bam' or 'bigwig' \
+             (and optionally 'offsets') to score several samples against the same candidate ORFs",
+)
+@click.option(
+    "--threads",
+    "-th",
+    default=1,
+    help="Provide the number of worker processes, Default = 1. \
+             With more than one, every reference sequence of the BAM file, every chromosome of the transcript\
+             extraction and every chunk of transcripts scanned for ORFs is processed in a separate worker",
+)
 @click.option(
     "--scoretype",
     "-s",
@@ -81,11 +171,25 @@ def translonpredictor(
     stops,
     minlen,
     maxlen,
+    orfengine,
     exon,
     orfs,
     range_param,
     sru_range,
     offsets,
+    streaming,
+    batchsize,
+    indexdir,
+    mapq,
+    flagmask,
+    minreadlen,
+    maxreadlen,
+    countpattern,
+    offsetsample,
+    writebedgraph,
+    writetranscripts,
+    samplesheet,
+    threads,
     scoretype,
     plotfile,
     outfilename,
@@ -105,11 +209,29 @@ def translonpredictor(
     - stops (str): Comma-separated string of stop codons to consider during ORF prediction.
     - minlen (int): Minimum length threshold for predicted ORFs.
     - maxlen (int): Maximum length threshold for predicted ORFs.
+    - orfengine (str): 'automaton' or 'numpy', the engine used to find candidate ORFs, see `getcandidates.preporfs`.
     - exon (str): Path to file containing exon information.
     - orfs (str): Path to file containing pre-annotated ORFs.
     - range_param (int): Parameter for specifying the range around ORFs for metagene analysis.
     - sru_range (int): Range parameter for Start Rise Up (SRU) scoring.
-    - offsets (str): Comma-separated string of offsets to apply during transcriptome analysis.
+    - offsets (str): Path to a file with the offset of every read length, as written to '{outfilename}_offsets.tsv'
+      when the offsets are estimated. If not provided, the offsets are estimated from the reads.
+    - streaming (bool): Whether to stream the BAM file in batches to bound memory usage.
+    - batchsize (int): Approximate size of a streamed batch in compressed BAM bytes.
+    - indexdir (str): Directory for the BAM index if the directory of the BAM file is not writable.
+    - mapq (int): Minimum mapping quality of reads.
+    - flagmask (int): SAM flag mask, reads with any of these flag bits set are removed.
+    - minreadlen (int): Minimum read length.
+    - maxreadlen (int): Maximum read length.
+    - countpattern (str): How read counts are stored in the read names.
+    - offsetsample (int): Maximum number of reads per read length used to estimate offsets from a subsample.
+    - writebedgraph (bool): Whether to also write the A-site counts to '{outfilename}.bedGraph'.
+    - writetranscripts (bool): Whether to also write the transcript sequences extracted from the genome to
+      '{outfilename}_transcripts.fa'. Without it, the sequences are passed to the ORF finder in memory.
+    - samplesheet (str): Path to a sample sheet listing the BAM or bigWig files of a batch of samples. The candidate ORFs
+      are found once and scored for every sample, with `threads` samples processed at the same time.
+    - threads (int): Number of worker processes used for processing the BAM file, extracting the transcripts and finding
+      candidate ORFs, or the number of samples processed at the same time in batch mode.
     - scoretype (str): Type of scoring method to apply (e.g., HRF, average, NZC).
     - plotfile (str): Path to file containing data for generating plots.
     - outfilename (str): Output filename prefix for generated files and reports.
@@ -135,6 +257,49 @@ def translonpredictor(
     """
     parameters = getparameters(vars())
 
+    if samplesheet:
+        if not (ann and outfilename and (seq or tran)):
+            raise Exception(
+                "Batch mode needs a sample sheet, an annotation file (.gtf), a file containing FASTA sequences (.fa) or\n \
+                transcript sequences (.fa) and a filename for the files that are written during the process"
+            )
+        samples = readsamplesheet(samplesheet)
+        # find and type the candidate ORFs once for all samples
+        orfs, exon = preparecandidates(
+            seq,
+            tran,
+            ann,
+            starts.split(","),
+            stops.split(","),
+            minlen,
+            maxlen,
+            outfilename,
+            threads,
+            writetranscripts,
+            orfengine,
+        )
+        settings = {
+            "filters": {
+                "mapq": mapq,
+                "flagmask": flagmask,
+                "minlength": minreadlen,
+                "maxlength": maxreadlen,
+            },
+            "countpattern": countpattern,
+            "streaming": streaming,
+            "batchsize": batchsize,
+            "indexdir": indexdir,
+            "offsetsample": offsetsample,
+            "writebedgraph": writebedgraph,
+            "scoretype": scoretype,
+            "sru_range": sru_range,
+            "range_param": range_param,
+            "parameters": parameters,
+        }
+        print("Scoring samples")
+        runbatch(samples, orfs, exon, ann, chromsize, outfilename, settings, threads)
+        return
+
     if bam or chromsize or bedfile:
         if bam and chromsize and ann and outfilename:
             print("Processing BAM file")
@@ -142,20 +307,35 @@ def translonpredictor(
             location = os.getcwd() + "/" + bam
             # if file is provided
             if os.path.isfile(location):
-                # read in bam file
-                df = readbam(location)
-                # calculate asite + converting to BedGraph
                 print("Calculating and applying offsets")
-                beddf, exondf, cdsdf = dftobed(df, ann, offsets)
-                print("Writing bed file")
-                if not os.path.exists(f"{outfilename}.bedGraph"):
+                filters = {
+                    "mapq": mapq,
+                    "flagmask": flagmask,
+                    "minlength": minreadlen,
+                    "maxlength": maxreadlen,
+                }
+                beddf, exondf, cdsdf = bamtobed(
+                    location,
+                    ann,
+                    offsets,
+                    filters,
+                    countpattern,
+                    threads,
+                    streaming,
+                    batchsize,
+                    indexdir,
+                    offsetsample,
+                    outfilename,
+                )
+                if writebedgraph:
+                    print("Writing bed file")
                     beddf.write_csv(
                         f"{outfilename}.bedGraph", separator="\t", include_header=False
                     )
 
-                    # Converting Bedgrapgh to Bigwig format
+                # Writing A-site counts straight to Bigwig format
                 print("Writing bigwig file")
-                bigwig = bedtobigwig(f"{outfilename}.bedGraph", chromsize, outfilename)
+                bigwig = beddftobigwig(beddf, chromsize, outfilename)
 
         elif bedfile and chromsize and outfilename:
             print("Writing bigwig file")
@@ -173,19 +353,32 @@ def translonpredictor(
             )
 
     if seq or tran:
-        if seq and ann and outfilename:
-            print("Extracting transcripts")
-            transcript = gettranscripts(seq, ann, outfilename)
-        elif tran and ann and outfilename:
-            transcript = tran
-        print("Getting candidate ORFs")
-        orfdf = preporfs(
-            transcript, starts.split(","), stops.split(","), minlen, maxlen
-        )
+        # transcript extraction and the ORF scan run at the same time and share one pool of workers
+        with workerpool(threads) as executor:
+            if seq and ann and outfilename:
+                print("Extracting transcripts")
+                transcript = gettranscripts(
+                    seq, ann, outfilename if writetranscripts else None, threads, executor
+                )
+            elif tran and ann and outfilename:
+                transcript = tran
+            print("Getting candidate ORFs")
+            # candidate ORFs are written to disk in batches and typed while they are read back
+            orfdf, transcripts = streamorfs(
+                transcript,
+                starts.split(","),
+                stops.split(","),
+                minlen,
+                maxlen,
+                f"{outfilename}_candidates.parquet",
+                orfengine,
+                threads,
+                executor,
+            )
         if not "cdsdf" in globals():
             cdsdf = 0
-        orf_ann_df, exon_df = orfrelativeposition(ann, orfdf, cdsdf)
-        orfs, exon = saveorfsandexons(orf_ann_df, exon_df, outfilename)
+        orf_ann_df, exon_df = orfrelativeposition(ann, orfdf, cdsdf, transcripts)
+        orfs, exon = saveorfsandexons(orf_ann_df, exon_df, outfilename, transcripts)
 
         if not bigwig:
             bigwig = f"{outfilename}.bw"
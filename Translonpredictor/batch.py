@@ -0,0 +1,253 @@
+"""This script contains functions to score several samples against one shared set of candidate ORFs"""
+
+import multiprocessing
+import traceback
+import polars as pl
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .readfiles import indexbam
+from .fileprocessor import bamtobed, beddftobigwig
+from .coordmap import getcoordmap
+from .getcandidates import gettranscripts, streamorfs, orfrelativeposition, workerpool
+from .filewriter import saveorfsandexons
+from .bigwigtodf import scoring
+from .plotting import plottop10
+
+
+def readsamplesheet(samplesheet):
+    """
+    Reads a sample sheet listing the samples of a batch.
+
+    Parameters:
+    - samplesheet (str): Path to a tab-separated file with a header and the columns:
+      - "sample": Name of the sample, used in the names of its output files.
+      - "bam" or "bigwig": Path to the BAM file or the bigWig file of the sample. A sample
+        needs one of the two.
+      - "offsets" (optional): Path to a file with the offsets of the sample, see `readfiles.readofst`.
+
+    Returns:
+    - list: List of dictionaries, one per sample, with the keys "sample", "bam", "bigwig" and
+      "offsets". Missing values are None.
+
+    Raises:
+    - Exception: If the sample sheet has no "sample" column, a sample name occurs twice or a
+      sample has neither a BAM nor a bigWig file.
+
+    Example:
+        samples = readsamplesheet("samples.tsv")
+    """
+    sheet = pl.read_csv(samplesheet, separator="\t", infer_schema_length=0)
+    if "sample" not in sheet.columns:
+        raise Exception(f"The sample sheet {samplesheet} has no 'sample' column")
+    for column in ["bam", "bigwig", "offsets"]:
+        if column not in sheet.columns:
+            sheet = sheet.with_columns(pl.lit(None, dtype=pl.String).alias(column))
+    if sheet["sample"].is_duplicated().any():
+        raise Exception(f"The sample sheet {samplesheet} lists a sample more than once")
+
+    samples = sheet.select(["sample", "bam", "bigwig", "offsets"]).to_dicts()
+    for sample in samples:
+        if not (sample["bam"] or sample["bigwig"]):
+            raise Exception(f"Sample {sample['sample']} has neither a BAM nor a bigWig file")
+    return samples
+
+
+def preparecandidates(
+    seq,
+    tran,
+    ann,
+    starts,
+    stops,
+    minlen,
+    maxlen,
+    outfilename,
+    threads=1,
+    writetranscripts=False,
+    orfengine="automaton",
+):
+    """
+    Finds and types the candidate ORFs that are shared by all samples of a batch.
+
+    Parameters:
+    - seq (str): Path to the genomic sequence (.fa). Not used if `tran` is provided.
+    - tran (str): Path to the transcript sequences (.fa).
+    - ann (str): Path to the annotation file (.gtf).
+    - starts (list): Start codons.
+    - stops (list): Stop codons.
+    - minlen (int): Minimum ORF length.
+    - maxlen (int): Maximum ORF length.
+    - outfilename (str): Name for the output files.
+    - threads (int): Number of worker processes, shared by the transcript extraction and the ORF scan,
+      see `getcandidates.workerpool`. Default is 1.
+    - writetranscripts (bool): Whether to also write the extracted transcript sequences to
+      '{outfilename}_transcripts.fa'. Default is False.
+    - orfengine (str): Engine used to find the candidate ORFs, see `getcandidates.preporfs`.
+      Default is 'automaton'.
+
+    Returns:
+    - tuple: The paths of the annotated ORFs file and the exons file, see `filewriter.saveorfsandexons`.
+
+    The annotation is parsed, the transcripts are extracted, and the ORFs are enumerated and typed
+    only once for the whole batch, in the same way as for a single sample. The candidate ORFs are
+    streamed to '{outfilename}_candidates.parquet', see `getcandidates.streamorfs`.
+    """
+    with workerpool(threads) as executor:
+        if tran:
+            transcript = tran
+        else:
+            print("Extracting transcripts")
+            transcript = gettranscripts(
+                seq, ann, outfilename if writetranscripts else None, threads, executor
+            )
+        print("Getting candidate ORFs")
+        orfdf, transcripts = streamorfs(
+            transcript,
+            starts,
+            stops,
+            minlen,
+            maxlen,
+            f"{outfilename}_candidates.parquet",
+            orfengine,
+            threads,
+            executor,
+        )
+    orf_ann_df, exon_df = orfrelativeposition(ann, orfdf, 0, transcripts)
+    return saveorfsandexons(orf_ann_df, exon_df, outfilename, transcripts)
+
+
+def scoresample(sample, orfs, exon, ann, chromsize, outfilename, settings):
+    """
+    Scores the shared candidate ORFs with the reads of one sample.
+
+    Parameters:
+    - sample (dict): One sample as returned by `readsamplesheet`.
+    - orfs (str): Path to the annotated ORFs file shared by all samples.
+    - exon (str): Path to the exons file shared by all samples.
+    - ann (str): Path to the annotation file (.gtf).
+    - chromsize (str): Path to the chromosome sizes file, needed for samples with a BAM file.
+    - outfilename (str): Name for the output files of the batch. The output files of the sample
+      are named '{outfilename}_{sample}'.
+    - settings (dict): Settings shared by all samples with the keys "filters", "countpattern",
+      "streaming", "batchsize", "indexdir", "offsetsample", "writebedgraph", "scoretype",
+      "sru_range", "range_param" and "parameters".
+
+    Returns:
+    - str: The path of the scored ORFs file of the sample.
+
+    A BAM file is converted to a bigWig file first with `fileprocessor.bamtobed`, in the same way
+    as for a single sample, estimating the offsets of the sample unless an offsets file is listed
+    for it. This function is run in worker processes by `runbatch`, so every sample is read by a
+    single process.
+    """
+    name = f"{outfilename}_{sample['sample']}"
+    bigwig = sample["bigwig"]
+    if sample["bam"]:
+        if not chromsize:
+            raise Exception(
+                f"Sample {sample['sample']} has a BAM file, which needs a file containing chromosome information"
+            )
+        beddf, exondf, cdsdf = bamtobed(
+            sample["bam"],
+            ann,
+            sample["offsets"],
+            settings["filters"],
+            settings["countpattern"],
+            1,
+            settings["streaming"],
+            settings["batchsize"],
+            settings["indexdir"],
+            settings["offsetsample"],
+            name,
+        )
+        if settings["writebedgraph"]:
+            beddf.write_csv(f"{name}.bedGraph", separator="\t", include_header=False)
+        bigwig = beddftobigwig(beddf, chromsize, name)
+
+    scoredorfs = scoring(
+        bigwig, exon, orfs, settings["scoretype"], settings["sru_range"]
+    )
+    scoredorfs.write_csv(f"{name}_orfs_scored.csv")
+    plottop10(
+        f"{name}_orfs_scored.csv",
+        bigwig,
+        exon,
+        settings["range_param"],
+        name,
+        settings["parameters"],
+    )
+    return f"{name}_orfs_scored.csv"
+
+
+def scoresampleworker(sample, *args):
+    """
+    Runs `scoresample` in a worker process of `runbatch`.
+
+    Parameters:
+    - sample (dict): One sample as returned by `readsamplesheet`.
+    - *args: Further arguments passed to `scoresample`.
+
+    Returns:
+    - str: The path of the scored ORFs file of the sample.
+
+    Raises:
+    - Exception: If scoring the sample fails. Errors are raised again as a plain Exception
+      naming the sample and holding the traceback of the worker, because some errors, such as
+      the panics of oxbow, cannot be sent back from a worker process. KeyboardInterrupt and
+      SystemExit are not caught.
+    """
+    try:
+        return scoresample(sample, *args)
+    except BaseException as e:
+        # the panics of oxbow do not derive from Exception
+        if not isinstance(e, Exception) and type(e).__name__ != "PanicException":
+            raise
+        raise Exception(
+            f"Sample {sample['sample']} failed:\n{traceback.format_exc()}"
+        ) from None
+
+
+def runbatch(samples, orfs, exon, ann, chromsize, outfilename, settings, threads=1):
+    """
+    Scores the shared candidate ORFs with the reads of every sample of a batch.
+
+    Parameters:
+    - samples (list): Samples as returned by `readsamplesheet`.
+    - orfs (str): Path to the annotated ORFs file shared by all samples.
+    - exon (str): Path to the exons file shared by all samples.
+    - ann (str): Path to the annotation file (.gtf).
+    - chromsize (str): Path to the chromosome sizes file.
+    - outfilename (str): Name for the output files of the batch.
+    - settings (dict): Settings shared by all samples, see `scoresample`.
+    - threads (int): Number of samples processed at the same time. Default is 1.
+
+    Returns:
+    - dict: Dictionary containing the path of the scored ORFs file of every sample.
+
+    The coordinate map of the annotation and the index of every BAM file are built before the
+    workers are started, so that every sample loads the same stored map instead of parsing the
+    annotation again and no two workers build an index at the same time. The samples are then
+    processed concurrently with `scoresample` in a process pool.
+
+    Example:
+        orfs, exon = preparecandidates(None, "transcripts.fa", "annotation.gtf", ["ATG"], ["TAA", "TAG", "TGA"], 0, 1000000, "batch")
+        scored = runbatch(readsamplesheet("samples.tsv"), orfs, exon, "annotation.gtf", "chrom.sizes", "batch", settings, threads=4)
+    """
+    if any(sample["bam"] for sample in samples):
+        getcoordmap(ann)
+    for sample in samples:
+        if sample["bam"]:
+            indexbam(sample["bam"], threads, settings["indexdir"])
+
+    scored = {}
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=threads, mp_context=context) as executor:
+        futures = {
+            executor.submit(
+                scoresampleworker, sample, orfs, exon, ann, chromsize, outfilename, settings
+            ): sample["sample"]
+            for sample in samples
+        }
+        for future in as_completed(futures):
+            scored[futures[future]] = future.result()
+            print(f"Scored sample {futures[future]}")
+    return scored
@@ -1,72 +1,63 @@
 """This script contains functions to  and calculate the transcriptomic coordinates"""
 
+import numpy as np
 import polars as pl
 import pyBigWig as bw
 
 from .scoring import sru_score, calculate_scores
+from .transcriptmodels import TranscriptModelStore
+from .readfiles import readorfs
+from .orffinder import transcript_keys, restore_orfs
 
 
-def transcriptreads(bwfile, exon_df):
+def transcriptreads(bwfile, store, tran):
     """
-    Converts a BigWig file to a DataFrame based on provided exon annotation.
+    Reads the counts of one transcript from a BigWig file in transcript coordinates.
 
     Parameters:
-    - bigwig (str): Path to the BigWig file.
-    - exon (str): Path to the exon annotation file.
+    - bwfile (pyBigWig): Opened BigWig file.
+    - store (TranscriptModelStore): Exons of the transcripts, see `transcriptmodels.TranscriptModelStore`.
+    - tran (str): ID of the transcript.
 
     Returns:
-    - df_tran (DataFrame): DataFrame containing transcript information derived from the BigWig file.
-
-    Raises:
-    - Exception: if a BigWig file is not provided.
-
-    This function reads a BigWig file and an exon annotation file. It performs various operations to extract transcript information
-    from the BigWig file based on the exon coordinates. The resulting transcript information is stored in a DataFrame named `df_tran`.
-    The DataFrame includes columns for transcript ID, transcript start and stop coordinates, and counts.
-
-    The function first checks if the given file is a BigWig file. It then reads the exon annotation file and extracts necessary
-    information, such as the chromosome notation. It ensures that the chromosome notation in the BigWig file matches the exon annotation.
-    Then, it iterates over each exon in the annotation file and retrieves intervals from the BigWig file that correspond to the exon
-    coordinates. It calculates the transcript start and stop coordinates for each interval and stores the information in corresponding lists.
-    Finally, it constructs the `df_tran` DataFrame using the extracted transcript information and returns it.
+    - df_tran (DataFrame): DataFrame with the columns 'tran_start', 'tran_stop' and 'counts', one row per
+      interval of the BigWig file. Empty if the transcript has no counts, is on chrM or on a chromosome that is
+      not in the BigWig file.
+
+    This function retrieves the intervals of the BigWig file that overlap every exon of the transcript. The genomic
+    start and stop coordinates of all intervals are then converted to transcript coordinates at once with the exon
+    arrays of the store: the start relative to the start of its exon, and the stop relative to the stop of its exon.
+    Exons with an equal start and stop are skipped.
     """
-    read_list = []
-    if exon_df["chr"][0] == "chrM":
+    tranidx = store.positions[tran]
+    chrom = store.chrom(tranidx)
+    if chrom == "chrM" or chrom not in bwfile.chroms():
         return pl.DataFrame()
-    exon_pairs = zip(exon_df["start"][0], exon_df["stop"][0])
-    transcript_pairs = list(zip(exon_df["tran_start"][0], exon_df["tran_stop"][0]))
-    for idx, exon in enumerate(exon_pairs):
-        if int(exon[0]) == int(exon[1]):
-            continue
 
-        if str(exon_df["chr"][0]) not in bwfile.chroms().keys():
+    exonidx, starts, stops, counts = [], [], [], []
+    for exon in store.exons(tranidx):
+        start, stop = int(store.start[exon]), int(store.stop[exon])
+        if start == stop:
             continue
-        intervals = bwfile.intervals(str(exon_df["chr"][0]), int(exon[0]), int(exon[1]))
+        intervals = bwfile.intervals(chrom, start, stop)
         # Filter out "None" type intervals
-        if intervals is not None:
-            for interval in intervals:
-                # Tran start coordinate
-                diff_start = interval[0] - int(exon[0])
-                transtart = int(transcript_pairs[idx][0]) + diff_start
-                # Tran stop coordinate
-                diff_stop = int(exon[1]) - interval[1]
-                transtop = int(transcript_pairs[idx][1]) - diff_stop
-                # Counts
-                counts = interval[2]
-                # Add info to list
-                dataframe_dict = {
-                    "tran_start": transtart,
-                    "tran_stop": transtop,
-                    "counts": counts,
-                }
-                if dataframe_dict:
-                    read_list.append(dataframe_dict)
-    if read_list:
-        read_df = pl.from_dicts(read_list)
-        return read_df
-    else:
+        if intervals:
+            exonidx.extend([exon] * len(intervals))
+            starts.extend(interval[0] for interval in intervals)
+            stops.extend(interval[1] for interval in intervals)
+            counts.extend(interval[2] for interval in intervals)
+    if not exonidx:
         return pl.DataFrame()
 
+    exonidx = np.array(exonidx, dtype=np.int64)
+    return pl.DataFrame(
+        {
+            "tran_start": store.exontotranscript(exonidx, starts),
+            "tran_stop": store.exontotranscript(exonidx, stops, end=True),
+            "counts": pl.Series(counts, dtype=pl.Float64),
+        }
+    )
+
 
 def oldscoring(df, tran_reads, sru_range, typeorf):
     """
@@ -345,9 +336,14 @@ def scoring(bigwig, exon, orfs, old_scoring, sru_range):
     Returns:
     - DataFrame: A Pandas DataFrame containing scored ORFs with additional metrics.
 
-    This function reads transcript and ORF annotations from provided files,
-    computes scores based on transcript reads obtained from the BigWig file,
-    and optionally applies scoring methods based on the `old_scoring` flag.
+    This function reads transcript and ORF annotations from provided files, the ORFs
+    transcript by transcript with `readfiles.readorfs`, computes scores based on
+    transcript reads obtained from the BigWig file, and optionally applies scoring
+    methods based on the `old_scoring` flag.
+
+    While they are scored, the ORFs carry the integer key of their transcript in the
+    store instead of its ID, see `orffinder.transcript_keys`. The transcript IDs and the
+    string columns are restored in the final DataFrame.
 
     If `old_scoring` is True, the function uses the `oldscoring` function to score ORFs,
     appending the results to `orfscores`. If False, it first checks existing scores
@@ -363,29 +359,24 @@ def scoring(bigwig, exon, orfs, old_scoring, sru_range):
     """
     bwfile = bw.open(bigwig)
     if bwfile.isBigWig():
-        exon_df = pl.read_csv(exon, has_header=True, separator=",")
-        exon_df = exon_df.with_columns(
-            pl.col("start", "stop", "tran_start", "tran_stop").apply(
-                lambda x: x.split(",")
-            )
-        )
-        orf_df = pl.read_csv(orfs, has_header=True, separator=",")
+        store = TranscriptModelStore.fromexonfile(exon)
 
         counter = 0
         orfscores = []
-        for tran in orf_df["tran_id"].unique():
+        for tran, orfs in readorfs(orfs):
             scoredict = {"rise_up": {}, "step_down": {}}
 
             if counter % 1000 == 0:
                 print("\r" + f"{counter} transcripts scored", end="")
 
-            exons = exon_df.filter(pl.col("tran_id") == tran)
-            orfs = orf_df.filter(pl.col("tran_id") == tran)
-
-            if exons.is_empty():
+            if tran not in store:
                 continue
+            orfs = orfs.select(
+                pl.lit(store.positions[tran], dtype=pl.UInt32).alias("tran_key"),
+                pl.all().exclude("tran_id"),
+            )
 
-            tran_reads = transcriptreads(bwfile, exons)
+            tran_reads = transcriptreads(bwfile, store, tran)
             if not tran_reads.is_empty():
                 for typeorf in orfs["type"].unique():
                     orfs_filtered = orfs.filter(pl.col("type") == typeorf)
@@ -409,6 +400,11 @@ def scoring(bigwig, exon, orfs, old_scoring, sru_range):
                         orfscores.append(orfs_filtered)
             counter += 1
         orfscores_df = pl.from_dicts(orfscores).explode(pl.all())
+        if not orfscores_df.is_empty():
+            orfscores_df = restore_orfs(
+                orfscores_df.with_columns(pl.col("tran_key").cast(pl.UInt32)),
+                transcript_keys(store.transcripts),
+            )
         print("\n")
         return orfscores_df
 
@@ -0,0 +1,235 @@
+"""This script contains functions to build, store and load the genome to transcriptome coordinate map"""
+
+import os
+import json
+import shutil
+import numpy as np
+import polars as pl
+
+from .findexonscds import getexons_and_cds, annotationhash, annotationcachepath
+
+# Arrays of the coordinate map, stored as one '.npy' file each
+EXONARRAYS = ["chrcode", "tranidx", "start", "stop", "tran_start", "tran_stop"]
+CDSARRAYS = ["cds_start", "cds_stop"]
+
+
+def buildcoordmap(exon_df, cds_df=None):
+    """
+    Builds the genome to transcriptome coordinate map from exon and CDS annotations.
+
+    Parameters:
+        exon_df (polars.DataFrame): DataFrame containing exon coordinates as returned by
+                                    `getexons_and_cds`, with one row per transcript.
+        cds_df (polars.DataFrame, optional): DataFrame containing CDS transcript coordinates
+                                             as returned by `getexons_and_cds`.
+
+    Returns:
+        dict: A dictionary containing:
+              - "chroms": List of chromosome names, indexed by 'chrcode'.
+              - "transcripts": List of transcript IDs, indexed by 'tranidx'.
+              - "chrcode", "tranidx", "start", "stop", "tran_start", "tran_stop": Integer arrays
+                with one entry per exon, sorted on chromosome and genomic start.
+              - "cds_start", "cds_stop": Integer arrays with the transcript coordinates of the
+                CDS of every transcript, -1 for non-coding transcripts.
+
+    Example:
+        cds_df, exon_df = getexons_and_cds("annotation.gtf")
+        coordmap = buildcoordmap(exon_df, cds_df)
+    """
+    exon_df = exon_df.with_row_index("tranidx")
+    exons = exon_df.explode(["chr", "start", "stop", "tran_start", "tran_stop"])
+    chroms = exons.select("chr").unique(maintain_order=True).with_row_index("chrcode")
+    exons = exons.join(chroms, on="chr", how="left").sort(["chrcode", "start"])
+
+    coordmap = {
+        "chroms": chroms["chr"].to_list(),
+        "transcripts": exon_df["tran_id"].to_list(),
+        "chrcode": exons["chrcode"].cast(pl.Int32).to_numpy(),
+        "tranidx": exons["tranidx"].cast(pl.Int32).to_numpy(),
+    }
+    for column in ["start", "stop", "tran_start", "tran_stop"]:
+        coordmap[column] = exons[column].cast(pl.Int64).to_numpy()
+
+    transcripts = exon_df.select("tran_id")
+    if cds_df is not None:
+        transcripts = transcripts.join(
+            cds_df.unique("tran_id", keep="last"), on="tran_id", how="left"
+        )
+    else:
+        transcripts = transcripts.with_columns(
+            tran_start=pl.lit(None, dtype=pl.Int64),
+            tran_stop=pl.lit(None, dtype=pl.Int64),
+        )
+    coordmap["cds_start"] = transcripts["tran_start"].fill_null(-1).cast(pl.Int64).to_numpy()
+    coordmap["cds_stop"] = transcripts["tran_stop"].fill_null(-1).cast(pl.Int64).to_numpy()
+    return coordmap
+
+
+def savecoordmap(coordmap, path, source=None):
+    """
+    Writes a coordinate map to a directory, with one '.npy' file per array.
+
+    Parameters:
+        coordmap (dict): Coordinate map as returned by `buildcoordmap`.
+        path (str): Directory to write the coordinate map to.
+        source (dict, optional): Description of the annotation the map was built from,
+                                 used by `getcoordmap` to check whether the map is still valid.
+
+    Returns:
+        str: The path of the coordinate map.
+
+    The arrays are written to a temporary directory that is then moved to `path`, so a run
+    that loads the map never memory-maps a partially written file. If another run stored
+    the map first, its map is kept and the temporary directory is removed.
+    """
+    temppath = f"{path}.{os.getpid()}"
+    os.makedirs(temppath, exist_ok=True)
+    for name in EXONARRAYS + CDSARRAYS:
+        np.save(os.path.join(temppath, f"{name}.npy"), coordmap[name])
+    with open(os.path.join(temppath, "names.json"), "w") as fw:
+        json.dump(
+            {
+                "chroms": coordmap["chroms"],
+                "transcripts": coordmap["transcripts"],
+                "source": source,
+            },
+            fw,
+        )
+    try:
+        os.replace(temppath, path)
+    except OSError:
+        if not os.path.isfile(os.path.join(path, "names.json")):
+            raise
+        shutil.rmtree(temppath)
+    return path
+
+
+def loadcoordmap(path):
+    """
+    Loads a coordinate map written by `savecoordmap`, memory-mapping its arrays.
+
+    Parameters:
+        path (str): Directory containing the coordinate map.
+
+    Returns:
+        dict: The coordinate map, see `buildcoordmap`. The integer arrays are read-only
+              memory maps, so pages are only read from disk when they are used and are
+              shared between processes that load the same map.
+    """
+    with open(os.path.join(path, "names.json")) as fr:
+        names = json.load(fr)
+    coordmap = {"chroms": names["chroms"], "transcripts": names["transcripts"]}
+    for name in EXONARRAYS + CDSARRAYS:
+        coordmap[name] = np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+    return coordmap
+
+
+def coordmappath(annotation, cachedir=None):
+    """
+    Determines where the coordinate map of an annotation file is stored.
+
+    Parameters:
+        annotation (str): Path to the annotation file (.gtf).
+        cachedir (str, optional): Directory used when the directory of the annotation file
+                                  is not writable. Default is '~/.cache/Translonpredictor'.
+
+    Returns:
+        str: The 'coordmap' directory in the compiled annotation of the annotation file,
+             'annotation.gtf.<hash>.v<version>.annotation/coordmap', see
+             `findexonscds.annotationcachepath`.
+
+    The coordinate map is kept together with the CDS and exon tables of
+    `findexonscds.loadannotation`, so all cached data of an annotation is keyed on the same hash
+    and cache version.
+    """
+    return os.path.join(annotationcachepath(annotation, cachedir), "coordmap")
+
+
+def getcoordmap(annotation, cachedir=None):
+    """
+    Loads the coordinate map of an annotation file, building and storing it on first use.
+
+    Parameters:
+        annotation (str): Path to the annotation file (.gtf).
+        cachedir (str, optional): Directory used when the directory of the annotation file
+                                  is not writable, see `coordmappath`.
+
+    Returns:
+        dict: The memory-mapped coordinate map, see `buildcoordmap`.
+
+    The map is stored under the hash of the content of the annotation file (see
+    `coordmappath`), so a changed annotation gets a new map and a stored map is never
+    overwritten. Runs on several samples that share an annotation therefore calculate the
+    transcript coordinates only once, from the compiled annotation of
+    `findexonscds.loadannotation`.
+
+    Example:
+        coordmap = getcoordmap("annotation.gtf")
+    """
+    path = coordmappath(annotation, cachedir)
+    if not os.path.isfile(os.path.join(path, "names.json")):
+        cds_df, exon_df = getexons_and_cds(annotation)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        source = {"hash": annotationhash(annotation)}
+        savecoordmap(buildcoordmap(exon_df, cds_df), path, source)
+    return loadcoordmap(path)
+
+
+def coordmapexons(coordmap, chrom=None):
+    """
+    Returns the exons of a coordinate map as a DataFrame with one row per exon.
+
+    Parameters:
+        coordmap (dict): Coordinate map as returned by `buildcoordmap` or `loadcoordmap`.
+        chrom (str, optional): Only return the exons of this chromosome.
+
+    Returns:
+        polars.DataFrame: DataFrame with the columns 'chrcode', 'chr', 'tran_id', 'start', 'stop',
+                          'tran_start' and 'tran_stop', sorted on chromosome and genomic start.
+                          Empty if `chrom` has no exons.
+    """
+    lo, hi = 0, len(coordmap["chrcode"])
+    if chrom is not None:
+        if chrom not in coordmap["chroms"]:
+            lo = hi = 0
+        else:
+            code = coordmap["chroms"].index(chrom)
+            lo, hi = np.searchsorted(coordmap["chrcode"], [code, code + 1])
+
+    chroms = pl.Series("chr", coordmap["chroms"], dtype=pl.String)
+    transcripts = pl.Series("tran_id", coordmap["transcripts"], dtype=pl.String)
+    chrcode = np.asarray(coordmap["chrcode"][lo:hi])
+    tranidx = np.asarray(coordmap["tranidx"][lo:hi])
+    exons = pl.DataFrame(
+        {
+            "chrcode": pl.Series(chrcode, dtype=pl.UInt32),
+            "chr": chroms.gather(chrcode),
+            "tran_id": transcripts.gather(tranidx),
+            "start": np.asarray(coordmap["start"][lo:hi]),
+            "stop": np.asarray(coordmap["stop"][lo:hi]),
+            "tran_start": np.asarray(coordmap["tran_start"][lo:hi]),
+            "tran_stop": np.asarray(coordmap["tran_stop"][lo:hi]),
+        }
+    )
+    return exons
+
+
+def coordmapcds(coordmap):
+    """
+    Returns the CDS transcript coordinates of a coordinate map as a DataFrame.
+
+    Parameters:
+        coordmap (dict): Coordinate map as returned by `buildcoordmap` or `loadcoordmap`.
+
+    Returns:
+        polars.DataFrame: DataFrame with the columns 'tran_id', 'tran_start' and 'tran_stop' for
+                          every coding transcript, as returned by `getexons_and_cds`.
+    """
+    cds_df = pl.DataFrame(
+        {
+            "tran_id": pl.Series(coordmap["transcripts"], dtype=pl.String),
+            "tran_start": np.asarray(coordmap["cds_start"]),
+            "tran_stop": np.asarray(coordmap["cds_stop"]),
+        }
+    ).filter(pl.col("tran_start") >= 0)
+    return cds_df
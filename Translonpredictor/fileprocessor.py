@@ -1,130 +1,159 @@
 """This script contains functions to transform data frames into different file types"""
 
 import polars as pl
-import os
+import numpy as np
+import multiprocessing
+import pyBigWig as bw
+from ncls import NCLS
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .readfiles import (
+    indexbam,
+    bamcontigs,
+    readbamregion,
+    readbam,
+    readbambatches,
+    readofst,
+)
+from .filewriter import saveoffsets
+from .coordmap import (
+    buildcoordmap,
+    getcoordmap,
+    loadcoordmap,
+    coordmappath,
+    coordmapexons,
+    coordmapcds,
+)
+
+# BAM fields needed to calculate A-sites, all other fields are dropped after decoding
+BAMCOLUMNS = ["qname", "rname", "pos", "end"]
+
+# Regular expressions capturing the read count in the read name
+COUNTPATTERNS = {"collapsed": r"_x(\d+)", "none": None}
+
+# Distance between chromosomes when all chromosomes are placed on one integer axis
+CHROMSHIFT = 2**32
+
+# Candidate change points around the CDS start, the number of positions compared on either
+# side of a change point and the offset used for read lengths without reads near a CDS start
+CHANGEPOINTRANGE = (-30, 10)
+CHANGEPOINTWIDTH = 4
+DEFAULTOFFSET = 15
+
+# Number of intervals added to a bigWig file at a time
+BIGWIGCHUNK = 1_000_000
+
+# Approximate size in compressed BAM bytes of the batches read to estimate offsets from a subsample
+OFFSETBATCHSIZE = 2**24
+
+# Minimum number of reads of every read length before `sampleoffsets` stops on stable offsets
+OFFSETMINREADS = 1000
+
+
+def exonindex(coordmap, chrom=None):
+    """
+    Builds an interval index over the exons for looking up the exons that contain a read.
+
+    Parameters:
+    - coordmap (dict): Genome to transcriptome coordinate map, see `coordmap.buildcoordmap`.
+    - chrom (str, optional): Only index the exons of this chromosome.
 
-from .findexonscds import getexons_and_cds
+    Returns:
+    - dict: A dictionary containing:
+            - "exons": The exon DataFrame, one row per exon, see `coordmap.coordmapexons`.
+            - "chroms": DataFrame mapping every chromosome to an integer 'chrcode'.
+            - "ncls": Nested containment list over the exons, with the row numbers of "exons" as ids.
 
+    All chromosomes are placed on one integer axis by shifting the positions of every chromosome
+    by `chrcode * CHROMSHIFT`, so a single NCLS answers the lookups for every chromosome.
 
-def get_bam_tran(bam_df, exon_df):
+    Example:
+        index = exonindex(getcoordmap("annotation.gtf"))
+        bam_tran = bamtranscript(bam_df, None, index)
     """
-    Merge BAM and exon DataFrames based on chromosome alignment and calculate transcript coordinates in BAM.
+    exons = coordmapexons(coordmap, chrom)
+    chroms = exons.select(["chr", "chrcode"]).unique("chr")
+    shift = exons["chrcode"].cast(pl.Int64) * CHROMSHIFT
+    ncls = NCLS(
+        (shift + exons["start"]).to_numpy(),
+        (shift + exons["stop"]).to_numpy() + 1,
+        np.arange(exons.height, dtype=np.int64),
+    )
+    return {"exons": exons, "chroms": chroms, "ncls": ncls}
+
+
+def get_bam_tran(bam_df, index):
+    """
+    Looks up the exons containing every read and calculates transcript coordinates of the reads.
 
     Parameters:
     - bam_df (DataFrame): DataFrame containing BAM file data with chromosome positions.
-    - exon_df (DataFrame): DataFrame containing exon annotations with chromosome positions.
+    - index (dict): Interval index over the exons as returned by `exonindex`.
 
     Returns:
-    - dict: A dictionary where keys are column names and values are lists of corresponding values,
-            representing transcript coordinates aligned with BAM data.
-
-    This function merges `bam_df` and `exon_df` on the 'chr' column and filters rows where the BAM
-    positions fall within exon boundaries (`start_right` to `stop_right`). It then calculates
-    transcript coordinates (`tran_start_bam` and `tran_stop_bam`) in the BAM file by adjusting
-    coordinates relative to exon boundaries.
-
-    The resulting DataFrame (`df_filtered`) excludes redundant columns (`stop_right`, `start_right`,
-    `tran_start`, `tran_stop`) and is converted to a dictionary (`bam_tran_dict`) where each key
-    corresponds to a column name and the associated value is a list of values from `df_filtered`.
-
-    Note: This function assumes the use of a library like `pandas` (abbreviated here as `pl`) for
-    DataFrame operations.
+    - DataFrame: DataFrame with one row for every read and exon that contains it, holding the
+                 columns of `bam_df` plus 'tran_id', 'tran_start_bam' and 'tran_stop_bam'.
+
+    The exons containing a read (`start >= start_right` and `stop <= stop_right`) are found for
+    all reads at once with a containment query on the nested containment list of `exonindex`,
+    which takes O(log exons) per read instead of comparing every read with every exon. The
+    transcript coordinates (`tran_start_bam` and `tran_stop_bam`) are then calculated by adjusting
+    the read positions relative to the exon boundaries.
     """
-    df_joined = bam_df.join(exon_df, on="chr")
-    df_filtered = df_joined.filter(
-        (pl.col("start") >= pl.col("start_right"))
-        & (pl.col("stop") <= pl.col("stop_right"))
+    reads = bam_df.join(index["chroms"], on="chr", how="inner")
+    if reads.is_empty():
+        return pl.DataFrame()
+    shift = reads["chrcode"].cast(pl.Int64) * CHROMSHIFT
+    read_idx, exon_idx = index["ncls"].all_containments_both(
+        (shift + reads["start"]).to_numpy(),
+        (shift + reads["stop"]).to_numpy() + 1,
+        np.arange(reads.height, dtype=np.int64),
+    )
+    if len(read_idx) == 0:
+        return pl.DataFrame()
+
+    exons = (
+        index["exons"][exon_idx]
+        .select(["tran_id", "start", "stop", "tran_start", "tran_stop"])
+        .rename({"start": "start_right", "stop": "stop_right"})
+    )
+    df_filtered = pl.concat(
+        [reads[read_idx].select(pl.all().exclude("chrcode")), exons], how="horizontal"
     )
     df_filtered = df_filtered.with_columns(
         (pl.col("tran_start") + (pl.col("start") - pl.col("start_right"))).alias(
             "tran_start_bam"
-        )
-    )
-
-    df_filtered = df_filtered.with_columns(
+        ),
         (pl.col("tran_stop") - (pl.col("stop_right") - pl.col("stop"))).alias(
             "tran_stop_bam"
-        )
+        ),
     ).select(pl.all().exclude("stop_right", "start_right", "tran_start", "tran_stop"))
-    bam_tran_dict = df_filtered.to_dict(as_series=False)
 
-    return bam_tran_dict
+    return df_filtered
 
 
-def bamtranscript(bam_df, exon_df):
+def bamtranscript(bam_df, exon_df, index=None):
     """
-    Filter BAM and exon DataFrames based on shared chromosome information and flatten exon annotations.
+    Maps reads from genomic to transcriptomic coordinates.
 
     Parameters:
     - bam_df (DataFrame): DataFrame containing BAM file data with chromosome positions.
-    - exon_df (DataFrame): DataFrame containing exon annotations with chromosome positions.
+    - exon_df (DataFrame): DataFrame containing exon annotations with chromosome positions, as
+      returned by `getexons_and_cds`. Not used if `index` is provided.
+    - index (dict, optional): Interval index over the exons as returned by `exonindex`. Built
+      from `exon_df` if not provided; pass it in when mapping several batches of reads.
 
     Returns:
-    - DataFrame: A modified version of `bam_df` and `exon_df` after filtering based on shared
-                 chromosome information and exploding exon coordinates.
-
-    This function processes `bam_df` and `exon_df` to filter rows where chromosome information
-    is shared between the two datasets. First, it identifies unique chromosomes present in both
-    `bam_df` and `exon_df`. Then, it filters `bam_df` to include only rows where the chromosome
-    matches those found in `exon_df`, and vice versa for `exon_df`.
-
-    After filtering, `exon_df` is flattened by exploding columns ['start', 'stop', 'tran_start', 'tran_stop']
-    to separate comma-separated values into individual rows, facilitating further processing.
+    - DataFrame: DataFrame with one row for every read and transcript exon that contains it,
+                 with the transcript coordinates in 'tran_start_bam' and 'tran_stop_bam'.
+                 Empty if no read falls within an exon.
 
-    The modified versions of `bam_df` and `exon_df` are returned for subsequent analysis or operations.
-
-    Note: This function assumes the use of a library like `pandas` (abbreviated here as `pl`) for
-    DataFrame operations.
+    Reads on chromosomes without exons are dropped. Reads and exons are matched over the whole
+    chromosome, so no read is lost at an arbitrary window boundary.
     """
-    exon_flattened = exon_df.with_columns(pl.col("chr"))
-
-    uniquechr_bam = list(bam_df["chr"].unique())
-    uniquechr_exon = list(exon_flattened["chr"].unique())
-
-    bam_df = (
-        bam_df.with_columns(shared=pl.col("chr").is_in(uniquechr_exon))
-        .filter(pl.col("shared") == True)
-        .select(pl.all().exclude("shared"))
-    )
-    exon_flattened = (
-        exon_flattened.with_columns(shared=pl.col("chr").is_in(uniquechr_bam))
-        .filter(pl.col("shared") == True)
-        .select(pl.all().exclude("shared"))
-        .explode(["start", "stop", "tran_start", "tran_stop"])
-    )
-
-    results = []
-    for chr in bam_df["chr"].unique():
-        # Filter exons that overlap with the current bam range
-        bam_with_chr = bam_df.filter(pl.col("chr") == chr)
-        exon_with_chr = exon_flattened.filter(pl.col("chr") == chr)
-        min_val = min(exon_with_chr["start"])
-        max_val = max(exon_with_chr["stop"])
-        for i in range(min_val, max_val, 225000):
-            rng = i + 225000
-            exon_chr = exon_with_chr.filter(
-                (pl.col("start") >= i) & (pl.col("stop") <= rng)
-            )
-            bam_chr = bam_with_chr.filter(
-                (pl.col("start") >= i) & (pl.col("stop") <= rng)
-            )
-            if not exon_chr.is_empty() and not bam_chr.is_empty():
-                result_dict = get_bam_tran(bam_chr, exon_chr)
-                results.append(result_dict)
-
-    bam_df = pl.from_dicts(results)
-    bam_df = bam_df.explode(
-        [
-            "count",
-            "chr",
-            "start",
-            "stop",
-            "length",
-            "tran_id",
-            "tran_start_bam",
-            "tran_stop_bam",
-        ]
-    )
+    if index is None:
+        index = exonindex(buildcoordmap(exon_df))
+    bam_df = get_bam_tran(bam_df, index)
     return bam_df
 
 
@@ -133,62 +162,40 @@ def asitecalc(df, offsets):
     Calculates A-site positions and aggregates counts based on offset values.
 
     Parameters:
-    - df (DataFrame): Input DataFrame containing 'length' and 'pos' columns for A-site calculation.
+    - df (DataFrame or LazyFrame): Input DataFrame containing 'chr', 'start', 'length' and 'count' columns for A-site calculation.
     - offsets (dict): Dictionary containing offset values for each 'length' value.
 
     Returns:
-    - df_bed (DataFrame): DataFrame containing aggregated information of A-site positions, their counts, and chromosome information.
+    - df_bed (DataFrame or LazyFrame): DataFrame containing aggregated information of A-site positions, their counts, and chromosome information.
+      A LazyFrame is returned if `df` is a LazyFrame, so the A-sites can be streamed into the coverage writer.
 
-    This function calculates the A-site positions based on the provided offsets for different 'length' values.
-    It iterates through the input DataFrame 'df' and calculates the A-site positions using the 'pos' column and the corresponding offset value.
-    The calculated A-site positions are stored in a new DataFrame 'df_asite' by concatenating the individual A-site DataFrames.
+    This function turns `offsets` into a table with one row per read length and joins it to `df` on the 'length' column.
+    The A-site positions are calculated for all reads at once by adding the offset to the 'start' column. Reads with a length
+    that has no offset are dropped by the join.
 
-    The function then groups the 'df_asite' DataFrame by chromosome and A-site position, and aggregates the counts of A-site occurrences using the 'agg' function.
-    Subsequently, it creates a new DataFrame 'df_tobed' by adding 1 to the A-site position and sorts the DataFrame based on the chromosome and A-site position.
-    Finally, the function constructs the 'df_bed' DataFrame by selecting the 'chr', 'A-site', 'end', and 'count' columns, and returns it.
+    The function then groups the A-sites by chromosome and A-site position in a single group-by, and sums their counts.
+    Subsequently, it adds 1 to the A-site position to get the 'stop' column and sorts on the chromosome and A-site position.
+    Finally, the function selects the 'chr', 'A-site', 'stop', and 'count' columns, and returns them.
 
+    Example:
+        bed = asitecalc(positions, {28: 12, 29: 12, 30: 13})
     """
-    # GROUP TO CALCULATE A-SITE
-    y = []
-    for value, data in df.group_by("length"):
-        x = (
-            df.filter(pl.col("length") == value)
-            .with_columns((pl.col("start") + offsets[value]).alias("A-site"))
-            .select(
-                pl.all().exclude("start", "stop", "length", "tran_id", "bamcds_start")
-            )
-            .to_dict(as_series=False)
-        )
-        y.append(x)
-    df_asite = pl.from_dicts(y)
-    df_asite = df_asite.explode(["chr", "count", "A-site"])
+    lazy = isinstance(df, pl.LazyFrame)
+    df = df.lazy()
+    offset_df = pl.LazyFrame(
+        {"length": list(offsets.keys()), "offset": list(offsets.values())},
+        schema={"length": df.schema["length"], "offset": pl.Int64},
+    )
     # GROUP ON A-SITE
-    df_asite = df_asite.group_by("chr", "A-site").agg(pl.col("count").sum())
-    df_asite = df_asite.with_columns((pl.col("A-site") + 1).alias("stop"))
-    df_bed = df_asite.sort(["chr", "A-site"]).select(["chr", "A-site", "stop", "count"])
-    return df_bed
-
-
-def calculate_differences(start, start_dict):
-    """
-    Calculate the difference between a given start value and each value in a dictionary of start values.
-
-    Parameters:
-    - start (int or float): The starting value for which differences are calculated.
-    - start_dict (int): A values extracted from a dictionary containing start values (int or float).
-
-    Returns:
-    - dict: A dictionary where keys correspond to identifiers from `start_dict` and values represent
-            the differences between `start` and each corresponding value in `start_dict`.
-
-    This function computes the difference (`start - start_dict[key]`) for each key-value pair in `start_dict`.
-    The result is returned as a dictionary where keys are from `start_dict` and values are the calculated differences.
-
-    Note: This function assumes `start_dict` contains numerical values (integers or floats).
-    """
-    start_diff = start - start_dict
-
-    return start_diff
+    df_bed = (
+        df.join(offset_df, on="length", how="inner")
+        .group_by("chr", (pl.col("start") + pl.col("offset")).alias("A-site"))
+        .agg(pl.col("count").sum())
+        .with_columns((pl.col("A-site") + 1).alias("stop"))
+        .sort(["chr", "A-site"])
+        .select(["chr", "A-site", "stop", "count"])
+    )
+    return df_bed if lazy else df_bed.collect()
 
 
 def bamrelativetocds(bamdf, cdsdf):
@@ -202,52 +209,30 @@ def bamrelativetocds(bamdf, cdsdf):
     Returns:
     - DataFrame: A modified version of `bamdf` after calculating relative start positions relative to CDS.
 
-    This function processes `bamdf` and `cdsdf` to filter rows where transcript IDs are shared between
-    the two datasets. First, it identifies unique transcript IDs present in both `bamdf` and `cdsdf`.
-    Then, it filters `bamdf` to include only rows where the transcript ID matches those found in `cdsdf`,
-    and vice versa for `cdsdf`.
-
-    Next, it creates a dictionary (`start_dict`) mapping each transcript ID to its corresponding start
-    position in `cdsdf`. Using this dictionary, it calculates relative start positions (`bamcds_start`)
-    in `bamdf` by subtracting the start position in `cdsdf` from the start position in `bamdf`.
+    This function joins `bamdf` to the CDS start positions in `cdsdf` on the transcript ID. The
+    inner join keeps only the reads on transcripts that have a CDS. The relative start positions
+    (`bamcds_start`) are then calculated for all reads at once by subtracting the CDS start
+    position from the start position of the read in the transcript, as one expression on the
+    joined columns. If a transcript occurs more than once in `cdsdf`, its last CDS is used.
 
     The modified `bamdf` DataFrame (`bam_df2`) excludes redundant columns (`tran_start_bam`, `tran_stop_bam`)
     and retains only the calculated `bamcds_start` values for each row.
-
-    Note: This function assumes the use of a library like `pandas` (abbreviated here as `pl`) for
-    DataFrame operations, and it depends on a helper function `calculate_differences` to perform
-    numerical calculations.
     """
-    uniquetran_bam = list(bamdf["tran_id"].unique())
-    uniquetran_cds = list(cdsdf["tran_id"].unique())
-
-    bam_df = (
-        bamdf.with_columns(shared=pl.col("tran_id").is_in(uniquetran_cds))
-        .filter(pl.col("shared") == True)
-        .select(pl.all().exclude("shared"))
-    )
     cds_df = (
-        cdsdf.with_columns(shared=pl.col("tran_id").is_in(uniquetran_bam))
-        .filter(pl.col("shared") == True)
-        .select(pl.all().exclude("shared"))
+        cdsdf.select(["tran_id", pl.col("tran_start").alias("cds_start")])
+        .unique("tran_id", keep="last", maintain_order=True)
+        .with_columns(pl.col("tran_id").cast(bamdf.schema["tran_id"]))
     )
 
-    tran_dict = cds_df.to_dict(as_series=False)
-    start_dict = dict(zip(tran_dict["tran_id"], tran_dict["tran_start"]))
-
-    bam_df2 = bam_df.with_columns(
-        [
-            pl.struct(["tran_id", "tran_start_bam"])
-            .apply(
-                lambda x: calculate_differences(
-                    x["tran_start_bam"], start_dict[x["tran_id"]]
-                )
-            )
-            .alias("bamcds_start")
-        ]
+    bam_df2 = bamdf.join(cds_df, on="tran_id", how="inner").with_columns(
+        (pl.col("tran_start_bam") - pl.col("cds_start"))
+        .cast(pl.Int64)
+        .alias("bamcds_start")
     )
 
-    bam_df2 = bam_df2.select(pl.all().exclude("tran_start_bam", "tran_stop_bam"))
+    bam_df2 = bam_df2.select(
+        pl.all().exclude("tran_start_bam", "tran_stop_bam", "cds_start")
+    )
     return bam_df2
 
 
@@ -258,64 +243,102 @@ def change_point_analysis(offset_df):
     offset to apply to get a-site
 
     Inputs:
-        read_counts: Dictionary containing the read counts for each position
-        surrounding_range: tuple of start and stop for change point analysis
+        offset_df: DataFrame containing the read counts ('count') for each read length ('length')
+                   and read start position relative to the CDS start ('bamcds_start')
 
     Outputs:
-        max_shift_position: The position of the change point
-    """
-    max_shift = 0
-    max_shift_position = None
-    offset_dict = {}
-    for length in offset_df["length"].unique():
-        offset_df_len = offset_df.filter(pl.col("length") == length).sort(
-            "bamcds_start"
-        )
-        for i in range(-30, 11):
-            left = []
-            for j in range(i - 3, i + 1):
-                left_df = offset_df_len.filter(pl.col("bamcds_start") == j)
-                if not left_df.is_empty():
-                    left.append(left_df["count"][0])
-                else:
-                    left.append(0)
-            right = []
-            for j in range(i + 1, i + 5):
-                right_df = offset_df_len.filter(pl.col("bamcds_start") == j)
-                if not right_df.is_empty():
-                    right.append(right_df["count"][0])
-                else:
-                    right.append(0)
-
-        mean_left = sum(left) / 4
-        mean_right = sum(right) / 4
-        shift = abs(mean_right - mean_left)
-        if shift > max_shift:
-            max_shift = shift
-            max_shift_position = i
-        if max_shift_position == None:
-            offset_dict[length] = 15
-        else:
-            offset_dict[length] = max_shift_position
+        offset_dict: Dictionary containing the A-site offset for each read length
+
+    The counts are arranged once into a matrix with one row per read length and one column per
+    position around the CDS start. For every candidate change point i in CHANGEPOINTRANGE, the
+    mean count of the CHANGEPOINTWIDTH positions up to i is compared with the mean count of the
+    CHANGEPOINTWIDTH positions after i, for all lengths at once using cumulative sums. The change
+    point of a length is the i with the largest absolute difference. Reads starting at i + 1 are
+    the first to carry the start codon in their P-site, so the A-site offset is 3 - (i + 1).
+    Lengths without any reads around the CDS start get the offset DEFAULTOFFSET.
+    """
+    first, last = CHANGEPOINTRANGE
+    lo = first - CHANGEPOINTWIDTH + 1
+    hi = last + CHANGEPOINTWIDTH
+    lengths = offset_df["length"].unique().sort()
+    window = offset_df.filter(pl.col("bamcds_start").is_between(lo, hi)).join(
+        lengths.to_frame().with_row_index("row"), on="length", how="inner"
+    )
+
+    # length x position metagene matrix
+    metagene = np.zeros((len(lengths), hi - lo + 1), dtype=np.float64)
+    np.add.at(
+        metagene,
+        (window["row"].to_numpy(), (window["bamcds_start"] - lo).to_numpy()),
+        window["count"].to_numpy(),
+    )
+    cumulative = np.concatenate(
+        [np.zeros((len(lengths), 1)), np.cumsum(metagene, axis=1)], axis=1
+    )
+
+    changepoints = np.arange(first, last + 1)
+    end = changepoints - lo + 1
+    left = cumulative[:, end] - cumulative[:, end - CHANGEPOINTWIDTH]
+    right = cumulative[:, end + CHANGEPOINTWIDTH] - cumulative[:, end]
+    shift = np.abs(right - left) / CHANGEPOINTWIDTH
+
+    best = changepoints[np.argmax(shift, axis=1)]
+    offsets = np.where(shift.max(axis=1, initial=0) > 0, 2 - best, DEFAULTOFFSET)
+    offset_dict = dict(zip(lengths.to_list(), offsets.tolist()))
     return offset_dict
 
 
-def dftobed(df, annotation, offsets):
+def readcounts(countpattern="collapsed"):
     """
-    Converts a DataFrame to BED format with A-site calculation and offset values.
+    Builds an expression that extracts the number of reads each BAM record represents.
 
     Parameters:
-    - df (DataFrame): Input DataFrame to be converted to BED format.
+    - countpattern (str): Either a key of COUNTPATTERNS or a regular expression with one capture
+      group matching the count in the read name. Default is "collapsed".
+      - "collapsed": Collapsed reads named like 'read1_x15'.
+      - "none": Reads are not collapsed, every record counts once.
+      - A custom regular expression, e.g. r"_umicount=(\\d+)" for UMI-deduplicated reads.
 
     Returns:
-    - bed (DataFrame): DataFrame representing the BED format data with A-site positions and aggregated counts.
+    - Expr: A polars expression producing the Int64 'count' column from the 'qname' column.
+
+    The count is extracted with native string expressions, so no Python function is called per
+    read. Records whose name does not match the pattern count once.
+
+    Example:
+        df = df.with_columns(readcounts("collapsed"))
+    """
+    pattern = COUNTPATTERNS.get(countpattern, countpattern)
+    if pattern is None:
+        return pl.lit(1, dtype=pl.Int64).alias("count")
+    return (
+        pl.col("qname")
+        .str.extract(pattern, 1)
+        .cast(pl.Int64)
+        .fill_null(1)
+        .alias("count")
+    )
 
-    This function takes an input DataFrame 'df' and performs the following operations:
-    1. Creates a new DataFrame 'df_filtered' by calculating the length using the 'end' and 'pos' columns and excluding the 'end' column from the selection.
-    2. Splits the 'qname' column values specifically on "_x", applies a split function to extract the integer value, renames the columns to 'count' and 'chr', and stores the results in a new DataFrame 'df_namesplit'.
-    3. Obtains the length values from the 'df_namesplit' DataFrame and creates offsets dictionary with a hardcoded offset value of 15 for each length value.
-    4. Calls the 'asitecalc' function to calculate A-site positions using the 'df_namesplit' DataFrame and the generated offsets, and stores the resulting BED format data in the 'bed' DataFrame.
 
+def bamtocds(df, exon_df, cds_df, countpattern="collapsed", index=None):
+    """
+    Converts BAM records to reads with transcriptomic positions relative to the CDS start.
+
+    Parameters:
+    - df (DataFrame): DataFrame containing BAM records as returned by `readbam`.
+    - exon_df (DataFrame): DataFrame containing exon annotations with transcript coordinates.
+    - cds_df (DataFrame): DataFrame containing CDS annotations with transcript coordinates.
+    - countpattern (str): Pattern for the read count in the read name, see `readcounts`.
+    - index (dict, optional): Interval index over the exons as returned by `exonindex`.
+
+    Returns:
+    - DataFrame: DataFrame containing the 'count', 'chr', 'start', 'stop', 'length', 'tran_id'
+      and 'bamcds_start' columns for every read that maps to a coding transcript.
+
+    This function performs the following operations:
+    1. Calculates the read length using the 'end' and 'pos' columns and excludes the unused BAM fields.
+    2. Extracts the read count from the 'qname' column using `readcounts` and renames the columns to 'count', 'chr', 'start' and 'stop'.
+    3. Calculates transcriptomic coordinates using `bamtranscript` and positions relative to the CDS start using `bamrelativetocds`.
     """
     df_filtered = df.with_columns(
         (pl.col("end") - pl.col("pos")).alias("length")
@@ -325,34 +348,550 @@ def dftobed(df, annotation, offsets):
         )
     )
 
-    # split specifically on _x -> implement more!!!
-    split_func = lambda s: int(s.split("_x")[1])
     df_namesplit = (
-        df_filtered.with_columns(pl.col("qname").apply(split_func))
-        .rename({"qname": "count", "rname": "chr", "pos": "start", "end": "stop"})
+        df_filtered.with_columns(readcounts(countpattern))
+        .select(pl.all().exclude("qname"))
+        .rename({"rname": "chr", "pos": "start", "end": "stop"})
         .cast({"chr": pl.String})
     )
 
-    cds_df, exon_df = getexons_and_cds(annotation)
     # calculate transcriptomic coordinates
-    bam_tran = bamtranscript(df_namesplit, exon_df)
+    bam_tran = bamtranscript(df_namesplit, exon_df, index)
+    if bam_tran.is_empty():
+        return bam_tran
     # Calculate position relative to cds
     bam_to_cds = bamrelativetocds(bam_tran, cds_df)
+    return bam_to_cds
+
+
+def mergecounts(dfs, keys):
+    """
+    Merges partial count tables by summing the counts of identical keys.
+
+    Parameters:
+    - dfs (list): List of DataFrames containing the key columns and a 'count' column.
+    - keys (list): Column names that identify a row of the count table.
+
+    Returns:
+    - DataFrame: A single DataFrame containing the summed 'count' for every key.
+    """
+    return (
+        pl.concat(dfs, how="vertical_relaxed")
+        .group_by(keys)
+        .agg(pl.col("count").sum())
+    )
+
+
+def countbam(df, exon_df, cds_df, countpattern="collapsed", index=None):
+    """
+    Reduces BAM records to the count tables needed for offset estimation and A-site calculation.
+
+    Parameters:
+    - df (DataFrame): DataFrame containing BAM records as returned by `readbam`.
+    - exon_df (DataFrame): DataFrame containing exon annotations with transcript coordinates.
+    - cds_df (DataFrame): DataFrame containing CDS annotations with transcript coordinates.
+    - countpattern (str): Pattern for the read count in the read name, see `readcounts`.
+    - index (dict, optional): Interval index over the exons as returned by `exonindex`.
+
+    Returns:
+    - tuple: A tuple containing two DataFrames, or None if no read maps to a coding transcript:
+             - Counts keyed on 'chr', 'start' and 'length', used by `asitecalc`.
+             - Counts keyed on 'bamcds_start' and 'length', used by `change_point_analysis`.
+    """
+    bam_to_cds = bamtocds(df, exon_df, cds_df, countpattern, index)
+    if bam_to_cds.is_empty():
+        return None
+    positions = bam_to_cds.group_by("chr", "start", "length").agg(
+        pl.col("count").sum()
+    )
+    offset_counts = bam_to_cds.group_by("bamcds_start", "length").agg(
+        pl.col("count").sum()
+    )
+    return positions, offset_counts
+
+
+def countcontig(
+    bampath, contig, mappath, filters=None, index=None, countpattern="collapsed"
+):
+    """
+    Reads one reference sequence of an indexed BAM file and reduces it with `countbam`.
+
+    Parameters:
+    - bampath (str): Path to the indexed BAM file.
+    - contig (str): Name of the reference sequence to process.
+    - mappath (str): Path to the stored coordinate map of the annotation, see `coordmap.getcoordmap`.
+    - filters (dict, optional): Filters applied while reading, see `readfiles.readrecords`.
+    - index (str, optional): Path to the index if it is not stored next to the BAM file.
+    - countpattern (str): Pattern for the read count in the read name, see `readcounts`.
+
+    Returns:
+    - tuple: The count tables returned by `countbam`, or None if the contig has no mapped reads
+             on coding transcripts.
+
+    This function is run in worker processes by `paralleltobed`. The coordinate map is
+    memory-mapped, so only the exons of `contig` are read from it.
+    """
+    coordmap = loadcoordmap(mappath)
+    exon_index = exonindex(coordmap, contig)
+    if exon_index["exons"].is_empty():
+        return None
+    cds_df = coordmapcds(coordmap)
+    df = readbamregion(bampath, contig, BAMCOLUMNS, filters, index)
+    return countbam(df, None, cds_df, countpattern, exon_index)
+
+
+def countstobed(positions, offset_counts, offsets, outfilename=None):
+    """
+    Merges partial count tables and converts them to BED format.
+
+    Parameters:
+    - positions (list): Partial count tables keyed on 'chr', 'start' and 'length'.
+    - offset_counts (list): Partial count tables keyed on 'bamcds_start' and 'length'.
+    - offsets (dict): Dictionary containing offset values for each read length. If not
+      provided, offsets are estimated from `offset_counts` using `change_point_analysis`.
+      Read lengths without an offset get DEFAULTOFFSET.
+    - outfilename (str, optional): Name for the output files. Estimated offsets are written to
+      '{outfilename}_offsets.tsv' with `filewriter.saveoffsets`, so that they can be passed
+      to `--offsets` on later runs.
+
+    Returns:
+    - DataFrame: DataFrame representing the BED format data with A-site positions and aggregated counts.
+
+    Raises:
+    - Exception: If no partial count tables are provided.
+    """
+    if not positions:
+        raise Exception("No reads in the BAM file map to annotated coding transcripts")
+    bam_positions = mergecounts(positions, ["chr", "start", "length"])
     if not offsets:
-        bam_offsets = bam_to_cds.group_by("bamcds_start", "length").agg(
-            pl.col("count").sum()
-        )
+        bam_offsets = mergecounts(offset_counts, ["bamcds_start", "length"])
         # offset dictionary
         offsets = change_point_analysis(bam_offsets)
+        if outfilename:
+            saveoffsets(offsets, outfilename)
+    # lengths missing from loaded or subsampled offsets get the default offset
+    offsets = {
+        **dict.fromkeys(bam_positions["length"].unique().to_list(), DEFAULTOFFSET),
+        **offsets,
+    }
     # A site calculation
-    bed = asitecalc(bam_to_cds, offsets)
+    bed = asitecalc(bam_positions, offsets)
+    return bed
+
+
+def sampleoffsets(
+    batches,
+    annotation,
+    samplesize,
+    countpattern="collapsed",
+    stableafter=2,
+    minreads=OFFSETMINREADS,
+    outfilename=None,
+):
+    """
+    Estimates offsets from a bounded subsample of the reads near annotated CDS starts.
+
+    Parameters:
+    - batches (iterable): Iterable of DataFrames containing BAM records, e.g. from `readbambatches`.
+    - annotation (str): Path to the annotation file (.gtf).
+    - samplesize (int): Maximum number of reads of every read length used for the estimation.
+    - countpattern (str): Pattern for the read count in the read name, see `readcounts`.
+    - stableafter (int): Number of consecutive batches after which unchanged offsets are
+      considered stable. Default is 2.
+    - minreads (int): Minimum number of reads of every read length before stable offsets end
+      the sampling. Default is OFFSETMINREADS, or `samplesize` if that is smaller.
+    - outfilename (str, optional): Name for the output files. The offsets are written to
+      '{outfilename}_offsets.tsv' with `filewriter.saveoffsets`.
+
+    Returns:
+    - dict: Dictionary containing offset values for each read length, see `change_point_analysis`.
+
+    Raises:
+    - Exception: If no read maps to the region around an annotated CDS start.
+
+    The batches are mapped to the CDS one at a time, and only reads starting within the window
+    scored by `change_point_analysis` are kept. Of every read length only the first `samplesize`
+    reads in file order are counted, so the subsample is the same on every run. After every
+    batch the offsets are estimated from the counts collected so far. Reading stops as soon as
+    every read length has reached `samplesize` reads, or the offsets have not changed for
+    `stableafter` batches and every read length has at least `minreads` reads, so a few
+    batches with a handful of reads do not fix noisy offsets. The remaining batches are never
+    read, and the full pass over the BAM file then only applies the offsets.
+
+    Example:
+        offsets = sampleoffsets(readbambatches("sample.bam", OFFSETBATCHSIZE), "annotation.gtf", 100000)
+    """
+    coordmap = getcoordmap(annotation)
+    index = exonindex(coordmap)
+    cds_df = coordmapcds(coordmap)
+    first, last = CHANGEPOINTRANGE
+    lo = first - CHANGEPOINTWIDTH + 1
+    hi = last + CHANGEPOINTWIDTH
+
+    sampled = pl.DataFrame(schema={"length": pl.Int64, "sampled": pl.Int64})
+    offset_counts = []
+    offsets = None
+    unchanged = 0
+    minreads = min(minreads, samplesize)
+    for df in batches:
+        bam_to_cds = bamtocds(df, None, cds_df, countpattern, index)
+        if bam_to_cds.is_empty():
+            continue
+        window = (
+            bam_to_cds.filter(pl.col("bamcds_start").is_between(lo, hi))
+            .select(["bamcds_start", pl.col("length").cast(pl.Int64), "count"])
+            .join(sampled, on="length", how="left")
+            .with_columns(
+                previous=pl.col("sampled").fill_null(0)
+                + pl.col("count").cum_sum().over("length")
+                - pl.col("count")
+            )
+            .filter(pl.col("previous") < samplesize)
+            .with_columns(
+                pl.min_horizontal(pl.col("count"), samplesize - pl.col("previous"))
+            )
+        )
+        if window.is_empty():
+            continue
+        offset_counts = [
+            mergecounts(
+                offset_counts + [window.select(["bamcds_start", "length", "count"])],
+                ["bamcds_start", "length"],
+            )
+        ]
+        sampled = offset_counts[0].group_by("length").agg(
+            pl.col("count").sum().alias("sampled")
+        )
+
+        estimate = change_point_analysis(offset_counts[0])
+        unchanged = unchanged + 1 if estimate == offsets else 0
+        offsets = estimate
+        stable = unchanged >= stableafter and (sampled["sampled"] >= minreads).all()
+        if stable or (sampled["sampled"] >= samplesize).all():
+            break
+
+    if offsets is None:
+        raise Exception("No reads in the BAM file map near annotated CDS starts")
+    if outfilename:
+        saveoffsets(offsets, outfilename)
+    return offsets
+
+
+def streamtobed(
+    batches,
+    annotation,
+    offsets,
+    countpattern="collapsed",
+    mergeevery=16,
+    outfilename=None,
+):
+    """
+    Converts batches of BAM records to BED format with A-site calculation and offset values.
 
+    Parameters:
+    - batches (iterable): Iterable of DataFrames containing BAM records, e.g. from `readbambatches`.
+    - annotation (str): Path to the annotation file (.gtf).
+    - offsets (dict): Dictionary containing offset values for each read length. If not
+      provided, offsets are estimated from the reads using `change_point_analysis`.
+    - countpattern (str): Pattern for the read count in the read name, see `readcounts`.
+    - mergeevery (int): Number of partial count tables that are collected before they
+      are merged into one. Default is 16.
+    - outfilename (str, optional): Name for the output files, see `countstobed`.
+
+    Returns:
+    - tuple: A tuple containing the BED format DataFrame, the exon DataFrame with one row per
+      exon and the CDS DataFrame.
+
+    The exons and CDS are taken from the stored coordinate map of the annotation (see
+    `coordmap.getcoordmap`), which is only built on the first run with an annotation. Every batch is mapped to the transcriptome and reduced to two count tables with `countbam`:
+    one keyed on the genomic read position and read length, which is all `asitecalc` needs, and
+    one keyed on the position relative to the CDS start and read length, which is all
+    `change_point_analysis` needs. The partial tables are merged as batches come in, so memory
+    depends on the batch size and the number of covered positions rather than on the number
+    of reads in the library.
+    """
+    coordmap = getcoordmap(annotation)
+    index = exonindex(coordmap)
+    exon_df = index["exons"]
+    cds_df = coordmapcds(coordmap)
+
+    positions = []
+    offset_counts = []
+    for df in batches:
+        counts = countbam(df, None, cds_df, countpattern, index)
+        if counts is None:
+            continue
+        positions.append(counts[0])
+        offset_counts.append(counts[1])
+        if len(positions) >= mergeevery:
+            positions = [mergecounts(positions, ["chr", "start", "length"])]
+            offset_counts = [mergecounts(offset_counts, ["bamcds_start", "length"])]
+
+    bed = countstobed(positions, offset_counts, offsets, outfilename)
     return bed, exon_df, cds_df
 
 
+def paralleltobed(
+    bampath,
+    annotation,
+    offsets,
+    threads,
+    filters=None,
+    index=None,
+    countpattern="collapsed",
+    mergeevery=16,
+    outfilename=None,
+):
+    """
+    Converts an indexed BAM file to BED format, processing every reference sequence in a separate worker.
+
+    Parameters:
+    - bampath (str): Path to the BAM file.
+    - annotation (str): Path to the annotation file (.gtf).
+    - offsets (dict): Dictionary containing offset values for each read length. If not
+      provided, offsets are estimated from the reads using `change_point_analysis`.
+    - threads (int): Number of worker processes.
+    - filters (dict, optional): Filters applied while reading, see `readfiles.readrecords`.
+    - index (str, optional): Path to the index of the BAM file. Created with `readfiles.indexbam`
+      if not provided.
+    - countpattern (str): Pattern for the read count in the read name, see `readcounts`.
+    - mergeevery (int): Number of partial count tables that are collected before they
+      are merged into one. Default is 16.
+    - outfilename (str, optional): Name for the output files, see `countstobed`.
+
+    Returns:
+    - tuple: A tuple containing the BED format DataFrame, the exon DataFrame with one row per
+      exon and the CDS DataFrame.
+
+    The coordinate map of the annotation is loaded or built once in the main process (see
+    `coordmap.getcoordmap`). Every reference sequence with mapped reads is then decoded,
+    mapped to the transcriptome and reduced to partial count tables by `countcontig` in a
+    process pool, with each worker memory-mapping the stored coordinate map. The partial tables are merged as the workers finish. Workers are
+    started with the 'spawn' method, as forking a process that already runs polars threads
+    can deadlock.
+    """
+    if index is None:
+        index = indexbam(bampath, threads)
+    coordmap = getcoordmap(annotation)
+    mappath = coordmappath(annotation)
+    contigs = [chrom for chrom in bamcontigs(bampath, index) if chrom in coordmap["chroms"]]
+
+    positions = []
+    offset_counts = []
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=threads, mp_context=context) as executor:
+        futures = []
+        for contig in contigs:
+            futures.append(
+                executor.submit(
+                    countcontig,
+                    bampath,
+                    contig,
+                    mappath,
+                    filters,
+                    index,
+                    countpattern,
+                )
+            )
+        for future in as_completed(futures):
+            counts = future.result()
+            if counts is None:
+                continue
+            positions.append(counts[0])
+            offset_counts.append(counts[1])
+            if len(positions) >= mergeevery:
+                positions = [mergecounts(positions, ["chr", "start", "length"])]
+                offset_counts = [
+                    mergecounts(offset_counts, ["bamcds_start", "length"])
+                ]
+
+    bed = countstobed(positions, offset_counts, offsets, outfilename)
+    return bed, coordmapexons(coordmap), coordmapcds(coordmap)
+
+
+def dftobed(df, annotation, offsets, countpattern="collapsed", outfilename=None):
+    """
+    Converts a DataFrame to BED format with A-site calculation and offset values.
+
+    Parameters:
+    - df (DataFrame): Input DataFrame to be converted to BED format.
+    - annotation (str): Path to the annotation file (.gtf).
+    - offsets (dict): Dictionary containing offset values for each read length.
+    - countpattern (str): Pattern for the read count in the read name, see `readcounts`.
+    - outfilename (str, optional): Name for the output files, see `countstobed`.
+
+    Returns:
+    - tuple: A tuple containing the BED format DataFrame with A-site positions and aggregated
+      counts, the exon DataFrame and the CDS DataFrame.
+
+    This function processes the whole DataFrame as a single batch using `streamtobed`.
+    """
+    return streamtobed([df], annotation, offsets, countpattern, outfilename=outfilename)
+
+
+def bamtobed(
+    bampath,
+    annotation,
+    offsets=None,
+    filters=None,
+    countpattern="collapsed",
+    threads=1,
+    streaming=False,
+    batchsize=None,
+    indexdir=None,
+    offsetsample=None,
+    outfilename=None,
+):
+    """
+    Converts a BAM file to BED format, reading it in the way selected by the options.
+
+    Parameters:
+    - bampath (str): Path to the BAM file.
+    - annotation (str): Path to the annotation file (.gtf).
+    - offsets (str, optional): Path to a file with the offset of every read length, see
+      `readfiles.readofst`. If not provided, the offsets are estimated from the reads.
+    - filters (dict, optional): Filters applied while reading, see `readfiles.readrecords`.
+    - countpattern (str): Pattern for the read count in the read name, see `readcounts`.
+    - threads (int): Number of worker processes, see `paralleltobed`. Default is 1.
+    - streaming (bool): Read the BAM file in batches with `streamtobed`. Default is False.
+    - batchsize (int, optional): Approximate size of a batch in compressed BAM bytes, see
+      `readfiles.readbambatches`.
+    - indexdir (str, optional): Directory for the BAM index, see `readfiles.indexbam`.
+    - offsetsample (int, optional): Maximum number of reads per read length used to estimate the
+      offsets, see `sampleoffsets`.
+    - outfilename (str, optional): Name for the output files, see `countstobed`.
+
+    Returns:
+    - tuple: A tuple containing the BED format DataFrame, the exon DataFrame and the CDS DataFrame.
+
+    Raises:
+    - Exception: If `streaming` is combined with more than one thread.
+
+    The BAM file is indexed first (see `readfiles.indexbam`). The offsets are read from a file,
+    estimated from a subsample with `sampleoffsets`, or estimated from all reads. The reads are
+    then converted by reference sequence in a process pool with `paralleltobed`, batch by batch
+    with `streamtobed`, or all at once with `dftobed`.
+
+    Example:
+        beddf, exondf, cdsdf = bamtobed("sample.bam", "annotation.gtf", threads=4, outfilename="sample")
+    """
+    if threads > 1 and streaming:
+        # the workers read one reference sequence each and cannot split it into batches
+        raise Exception(
+            "Streaming reads the BAM file in a single process, use either --streaming or --threads"
+        )
+    # reuse a fresh index or build one
+    index = indexbam(bampath, threads, indexdir)
+    if offsets:
+        # skip estimation, use the offsets of an earlier run
+        offsets = readofst(offsets)
+    elif offsetsample:
+        # estimate offsets from the first batches only
+        samplebatches = readbambatches(
+            bampath, batchsize or OFFSETBATCHSIZE, BAMCOLUMNS, filters, index
+        )
+        offsets = sampleoffsets(
+            samplebatches, annotation, offsetsample, countpattern, outfilename=outfilename
+        )
+    if threads > 1:
+        # process every reference sequence in a separate worker
+        return paralleltobed(
+            bampath,
+            annotation,
+            offsets,
+            threads,
+            filters,
+            index,
+            countpattern,
+            outfilename=outfilename,
+        )
+    if streaming:
+        # read in bam file batch by batch
+        batches = readbambatches(bampath, batchsize, BAMCOLUMNS, filters, index)
+        return streamtobed(batches, annotation, offsets, countpattern, outfilename=outfilename)
+    # read in bam file
+    df = readbam(bampath, BAMCOLUMNS, filters, threads, indexdir)
+    return dftobed(df, annotation, offsets, countpattern, outfilename)
+
+
+def readchromsizes(chromsize):
+    """
+    Reads a chromosome sizes file.
+
+    Parameters:
+        chromsize (str): The path to the chromosome sizes file, with the chromosome name and
+                         size on every line separated by a tab.
+
+    Returns:
+        dict: Dictionary containing the size of every chromosome.
+    """
+    sizes = pl.read_csv(
+        chromsize,
+        separator="\t",
+        has_header=False,
+        new_columns=["chr", "size"],
+        dtypes={"chr": pl.String, "size": pl.Int64},
+        columns=[0, 1],
+    )
+    return dict(zip(sizes["chr"].to_list(), sizes["size"].to_list()))
+
+
+def beddftobigwig(bed, chromsize, filename, chunksize=BIGWIGCHUNK):
+    """
+    Writes A-site counts straight to a bigWig file using pyBigWig.
+
+    Parameters:
+        bed (DataFrame or LazyFrame): DataFrame in BED format with the columns 'chr', 'A-site',
+                                      'stop' and 'count', as returned by `asitecalc`.
+        chromsize (str): The path to the chromosome sizes file.
+        filename (str): The name for the generated file.
+        chunksize (int): Number of intervals added to the bigWig file at a time. Default is BIGWIGCHUNK.
+
+    Returns:
+        str: The path of the bigWig file, 'filename.bw'.
+
+    Raises:
+        Exception: If the counts contain a chromosome that is not in the chromosome sizes file.
+
+    The header lists the chromosomes with counts in sorted order, and the intervals are sorted on
+    chromosome and position and added with `addEntries` in chunks of `chunksize`, so no text
+    bedGraph is written or parsed. Intervals that fall outside a chromosome are skipped.
+
+    Example:
+        beddftobigwig(bed, "chromsizes.txt", "filename")
+    """
+    sizes = readchromsizes(chromsize)
+    bed = bed.lazy().sort(["chr", "A-site"]).collect()
+    chroms = bed["chr"].unique().sort().to_list()
+    missing = [chrom for chrom in chroms if chrom not in sizes]
+    if missing:
+        raise Exception(
+            f"Chromosomes {', '.join(missing)} are not in the chromosome sizes file {chromsize}"
+        )
+    bed = bed.join(
+        pl.DataFrame({"chr": chroms, "size": [sizes[chrom] for chrom in chroms]}),
+        on="chr",
+        how="left",
+    ).filter((pl.col("A-site") >= 0) & (pl.col("stop") <= pl.col("size")))
+
+    bigwig = bw.open(f"{filename}.bw", "w")
+    try:
+        bigwig.addHeader([(chrom, sizes[chrom]) for chrom in chroms])
+        for chunk in bed.iter_slices(chunksize):
+            bigwig.addEntries(
+                chunk["chr"].to_list(),
+                chunk["A-site"].to_list(),
+                ends=chunk["stop"].to_list(),
+                values=chunk["count"].cast(pl.Float64).to_list(),
+            )
+    finally:
+        bigwig.close()
+    return f"{filename}.bw"
+
+
 def bedtobigwig(bedfile, chromsize, filename):
     """
-    Converts a bedGraph file to a bigWig file using the bedGraphToBigWig utility.
+    Converts a bedGraph file to a bigWig file using `beddftobigwig`.
 
     Parameters:
         bedfile (str): The path to the input bedGraph file.
@@ -360,15 +899,19 @@ def bedtobigwig(bedfile, chromsize, filename):
         filename (str): The name for the generated file.
 
     Returns:
-        None
+        str: The path of the bigWig file, 'filename.bw'.
 
     Notes:
-        - The output bigWig file will be named 'filename.bw' and will be created in the same directory as the input file.
-        - Requires the bedGraphToBigWig utility to be installed and accessible in the system path.
+        - The output bigWig file will be named 'filename.bw'.
 
     Example:
         bedtobigwig("input.bedGraph", "chromsizes.txt", "filename")
     """
-    os.system(f"bedGraphToBigWig {bedfile} {chromsize} {filename}.bw")
-
-    return ""
+    bed = pl.scan_csv(
+        bedfile,
+        separator="\t",
+        has_header=False,
+        new_columns=["chr", "A-site", "stop", "count"],
+        dtypes={"chr": pl.String, "A-site": pl.Int64, "stop": pl.Int64, "count": pl.Float64},
+    )
+    return beddftobigwig(bed, chromsize, filename)
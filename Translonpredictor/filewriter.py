@@ -3,8 +3,10 @@
 import os
 import polars as pl
 
+from .orffinder import restore_orfs
 
-def saveorfsandexons(orf_df, exon_df, filename):
+
+def saveorfsandexons(orf_df, exon_df, filename, transcripts=None):
     """
     Saves annotated ORFs and exons dataframes to CSV files.
 
@@ -12,8 +14,14 @@ def saveorfsandexons(orf_df, exon_df, filename):
     and exons respectively and saves them to CSV files in the 'data/files' directory.
 
     Parameters:
-        orf_df (polars.DataFrame): DataFrame containing annotated ORFs data.
-        exon_df (polars.DataFrame): DataFrame containing exon data.
+        orf_df (polars.DataFrame or polars.LazyFrame): DataFrame containing annotated ORFs data.
+                                                       A LazyFrame is written with the streaming engine.
+        exon_df (polars.DataFrame): DataFrame containing exon data, including the strand of every
+                                    transcript, see `findexonscds.getexons_and_cds`.
+        transcripts (polars.DataFrame): The transcript keys of ORFs with the compact columns of
+                                        `orffinder.CANDIDATECOLUMNS`, see `getcandidates.streamorfs`.
+                                        The transcript IDs and codons are restored before writing.
+                                        Default is None.
 
     Returns:
         None
@@ -29,14 +37,45 @@ def saveorfsandexons(orf_df, exon_df, filename):
         saveorfsandexons(orf_df, exon_df)
     """
 
-    orf_df.write_csv(f"{filename}_annotated_orfs.csv")
-
-    fixchromcol = exon_df.with_columns(pl.col("chr").apply(lambda x: x[0]))
+    if transcripts is not None:
+        orf_df = restore_orfs(orf_df, transcripts)
+    if isinstance(orf_df, pl.LazyFrame):
+        # ORFs streamed from a file are written batch by batch
+        orf_df.sink_csv(f"{filename}_annotated_orfs.csv")
+    else:
+        orf_df.write_csv(f"{filename}_annotated_orfs.csv")
 
-    exon_df = fixchromcol.with_columns(
-        pl.col("start", "stop", "tran_start", "tran_stop").apply(
-            lambda x: ",".join(map(str, x))
-        )
+    exon_df = exon_df.with_columns(
+        pl.col("chr").list.first(),
+        pl.col("start", "stop", "tran_start", "tran_stop")
+        .list.eval(pl.element().cast(pl.String))
+        .list.join(","),
     )
     exon_df.write_csv(f"{filename}_exons.csv")
     return f"{filename}_annotated_orfs.csv", f"{filename}_exons.csv"
+
+
+def saveoffsets(offsets, filename):
+    """
+    Saves the A-site offset of every read length to a tab-separated file.
+
+    Parameters:
+        offsets (dict): Dictionary containing the offset for each read length.
+        filename (str): The name for the generated file.
+
+    Returns:
+        str: The path of the offsets file, '{filename}_offsets.tsv'.
+
+    Notes:
+        - The file has the columns 'length' and 'offset' and can be passed to `--offsets`
+          on later runs, which then skip the offset estimation.
+
+    Example:
+        saveoffsets({28: 15, 29: 15, 30: 16}, "sample")
+    """
+    offset_df = pl.DataFrame(
+        {"length": list(offsets.keys()), "offset": list(offsets.values())},
+        schema={"length": pl.Int64, "offset": pl.Int64},
+    ).sort("length")
+    offset_df.write_csv(f"{filename}_offsets.tsv", separator="\t")
+    return f"{filename}_offsets.tsv"
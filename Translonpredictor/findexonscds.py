@@ -1,6 +1,37 @@
+import os
+import hashlib
 import polars as pl
 import numpy as np
 
+from .transcriptmodels import TranscriptModelStore
+
+# Columns of a GTF/GFF file
+ANNOTATIONCOLUMNS = {
+    "chr": pl.String,
+    "source": pl.String,
+    "type": pl.String,
+    "start": pl.Int64,
+    "stop": pl.Int64,
+    "score": pl.String,
+    "strand": pl.String,
+    "frame": pl.String,
+    "attributes": pl.String,
+}
+
+# Regular expressions capturing the transcript ID in the attributes of GFF3 and GTF files
+TRANSCRIPTIDPATTERNS = [
+    r"(?:^|;)\s*(?:Parent|ID)=transcript:([^;:]*)",
+    r"(?:^|;)\s*transcript_id=([^;]*)",
+    r'(?:^|;)\s*transcript_id\s+"?([^";]*)"?',
+]
+
+# Hashes of annotation files that were already read, keyed on path, size and modification time
+ANNOTATIONHASHES = {}
+
+# Version of the compiled annotation and the coordinate map stored with it. Bump it whenever the
+# parsed tables or their meaning change, so annotations compiled by an older version are parsed again
+ANNOTATIONCACHEVERSION = 2
+
 
 def extract_transcript_id(attr_str):
     """
@@ -30,68 +61,144 @@ def extract_transcript_id(attr_str):
     return ""
 
 
-def getexons_and_cds(annotation_file, tran=[]):
+def transcriptid(column="attributes"):
+    """
+    Builds an expression that extracts the transcript ID from GTF/GFF attribute strings.
+
+    Parameters:
+        column (str): Name of the column containing the attribute strings. Default is 'attributes'.
+
+    Returns:
+        polars.Expr: Expression producing the 'tran_id' column, an empty string if no transcript ID is found.
+
+    The same attributes as `extract_transcript_id` are recognised ('Parent=transcript:', 'ID=transcript:',
+    'transcript_id=' and 'transcript_id "..."'), using the regular expressions in TRANSCRIPTIDPATTERNS.
+    The extraction runs as native string expressions, so no Python function is called per line.
+    Spaces around the ID, as in the unquoted 'transcript_id T1 ;', are removed.
+
+    Example:
+        df = df.with_columns(transcriptid("attributes"))
+    """
+    return (
+        pl.coalesce(
+            [
+                pl.col(column).str.extract(pattern, 1).str.strip_chars()
+                for pattern in TRANSCRIPTIDPATTERNS
+            ]
+        )
+        .fill_null("")
+        .alias("tran_id")
+    )
+
+
+def getexons_and_cds(annotation_file, tran=[], lazy=False):
     """
     Extracts CDS and exon coordinates from an annotation file.
 
-    This function reads an annotation file in GTF/GFF format and extracts the
-    coordinates of coding sequences (CDS) and exons. It then processes these
-    coordinates to obtain transcript-level coordinates for exons and returns
-    the results.
+    This function loads the coordinates of coding sequences (CDS) and exons of an
+    annotation file, with transcript-level coordinates for exons, from the compiled
+    annotation (see `loadannotation`). The annotation file itself is only parsed the
+    first time it is used.
 
     Parameters:
         annotation_file (str): The path to the annotation file in GTF/GFF format.
         tran (list): A list of transcript IDs to filter. Only coordinates corresponding
                      to these transcripts will be extracted if provided. Default is [].
+        lazy (bool): Return LazyFrames that scan the compiled annotation, so that the caller
+                     only reads the rows and columns it needs. Default is False.
 
     Returns:
-        tuple: A tuple containing two polars DataFrames:
+        tuple: A tuple containing two polars DataFrames (or LazyFrames if `lazy` is True):
                - The first DataFrame contains CDS coordinates.
-               - The second DataFrame contains exon coordinates.
+               - The second DataFrame contains exon coordinates, with the strand of every
+                 transcript in the 'strand' column.
 
     Notes:
-        - This function assumes the annotation file has columns separated by tabs ('\t').
-        - The annotation file is expected to have no header, with comment lines starting with '#'.
-        - The following columns are expected in the annotation file: 'chr', 'type', 'start', 'stop',
-          'strand', 'attributes'.
-        - The 'attributes' column is expected to contain transcript IDs.
-        - The function 'extract_transcript_id' is used to extract transcript IDs from the 'attributes' column.
+        - See `parseannotation` for the expected format of the annotation file.
         - If 'tran' is provided, only coordinates corresponding to the specified transcripts will be extracted.
 
     Example:
         cds_coords, exon_coords = getexons_and_cds("annotation.gff", tran=['ENST00000223972', 'ENST00000456328'])
     """
+    cds_coords, exondf = loadannotation(annotation_file, lazy=lazy)
+    if tran:
+        cds_coords = cds_coords.filter(pl.col("tran_id").is_in(tran))
+        exondf = exondf.filter(pl.col("tran_id").is_in(tran))
+    # all exons of a transcript are on the same strand
+    return cds_coords, exondf.with_columns(pl.col("strand").list.first())
+
+
+def scanannotation(annotation_file, tran=None):
+    """
+    Lazily scans the exon and CDS rows of an annotation file.
+
+    Parameters:
+        annotation_file (str): The path to the annotation file in GTF/GFF format.
+        tran (list, optional): A list of transcript IDs to filter. Only rows of these transcripts
+                               are returned if provided.
+
+    Returns:
+        polars.LazyFrame: LazyFrame with the columns 'chr', 'type', 'start', 'stop', 'strand' and
+                          'tran_id' for every exon and CDS row.
+
+    Notes:
+        - This function assumes the annotation file has columns separated by tabs ('\t').
+        - The annotation file is expected to have no header, with comment lines starting with '#'.
+        - The columns of the annotation file are listed in ANNOTATIONCOLUMNS.
+        - The 'attributes' column is expected to contain transcript IDs, which are extracted with `transcriptid`.
+        - The filters on the feature type and transcript ID are pushed down into the CSV reader, so
+          only the needed columns are kept and only the attributes of exon and CDS rows are parsed.
+
+    Example:
+        exons = scanannotation("annotation.gtf").filter(pl.col("type") == "exon").collect()
+    """
     df = (
-        pl.read_csv(
+        pl.scan_csv(
             annotation_file,
             separator="\t",
             ignore_errors=True,
             has_header=False,
             truncate_ragged_lines=True,
             comment_prefix="#",
+            new_columns=list(ANNOTATIONCOLUMNS),
+            dtypes=ANNOTATIONCOLUMNS,
         )
-        .select(
-            ["column_1", "column_3", "column_4", "column_5", "column_7", "column_9"]
-        )
-        .rename(
-            {
-                "column_1": "chr",
-                "column_3": "type",
-                "column_4": "start",
-                "column_5": "stop",
-                "column_7": "strand",
-                "column_9": "attributes",
-            }
-        )
+        .select(["chr", "type", "start", "stop", "strand", "attributes"])
+        # only the exon and CDS rows are used, so only their attributes are parsed
+        .filter(pl.col("type").is_in(["exon", "CDS"]))
+        .with_columns(transcriptid("attributes"))
+        .select(pl.all().exclude("attributes"))
     )
-    df = df.with_columns(
-        pl.col("attributes")
-        .apply(lambda attributes: extract_transcript_id(attributes))
-        .alias("tran_id")
-    ).select(pl.all().exclude("attributes"))
-
     if tran:
-        df = df.filter((pl.col("tran_id").is_in(tran)))
+        df = df.filter(pl.col("tran_id").is_in(tran))
+    return df
+
+
+def parseannotation(annotation_file, tran=None):
+    """
+    Parses an annotation file into CDS and exon coordinates.
+
+    This function reads an annotation file in GTF/GFF format and extracts the
+    coordinates of coding sequences (CDS) and exons. It then processes these
+    coordinates to obtain transcript-level coordinates for exons and returns
+    the results.
+
+    Parameters:
+        annotation_file (str): The path to the annotation file in GTF/GFF format.
+        tran (list, optional): A list of transcript IDs to filter, see `scanannotation`.
+
+    Returns:
+        tuple: A tuple containing two polars DataFrames:
+               - The first DataFrame contains CDS coordinates.
+               - The second DataFrame contains exon coordinates, including the strand.
+
+    Notes:
+        - The exon and CDS rows are read with `scanannotation`.
+
+    Example:
+        cds_coords, exon_coords = parseannotation("annotation.gff")
+    """
+    df = scanannotation(annotation_file, tran).collect()
 
     # Getting CDS
     coding_regions = df.filter((pl.col("type") == "CDS"))
@@ -113,12 +220,101 @@ def getexons_and_cds(annotation_file, tran=[]):
     cds_coords_neg = gettranscriptcoords(groupedcds, exon_coords_neg, posstrand=False)
 
     cds_coords = pl.concat([cds_coords_pos, cds_coords_neg])
-    exondf = pl.concat([exon_coords_pos, exon_coords_neg]).select(
-        pl.all().exclude("strand")
-    )
+    exondf = pl.concat([exon_coords_pos, exon_coords_neg])
     return cds_coords, exondf
 
 
+def annotationhash(annotation_file):
+    """
+    Calculates the hash of the content of an annotation file.
+
+    Parameters:
+        annotation_file (str): The path to the annotation file.
+
+    Returns:
+        str: The hexadecimal BLAKE2b digest of the file content.
+
+    The hash is only calculated once per process for a file that has not changed since.
+    """
+    stat = os.stat(annotation_file)
+    key = (os.path.abspath(annotation_file), stat.st_size, stat.st_mtime_ns)
+    if key not in ANNOTATIONHASHES:
+        digest = hashlib.blake2b(digest_size=16)
+        with open(annotation_file, "rb") as fr:
+            for block in iter(lambda: fr.read(1 << 23), b""):
+                digest.update(block)
+        ANNOTATIONHASHES[key] = digest.hexdigest()
+    return ANNOTATIONHASHES[key]
+
+
+def annotationcachepath(annotation_file, cachedir=None):
+    """
+    Determines where the compiled annotation of an annotation file is stored.
+
+    Parameters:
+        annotation_file (str): The path to the annotation file.
+        cachedir (str, optional): Directory used when the directory of the annotation file
+                                  is not writable. Default is '~/.cache/Translonpredictor'.
+
+    Returns:
+        str: 'annotation.gtf.<hash>.v<version>.annotation' next to the annotation file, or in
+             `cachedir` if the directory of the annotation file is not writable, where <hash> is
+             the `annotationhash` of the file and <version> is ANNOTATIONCACHEVERSION.
+    """
+    if cachedir is None:
+        cachedir = os.path.join(os.path.expanduser("~"), ".cache", "Translonpredictor")
+    name = (
+        f"{os.path.basename(annotation_file)}.{annotationhash(annotation_file)}"
+        f".v{ANNOTATIONCACHEVERSION}.annotation"
+    )
+    path = os.path.join(os.path.dirname(os.path.abspath(annotation_file)), name)
+    if os.path.isdir(path) or os.access(os.path.dirname(path), os.W_OK):
+        return path
+    return os.path.join(cachedir, name)
+
+
+def loadannotation(annotation_file, cachedir=None, lazy=False):
+    """
+    Loads the compiled annotation of an annotation file, compiling it on first use.
+
+    Parameters:
+        annotation_file (str): The path to the annotation file in GTF/GFF format.
+        cachedir (str, optional): Directory used when the directory of the annotation file
+                                  is not writable, see `annotationcachepath`.
+        lazy (bool): Return LazyFrames scanning the Parquet files, so that filters and column
+                     selections of the caller are pushed down into the Parquet reader. Default is False.
+
+    Returns:
+        tuple: A tuple containing two polars DataFrames (or LazyFrames if `lazy` is True), see `parseannotation`:
+               - The first DataFrame contains CDS coordinates.
+               - The second DataFrame contains exon coordinates, including the strand.
+
+    The compiled annotation stores the CDS and exon tables of `parseannotation` as Parquet
+    files ('cds.parquet' and 'exons.parquet'). It is keyed on the hash of the content of the
+    annotation file and on ANNOTATIONCACHEVERSION, so every stage of a run and every later run
+    with the same annotation reads the Parquet files instead of parsing the annotation again,
+    while annotations compiled by an older parser are parsed again. The genome to transcriptome
+    coordinate map of `coordmap.getcoordmap` is stored in the same directory.
+
+    Example:
+        cds_coords, exon_coords = loadannotation("annotation.gtf")
+    """
+    path = annotationcachepath(annotation_file, cachedir)
+    cdspath = os.path.join(path, "cds.parquet")
+    exonpath = os.path.join(path, "exons.parquet")
+    if not (os.path.isfile(cdspath) and os.path.isfile(exonpath)):
+        cds_coords, exondf = parseannotation(annotation_file)
+        os.makedirs(path, exist_ok=True)
+        # write to temporary files first, so concurrent runs never read a partial file
+        for df, filepath in [(cds_coords, cdspath), (exondf, exonpath)]:
+            df.write_parquet(f"{filepath}.{os.getpid()}")
+            os.replace(f"{filepath}.{os.getpid()}", filepath)
+
+    if lazy:
+        return pl.scan_parquet(cdspath), pl.scan_parquet(exonpath)
+    return pl.read_parquet(cdspath), pl.read_parquet(exonpath)
+
+
 def procesexons(df):
     """
     Processes exon data by separating them based on strand orientation.
@@ -175,42 +371,30 @@ def exontranscriptcoords(df: pl.DataFrame, posstrand=True) -> pl.DataFrame:
     Returns:
         polars.DataFrame: DataFrame containing transcript-level exon coordinates.
 
+    The exons are exploded to one row per exon, and the transcript coordinates are calculated
+    for all transcripts at once with a cumulative sum of the exon lengths per transcript.
+
     Example:
         exon_transcript_coords = exontranscriptcoords(exon_df, posstrand=True)
     """
-    # Initialize new columns
-    new_column_1 = []
-    new_column_2 = []
-    # Iterate over rows
-    start_column = "start"
-    end_column = "stop"
-
-    for i in range(len(df)):
-        start_values = (
-            df[start_column][i]
-            if posstrand
-            else sorted(df[start_column][i], reverse=True)
+    # negative strand transcripts are numbered from the last exon in the genome
+    starts = pl.col("start") if posstrand else pl.col("start").list.sort(descending=True)
+    stops = pl.col("stop") if posstrand else pl.col("stop").list.sort(descending=True)
+
+    df = df.with_row_index("row")
+    exons = (
+        df.select(["row", starts, stops])
+        .explode(["start", "stop"])
+        .with_columns((pl.col("stop") - pl.col("start") + 1).cast(pl.Int64).alias("size"))
+        # every exon starts one position after the stop of the previous exon
+        .with_columns(pl.col("size").cum_sum().over("row").alias("end"))
+        .group_by("row", maintain_order=True)
+        .agg(
+            (pl.col("end") - pl.col("size")).alias("tran_start"),
+            (pl.col("end") - 1).alias("tran_stop"),
         )
-        end_values = (
-            df[end_column][i] if posstrand else sorted(df[end_column][i], reverse=True)
-        )
-        new_start_values = []  # Starting value is 0
-        new_stop_values = []
-        for j in range(len(start_values)):
-            if j == 0:
-                new_start = 0
-            else:
-                new_start = new_stop_values[j - 1] + 1
-            # Calculate stop coordinate
-            stop_coordinate = end_values[j] - start_values[j]
-            new_start_values.append(new_start)
-            new_stop_values.append(new_start + stop_coordinate)
-        new_column_1.append(new_start_values)
-        new_column_2.append(new_stop_values)
-
-    # Add new columns to the dataframe
-    df = df.with_columns((pl.Series(new_column_1)).alias("tran_start"))
-    df = df.with_columns((pl.Series(new_column_2)).alias("tran_stop"))
+    )
+    df = df.join(exons, on="row", how="left").select(pl.all().exclude("row"))
     return df
 
 
@@ -220,11 +404,14 @@ def gettranscriptcoords(cds_df, exon_df, posstrand=True):
 
     This function takes a DataFrame containing CDS coordinates and a DataFrame
     containing exon coordinates. It then calculates the transcript-level coordinates
-    for the CDS based on the exon coordinates.
+    for the CDS based on the exon coordinates. The exons are held in a
+    `TranscriptModelStore`, which finds the exon containing both ends of every CDS
+    region with a binary search instead of joining every CDS region to every exon.
 
     Parameters:
         cds_df (polars.DataFrame): DataFrame containing CDS coordinates.
         exon_df (polars.DataFrame): DataFrame containing exon coordinates.
+        posstrand (bool): Whether the exons are on the positive strand. Default is True.
 
     Returns:
         polars.DataFrame: DataFrame containing transcript-level CDS coordinates.
@@ -232,72 +419,32 @@ def gettranscriptcoords(cds_df, exon_df, posstrand=True):
     Example:
         transcript_cds_coords = gettranscriptcoords(cds_df, exon_df)
     """
-    # Explode exon start and stop lists to individual rows
-    exploded_exon_df = exon_df.explode(["start", "stop", "tran_start", "tran_stop"])
-    exploded_cds_df = cds_df.explode(["start", "stop"])
-    # Join the DataFrames on the transcript ID
-    combined_df = exploded_cds_df.join(exploded_exon_df, on="tran_id", how="inner")
+    store = TranscriptModelStore.fromexons(exon_df)
+    cds = cds_df.select(["tran_id", "start", "stop"]).explode(["start", "stop"])
+    tranidx = store.transcriptindex(cds["tran_id"].to_list())
+    start = cds["start"].cast(pl.Int64).to_numpy()
+    stop = cds["stop"].cast(pl.Int64).to_numpy()
+    # Both ends of a CDS region lie within the same exon
+    exonidx = store.findexons(tranidx, start)
+    found = (exonidx >= 0) & (exonidx == store.findexons(tranidx, stop))
+    exonidx = exonidx[found]
     # Calculate transcript-level start and stop coordinates
     if posstrand:
-        combined_df = combined_df.with_columns(
-            [
-                (
-                    pl.when(
-                        (pl.col("start") >= pl.col("start_right"))
-                        & (pl.col("start") <= pl.col("stop_right"))
-                    )
-                    .then(
-                        pl.col("tran_start") + (pl.col("start") - pl.col("start_right"))
-                    )
-                    .otherwise(None)
-                ).alias("tran_start_cd"),
-                (
-                    pl.when(
-                        (pl.col("stop") >= pl.col("start_right"))
-                        & (pl.col("stop") <= pl.col("stop_right"))
-                    )
-                    .then(pl.col("tran_stop") - (pl.col("stop_right") - pl.col("stop")))
-                    .otherwise(None)
-                ).alias("tran_stop_cd"),
-            ]
-        )
+        tran_start = store.exontotranscript(exonidx, start[found])
+        tran_stop = store.exontotranscript(exonidx, stop[found], end=True)
     else:
-        combined_df = combined_df.with_columns(
-            [
-                (
-                    pl.when(
-                        (pl.col("start") >= pl.col("start_right"))
-                        & (pl.col("start") <= pl.col("stop_right"))
-                    )
-                    .then(
-                        pl.col("tran_stop") - (pl.col("start") - pl.col("start_right"))
-                    )
-                    .otherwise(None)
-                ).alias("tran_stop_cd"),
-                (
-                    pl.when(
-                        (pl.col("stop") >= pl.col("start_right"))
-                        & (pl.col("stop") <= pl.col("stop_right"))
-                    )
-                    .then(
-                        pl.col("tran_start") + (pl.col("stop_right") - pl.col("stop"))
-                    )
-                    .otherwise(None)
-                ).alias("tran_start_cd"),
-            ]
+        tran_start = store.exontotranscript(exonidx, stop[found], end=True, reverse=True)
+        tran_stop = store.exontotranscript(exonidx, start[found], reverse=True)
+    result_df = (
+        pl.DataFrame(
+            {
+                "tran_id": cds["tran_id"].filter(pl.Series(found)),
+                "tran_start": tran_start,
+                "tran_stop": tran_stop,
+            }
         )
-    # Drop rows with None values in calculated columns
-    combined_df = combined_df.drop_nulls(["tran_start_cd", "tran_stop_cd"])
-    combined_df = combined_df.group_by("tran_id").agg(
-        pl.min("tran_start_cd"), pl.max("tran_stop_cd")
-    )
-    # Select and rename relevant columns
-    result_df = combined_df.select(
-        [
-            pl.col("tran_id"),
-            pl.col("tran_start_cd").alias("tran_start"),
-            pl.col("tran_stop_cd").alias("tran_stop"),
-        ]
+        .group_by("tran_id")
+        .agg(pl.min("tran_start"), pl.max("tran_stop"))
     )
 
     return result_df
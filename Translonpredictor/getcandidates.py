@@ -1,42 +1,205 @@
 from Bio import SeqIO
-import pyranges as pr
+import multiprocessing
+import pyfaidx
 import polars as pl
 import ahocorasick
+import pyarrow.parquet as pq
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+
+from .orffinder import (
+    find_orfs,
+    find_orfs_batch,
+    transcript_keys,
+    compact_orfs,
+    restore_orfs,
+    ORFCOLUMNS,
+    CANDIDATECOLUMNS,
+)
+from .findexonscds import getexons_and_cds, loadannotation
+
+# Number of nucleotides in a chunk of transcripts scanned at once for ORFs
+ORFBATCHSIZE = 2**22
+
+# Types of ORFs relative to the CDS of their transcript, see `orftype`
+ORFTYPES = ["uORF", "CDS", "dORF", "uoORF", "doORF", "iORF", "eoORF", "extORF", "Unexpected", "Non Coding"]
+
+
+def chromosometranscripts(seq, chrom, exons):
+    """
+    Extracts the sequences of the transcripts on one chromosome from an indexed genome.
+
+    Parameters:
+        seq (str): Path to the genome sequence file in FASTA format. A missing '.fai' index is
+                   built by pyfaidx.
+        chrom (str): Name of the chromosome.
+        exons (polars.DataFrame): DataFrame with one row per transcript on the chromosome and the
+                                  columns 'tran_id', 'strand', 'start' and 'stop', the exon
+                                  coordinates sorted on 'start' (1-based and inclusive).
+
+    Returns:
+        list: List of (transcript ID, sequence) tuples in the order of `exons`.
+
+    Raises:
+        Exception: If the chromosome is not in the genome sequence file.
+
+    Only the chromosome is read from the genome, so the memory use is bounded by the largest
+    chromosome instead of the whole genome. Transcripts on the negative strand are reverse
+    complemented.
+    """
+    fasta = pyfaidx.Fasta(seq, as_raw=True)
+    if chrom not in fasta:
+        raise Exception(f"Chromosome {chrom} of the annotation is not in {seq}")
+    chromseq = fasta[chrom][:]
+    fasta.close()
+
+    sequences = []
+    for tran, strand, starts, stops in exons.select(
+        ["tran_id", "strand", "start", "stop"]
+    ).iter_rows():
+        sequence = "".join(
+            chromseq[start - 1 : stop] for start, stop in zip(starts, stops)
+        )
+        if strand == "-":
+            sequence = pyfaidx.complement(sequence)[::-1]
+        sequences.append((tran, sequence))
+    return sequences
+
+
+def workerpool(threads):
+    """
+    Starts the process pool shared by the stages that find the candidate ORFs.
+
+    Parameters:
+        threads (int): Number of worker processes.
 
-from .orffinder import find_orfs
-from .findexonscds import getexons_and_cds
+    Returns:
+        context manager: A 'spawn' ProcessPoolExecutor with `threads` workers, or a context that
+                         gives None if `threads` is 1, so the stages run in the main process.
 
+    The transcript extraction (`gettranscripts`) and the ORF scan (`streamorfs`) run at the same
+    time, as the scan reads the extracted sequences. Passing one pool to both keeps the number of
+    worker processes at `threads`.
 
-def gettranscripts(seq, annotation, outfilename):
+    Example:
+        with workerpool(4) as executor:
+            transcript = gettranscripts("genome.fa", "annotation.gtf", threads=4, executor=executor)
+            orfs, transcripts = streamorfs(transcript, ["ATG"], ["TAA", "TAG", "TGA"], 0, 1000000, "sample_candidates.parquet", threads=4, executor=executor)
+    """
+    if threads > 1:
+        context = multiprocessing.get_context("spawn")
+        return ProcessPoolExecutor(max_workers=threads, mp_context=context)
+    return nullcontext(None)
+
+
+def transcriptsequences(seq, annotation, threads=1, executor=None):
+    """
+    Extracts transcript sequences chromosome by chromosome.
+
+    Parameters:
+        seq (str): Path to the genome sequence file in FASTA format.
+        annotation (str): Path to the genome annotation file in GFF/GTF format.
+        threads (int): Number of chromosomes processed at the same time. Default is 1.
+        executor (ProcessPoolExecutor, optional): Pool to run the chromosomes in, see `workerpool`.
+                                                  A pool of `threads` workers is started if not
+                                                  provided and `threads` is larger than 1.
+
+    Returns:
+        generator: Generator of (transcript ID, sequence) tuples, grouped by chromosome and
+                   sorted on transcript ID within a chromosome. The chromosomes are in the order
+                   of their first transcript ID, not in the order of the annotation.
+
+    The exons of the compiled annotation (see `findexonscds.loadannotation`) are split per
+    chromosome in a single pass and every chromosome is extracted with `chromosometranscripts`, in worker processes
+    if `threads` is larger than 1. The sequences of a chromosome are yielded as soon as it is done,
+    and at most two chromosomes per worker are extracted ahead of the consumer, so all transcript
+    sequences are never held in memory at once.
+
+    Example:
+        for tran, sequence in transcriptsequences("genome.fa", "annotation.gtf", threads=4):
+            print(tran, len(sequence))
+    """
+    cds_df, exon_df = loadannotation(annotation)
+    exons = (
+        exon_df.select(["chr", "tran_id", "start", "stop", "strand"])
+        .explode(["chr", "start", "stop", "strand"])
+        .sort(["tran_id", "start"])
+        .group_by(["chr", "tran_id"], maintain_order=True)
+        .agg(pl.col("strand").first(), pl.col("start"), pl.col("stop"))
+    )
+    # one table of exons per chromosome, in the order of the first transcript of every chromosome
+    chroms = exons.partition_by("chr", maintain_order=True)
+    # index the genome once before the workers read it
+    pyfaidx.Fasta(seq).close()
+
+    if executor is not None or threads > 1:
+        with nullcontext(executor) if executor else workerpool(threads) as pool:
+            pending = deque()
+            for chrom in chroms:
+                pending.append(
+                    pool.submit(chromosometranscripts, seq, chrom["chr"][0], chrom)
+                )
+                if len(pending) >= 2 * threads:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+    else:
+        for chrom in chroms:
+            yield from chromosometranscripts(seq, chrom["chr"][0], chrom)
+
+
+def gettranscripts(seq, annotation, outfilename=None, threads=1, executor=None):
     """
     Extracts transcript sequences from a genome annotation file.
 
     This function takes a genome sequence file and a genome annotation file,
-    extracts transcript sequences from the annotation file, and saves them
-    to a FASTA file.
+    extracts transcript sequences of the exons in the compiled annotation
+    (see `findexonscds.loadannotation`), and yields them one by one, optionally
+    saving them to a FASTA file on the way.
 
     Parameters:
         seq (str): Path to the genome sequence file in FASTA format.
         annotation (str): Path to the genome annotation file in BED/GFF/GTF format.
-        outfile (str): Path to save the output transcript sequences in FASTA format.
-                       Default is 'transcripts.fa'.
+        outfilename (str, optional): Name for the FASTA file. If provided, the sequences are also
+                                     written to '{outfilename}_transcripts.fa'.
+        threads (int): Number of chromosomes extracted at the same time, see
+                       `transcriptsequences`. Default is 1.
+        executor (ProcessPoolExecutor, optional): Pool shared with the ORF scan, see `workerpool`.
 
-    Returns:
-        str: Path to the output FASTA file containing transcript sequences.
+    Yields:
+        tuple: The transcript ID and the transcript sequence.
+
+    Notes:
+        - The sequences are read from the indexed genome one chromosome at a time and can be
+          passed straight to `preporfs`, so the FASTA file does not have to be written and
+          parsed again.
 
     Example:
-        output_file = gettranscripts("genome.fa", "annotation.gff", outfile="transcripts.fa")
+        orfdf = preporfs(gettranscripts("genome.fa", "annotation.gtf"), ["ATG"], ["TAA", "TAG", "TGA"], 0, 1000000)
     """
-    ann = pr.read_gtf(annotation, ignore_bad=True)
-    transcripts = ann[ann.Feature == "exon"]
-    tran_seq = transcripts.get_transcript_sequence(
-        transcript_id="transcript_id", path=seq
-    )
+    if not outfilename:
+        yield from transcriptsequences(seq, annotation, threads, executor)
+        return
     with open(f"{outfilename}_transcripts.fa", "w") as fw:
-        for index, id, seq in tran_seq.itertuples():
-            fw.write(f">{id}\n{seq}\n")
+        for tran, sequence in transcriptsequences(seq, annotation, threads, executor):
+            fw.write(f">{tran}\n{sequence}\n")
+            yield tran, sequence
 
-    return f"{outfilename}_transcripts.fa"
+
+def readtranscripts(transcript):
+    """
+    Reads transcript sequences from a FASTA file.
+
+    Parameters:
+        transcript (str): Path to a FASTA file containing transcript sequences.
+
+    Yields:
+        tuple: The transcript ID, the part of the record ID before the first '|', and the sequence.
+    """
+    with open(transcript) as handle:
+        for record in SeqIO.parse(handle, "fasta"):
+            yield str(record.id).split("|")[0], str(record.seq)
 
 
 def classify_orf(row):
@@ -92,7 +255,39 @@ def classify_orf(row):
         return "Unexpected"
 
 
-def orfrelativeposition(annotation, df, cds_df):
+def orftype():
+    """
+    Classifies ORFs by their position relative to the CDS of their transcript.
+
+    Returns:
+    - polars.Expr: Expression for the type of every ORF, from the columns 'start', 'stop', 'tran_start'
+      and 'tran_stop'. The types and their order of precedence are the same as in `classify_orf`, which
+      classifies a single ORF.
+    """
+    start, stop = pl.col("start"), pl.col("stop")
+    tran_start, tran_stop = pl.col("tran_start"), pl.col("tran_stop")
+    return (
+        pl.when(stop < tran_start)
+        .then(pl.lit("uORF"))
+        .when((start == tran_start) & (stop == tran_stop))
+        .then(pl.lit("CDS"))
+        .when(start > tran_stop)
+        .then(pl.lit("dORF"))
+        .when((start < tran_start) & (stop >= tran_start))
+        .then(pl.lit("uoORF"))
+        .when((start <= tran_stop) & (stop > tran_stop))
+        .then(pl.lit("doORF"))
+        .when((start >= tran_start) & (stop <= tran_stop))
+        .then(pl.lit("iORF"))
+        .when((start < tran_start) & (stop > tran_stop))
+        .then(pl.lit("eoORF"))
+        .when((start < tran_start) & (stop == tran_stop))
+        .then(pl.lit("extORF"))
+        .otherwise(pl.lit("Unexpected"))
+    )
+
+
+def orfrelativeposition(annotation, df, cds_df, transcripts=None):
     """
     Determines the relative position of ORFs to coding sequences (CDS).
 
@@ -102,64 +297,60 @@ def orfrelativeposition(annotation, df, cds_df):
 
     Parameters:
         annotation (str): Path to the genome annotation file in BED/GFF/GTF format.
-        df (polars.DataFrame): DataFrame containing ORF coordinates. It must have columns
-                               'tran_id', 'pos', and 'end' representing transcript ID, start
-                               position, and end position of each ORF respectively.
+        df (polars.DataFrame or polars.LazyFrame): DataFrame containing ORF coordinates. It must
+                               have columns 'tran_id', 'start', and 'stop' representing transcript
+                               ID, start position, and end position of each ORF respectively, such
+                               as the LazyFrame returned by `streamorfs`. ORFs with integer
+                               'tran_key' columns instead of 'tran_id' are typed without
+                               restoring their transcript IDs.
+        transcripts (polars.DataFrame): The transcript keys of ORFs with a 'tran_key' column,
+                                        as returned by `streamorfs`. Default is None.
 
     Returns:
         tuple: A tuple containing two polars DataFrames:
                - The first DataFrame contains ORF coordinates with an additional column
-                 'type' indicating the relative position of each ORF to CDS.
+                 'type' indicating the relative position of each ORF to CDS, see `orftype`,
+                 with the categories of `ORFTYPES`.
+                 It is a LazyFrame if `df` is a LazyFrame, so ORFs stored in a file are typed
+                 while they are written out (see `filewriter.saveorfsandexons`).
                - The second DataFrame contains exon coordinates.
 
     Example:
         orf_df, exon_coords = orfrelativeposition("annotation.gff", orf_df)
     """
-    orflist = []
+    lazy = isinstance(df, pl.LazyFrame)
+    key = "tran_key" if "tran_key" in df.columns else "tran_id"
     if not "cdsdf" in globals():
-        cds_df, exon_coords = getexons_and_cds(annotation, list(df["tran_id"].unique()))
+        # only the transcript keys are read from ORFs that are stored in a file
+        tranids = df.select(pl.col(key).unique())
+        tranids = (tranids.collect() if lazy else tranids).get_column(key)
+        if key == "tran_key":
+            tranids = transcripts["tran_id"].gather(tranids)
+        cds_df, exon_coords = getexons_and_cds(annotation, tranids.to_list(), lazy=True)
+        # only the CDS and exons of transcripts with ORFs are read
+        cds_df = cds_df.select(["tran_id", "tran_start", "tran_stop"]).collect()
+        exon_coords = exon_coords.collect()
+    if key == "tran_key":
+        # the CDS is joined to the ORFs on the integer keys of the transcripts
+        cds_df = transcripts.join(cds_df, on="tran_id").select(
+            "tran_key", pl.col("tran_start", "tran_stop").cast(pl.Int32)
+        )
 
     print("Typing ORFS")
-    tranids = list(cds_df["tran_id"].unique())
-    # TYPING ORFS
-    codingorfs = (
-        df.with_columns(shared=pl.col("tran_id").is_in(tranids))
-        .filter(pl.col("shared") == True)
-        .select(pl.all().exclude("shared"))
-    )
-
-    codingorfs = codingorfs.join(cds_df, on="tran_id")
-    codingorfs = (
-        codingorfs.with_columns(
-            pl.struct(["start", "stop", "tran_start", "tran_stop"])
-            .apply(lambda row: classify_orf(row))
+    # TYPING ORFS, ORFs on transcripts without a CDS are non coding
+    df = (
+        df.lazy()
+        .join(cds_df.lazy(), on=key, how="left")
+        .with_columns(
+            pl.when(pl.col("tran_start").is_null())
+            .then(pl.lit("Non Coding"))
+            .otherwise(orftype())
+            .cast(pl.Enum(ORFTYPES))
             .alias("type")
         )
         .select(pl.all().exclude("tran_start", "tran_stop"))
-        .to_dict(as_series=False)
     )
-    orflist.append(codingorfs)
-
-    # NON CODING ORFS
-    noncodingorfs = (
-        df.with_columns(shared=pl.col("tran_id").is_in(tranids))
-        .filter(pl.col("shared") == False)
-        .select(pl.all().exclude("shared"))
-    )
-
-    noncodingorfs = noncodingorfs.with_columns(type=pl.lit("Non Coding")).to_dict(
-        as_series=False
-    )
-    orflist.append(noncodingorfs)
-    # MAKE ONE DF
-    df = pl.from_dicts(orflist).explode(
-        "tran_id", "start", "stop", "length", "startorf", "stoporf", "type"
-    )
-
-    cdslist = df.filter(pl.col("type") == "CDS")
-    cdslist = list(cdslist["tran_id"].unique())
-
-    return df, exon_coords
+    return (df if lazy else df.collect()), exon_coords
 
 
 def create_automaton(codons):
@@ -191,29 +382,111 @@ def create_automaton(codons):
     return automaton
 
 
-def preporfs(transcript, starts, stops, minlength, maxlength):
+def transcriptchunks(transcript, chunksize=ORFBATCHSIZE):
+    """
+    Groups transcript sequences into chunks of about the same number of nucleotides.
+
+    Parameters:
+    - transcript (iterable): (transcript ID, sequence) pairs.
+    - chunksize (int): Number of nucleotides after which a chunk is complete. Default is `ORFBATCHSIZE`.
+
+    Yields:
+    - tuple: A list of transcript IDs and a list of their sequences, in the order of `transcript`.
+    """
+    tran_ids, sequences, size = [], [], 0
+    for tran_id, sequence in transcript:
+        tran_ids.append(tran_id)
+        sequences.append(sequence)
+        size += len(sequence)
+        if size >= chunksize:
+            yield tran_ids, sequences
+            tran_ids, sequences, size = [], [], 0
+    if tran_ids:
+        yield tran_ids, sequences
+
+
+def chunkorfs(
+    tran_ids, sequences, starts, stops, minlength, maxlength, engine="automaton", firstkey=0
+):
+    """
+    Predict the ORFs of one chunk of transcripts.
+
+    Parameters:
+    - tran_ids (list): Transcript IDs of the chunk.
+    - sequences (list): Sequences of the transcripts, in the same order as `tran_ids`.
+    - starts (list): Start codons.
+    - stops (list): Stop codons.
+    - minlength (int): Minimum length threshold for predicted ORFs.
+    - maxlength (int): Maximum length threshold for predicted ORFs.
+    - engine (str): 'automaton' or 'numpy', see `preporfs`. Default is 'automaton'.
+    - firstkey (int): Integer key of the first transcript of the chunk, see `orffinder.transcript_keys`.
+      Default is 0.
+
+    Returns:
+    - DataFrame: A polars DataFrame with the compact columns of `orffinder.CANDIDATECOLUMNS`, with the ORFs
+      of the transcripts in the order of `tran_ids`.
+
+    This function is run in worker processes by `preporfs` when more than one thread is used. The ORFs
+    are found for the integer keys of the transcripts, so only the keys are returned to the main process.
+    """
+    tran_keys = list(range(firstkey, firstkey + len(tran_ids)))
+    if engine == "numpy":
+        orfs = find_orfs_batch(tran_keys, sequences, starts, stops, minlength, maxlength)
+        return compact_orfs(orfs)
+    startautomaton = create_automaton(starts)
+    stopautomaton = create_automaton(stops)
+    dict_list = []
+    for tran_key, sequence in zip(tran_keys, sequences):
+        append_list = find_orfs(
+            sequence,
+            tran_key,
+            startautomaton,
+            stopautomaton,
+            minlength,
+            maxlength,
+        )
+        dict_list.extend(append_list)
+    orfs = pl.from_dicts(dict_list, schema={**ORFCOLUMNS, "tran_id": pl.Int64})
+    return compact_orfs(orfs)
+
+
+def preporfs(
+    transcript, starts, stops, minlength, maxlength, engine="automaton", threads=1, executor=None
+):
     """
     Predict ORFs (Open Reading Frames) from transcript sequences using start and stop codon patterns.
 
     Parameters:
-    - transcript (str): Path to a FASTA file containing transcript sequences.
+    - transcript (str or iterable): Path to a FASTA file containing transcript sequences, or (transcript ID,
+      sequence) pairs as yielded by `gettranscripts`.
     - starts (list): List of strings representing start codon patterns (e.g., ['ATG', 'GTG', 'TTG']).
     - stops (list): List of strings representing stop codon patterns (e.g., ['TAA', 'TAG', 'TGA']).
     - minlength (int): Minimum length threshold for predicted ORFs.
     - maxlength (int): Maximum length threshold for predicted ORFs.
+    - engine (str): 'automaton' to scan the transcripts one by one with `find_orfs`, or 'numpy' to scan
+      a whole chunk at once with `orffinder.find_orfs_batch`. Both find the same ORFs.
+      Default is 'automaton'.
+    - threads (int): Number of worker processes that scan chunks at the same time. Default is 1.
+    - executor (ProcessPoolExecutor, optional): Pool to scan the chunks in, see `workerpool`. A pool of
+      `threads` workers is started if not provided and `threads` is larger than 1.
 
     Returns:
     - DataFrame: A Pandas DataFrame containing predicted ORFs for each transcript sequence.
 
-    This function reads transcript sequences from the provided FASTA file (`transcript`). For each
-    transcript sequence, it creates Aho-Corasick automata (`startautomaton` and `stopautomaton`)
-    using the provided lists of start and stop codon patterns (`starts` and `stops`).
+    This function reads transcript sequences from the provided FASTA file (`transcript`) with
+    `readtranscripts`, or takes them directly from an iterable. The transcripts are grouped into
+    chunks of about `ORFBATCHSIZE` nucleotides with `transcriptchunks`, and the ORFs of every chunk
+    are found with `chunkorfs`: per transcript with Aho-Corasick automata and `find_orfs`, or with
+    array operations over the whole chunk for the 'numpy' engine.
 
-    It iterates through each transcript sequence, identifies ORFs using the `find_orfs` function,
-    and appends the results to `dict_list`. After processing all transcripts, `dict_list` is converted
-    to a Pandas DataFrame (`df`) where each dictionary represents a row of ORF predictions.
+    With more than one thread, the chunks are scanned in a process pool. At most two chunks per
+    worker are read ahead, and the results are concatenated in the order of the chunks, so the output
+    does not depend on the number of threads.
 
-    The DataFrame `df` is sorted by `tran_id` and returned as the final output.
+    The chunks hold the compact columns of `orffinder.CANDIDATECOLUMNS`. Their transcript IDs and
+    codons are restored with `orffinder.restore_orfs`, and the DataFrame `df` is sorted by `tran_id`
+    and returned as the final output. To write the ORFs to a file without holding all of them in
+    memory, use `streamorfs`.
 
     Note: This function assumes the use of the Biopython library (`SeqIO` for parsing FASTA files)
     and a custom function `find_orfs` for ORF prediction based on Aho-Corasick automata.
@@ -225,30 +498,124 @@ def preporfs(transcript, starts, stops, minlength, maxlength):
     stops = ['TAA', 'TAG', 'TGA']
     minlength = 50
     maxlength = 5000
-    predicted_orfs = preporfs(transcript, starts, stops, minlength, maxlength)
+    predicted_orfs = preporfs(transcript, starts, stops, minlength, maxlength, threads=4)
     ```
     """
-    dict_list = []
+    tran_ids, orfs = [], []
+    for chunk_ids, chunk in orfchunks(
+        transcript, starts, stops, minlength, maxlength, engine, threads, executor
+    ):
+        tran_ids.extend(chunk_ids)
+        orfs.append(chunk)
+    df = pl.concat(orfs) if orfs else pl.DataFrame(schema=CANDIDATECOLUMNS)
+    df = restore_orfs(df, transcript_keys(tran_ids)).cast(ORFCOLUMNS)
+    df = df.sort("tran_id", maintain_order=True)
+    print("\n")
+    return df
+
+
+def orfchunks(
+    transcript, starts, stops, minlength, maxlength, engine="automaton", threads=1, executor=None
+):
+    """
+    Predict ORFs chunk by chunk, see `preporfs`.
+
+    Parameters:
+    - transcript (str or iterable): Path to a FASTA file containing transcript sequences, or (transcript ID,
+      sequence) pairs.
+    - starts (list): Start codons.
+    - stops (list): Stop codons.
+    - minlength (int): Minimum length threshold for predicted ORFs.
+    - maxlength (int): Maximum length threshold for predicted ORFs.
+    - engine (str): 'automaton' or 'numpy', see `preporfs`. Default is 'automaton'.
+    - threads (int): Number of worker processes that scan chunks at the same time. Default is 1.
+    - executor (ProcessPoolExecutor, optional): Pool to scan the chunks in, see `preporfs`.
+
+    Yields:
+    - tuple: The transcript IDs and the ORFs of every chunk of transcripts (see `chunkorfs`), in the
+      order of the chunks. The transcripts are numbered across the chunks, so the keys of the
+      transcripts of all chunks are those of `orffinder.transcript_keys` for all transcript IDs.
+    """
+    if engine not in ["automaton", "numpy"]:
+        raise Exception(f"Unknown ORF engine {engine}, choose 'automaton' or 'numpy'")
+    if isinstance(transcript, str):
+        transcript = readtranscripts(transcript)
+    settings = (starts, stops, minlength, maxlength, engine)
+
     # COUNTER!!!!!!!!!!
     counter = 0
-    with open(transcript) as handle:
-        for record in SeqIO.parse(handle, "fasta"):
-            startautomaton = create_automaton(starts)
-            stopautomaton = create_automaton(stops)
-            if counter % 20000 == 0:
-                print("\r" + f"Read {counter} transcripts", end="")
-            tran_id = str(record.id).split("|")[0]
-            append_list = find_orfs(
-                str(record.seq),
-                tran_id,
-                startautomaton,
-                stopautomaton,
-                minlength,
-                maxlength,
-            )
-            dict_list.extend(append_list)
-            counter = counter + 1
-        df = pl.from_dicts(dict_list)
-        df = df.sort("tran_id")
-        print("\n")
-        return df
+    if executor is not None or threads > 1:
+        with nullcontext(executor) if executor else workerpool(threads) as pool:
+            pending = deque()
+            for tran_ids, sequences in transcriptchunks(transcript):
+                future = pool.submit(chunkorfs, tran_ids, sequences, *settings, counter)
+                pending.append((tran_ids, future))
+                counter += len(tran_ids)
+                if len(pending) >= 2 * threads:
+                    tran_ids, future = pending.popleft()
+                    yield tran_ids, future.result()
+                    print("\r" + f"Read {counter} transcripts", end="")
+            while pending:
+                tran_ids, future = pending.popleft()
+                yield tran_ids, future.result()
+    else:
+        for tran_ids, sequences in transcriptchunks(transcript):
+            yield tran_ids, chunkorfs(tran_ids, sequences, *settings, counter)
+            counter += len(tran_ids)
+            print("\r" + f"Read {counter} transcripts", end="")
+
+
+def streamorfs(
+    transcript,
+    starts,
+    stops,
+    minlength,
+    maxlength,
+    outfile,
+    engine="automaton",
+    threads=1,
+    executor=None,
+):
+    """
+    Predict ORFs and write them to a Parquet file, one row group per chunk of transcripts.
+
+    Parameters:
+    - transcript (str or iterable): Path to a FASTA file containing transcript sequences, or (transcript ID,
+      sequence) pairs as yielded by `gettranscripts`.
+    - starts (list): Start codons.
+    - stops (list): Stop codons.
+    - minlength (int): Minimum length threshold for predicted ORFs.
+    - maxlength (int): Maximum length threshold for predicted ORFs.
+    - outfile (str): Path of the Parquet file.
+    - engine (str): 'automaton' or 'numpy', see `preporfs`. Default is 'automaton'.
+    - threads (int): Number of worker processes that scan chunks at the same time. Default is 1.
+    - executor (ProcessPoolExecutor, optional): Pool to scan the chunks in, see `preporfs`. Pass the pool
+      of `gettranscripts` to scan the transcripts while they are extracted, see `workerpool`.
+
+    Returns:
+    - tuple: A tuple containing:
+        - LazyFrame: A polars LazyFrame scanning the ORFs in `outfile`, with the compact columns of
+          `orffinder.CANDIDATECOLUMNS`.
+        - DataFrame: The transcript keys of the ORFs, see `orffinder.transcript_keys`.
+
+    The ORFs are found as in `preporfs`, but every chunk is written to `outfile` as soon as it is done
+    instead of being kept until all transcripts are scanned. The memory use therefore depends on the size
+    of a chunk (`ORFBATCHSIZE`), not on the number of ORFs. All ORFs of a transcript are in the same chunk,
+    so the ORFs of every transcript are consecutive in the file, in the order of the transcripts.
+
+    The transcript IDs stay in the table of transcript keys and are only joined back to the ORFs when they
+    are written out, see `filewriter.saveorfsandexons`.
+
+    Example:
+        orfs, transcripts = streamorfs("transcripts.fa", ["ATG", "CTG"], ["TAA", "TAG", "TGA"], 0, 1000000, "sample_candidates.parquet")
+    """
+    tran_ids = []
+    schema = pl.DataFrame(schema=CANDIDATECOLUMNS).to_arrow().schema
+    with pq.ParquetWriter(outfile, schema) as writer:
+        for chunk_ids, orfs in orfchunks(
+            transcript, starts, stops, minlength, maxlength, engine, threads, executor
+        ):
+            tran_ids.extend(chunk_ids)
+            writer.write_table(orfs.to_arrow())
+    print("\n")
+    return pl.scan_parquet(outfile), transcript_keys(tran_ids)
@@ -1,3 +1,28 @@
+import numpy as np
+import polars as pl
+from bisect import bisect_right
+
+# Columns of the ORFs found by `find_orfs` and `find_orfs_batch`
+ORFCOLUMNS = {
+    "tran_id": pl.String,
+    "start": pl.Int64,
+    "stop": pl.Int64,
+    "length": pl.Int64,
+    "startorf": pl.String,
+    "stoporf": pl.String,
+}
+
+# Compact columns of the candidate ORFs, with integer transcript keys and codons as categories
+CANDIDATECOLUMNS = {
+    "tran_key": pl.UInt32,
+    "start": pl.Int32,
+    "stop": pl.Int32,
+    "length": pl.Int32,
+    "startorf": pl.Categorical,
+    "stoporf": pl.Categorical,
+}
+
+
 def find_all_positions(sequence, automaton):
     """
     Find positions of all occurrences of patterns from an Aho-Corasick automaton in a given sequence.
@@ -59,7 +84,8 @@ def find_orfs(
 
     This function identifies potential ORFs in the provided `sequence` by searching for start and stop codon
     patterns using pre-built Aho-Corasick automata (`startautomaton` and `stopautomaton`). For each identified
-    start codon, it searches for a valid stop codon downstream and calculates the ORF properties.
+    start codon, it finds the first stop codon downstream in the same frame with a binary search over the sorted
+    stop positions and calculates the ORF properties.
 
     ORFs are represented as dictionaries containing information such as transcript ID (`tran_id`), start and
     stop positions (adjusted for frame), ORF length, and the sequences of start and stop codons (`startorf`
@@ -77,9 +103,10 @@ def find_orfs(
 
     for frame, startpositions in startpositions.items():
         for position in startpositions:
-            valid_stops = [i for i in stoppositions[frame] if i > position]
-            if valid_stops:
-                stopposition = min(valid_stops)
+            # first in-frame stop after the start, the stop positions are sorted
+            nextstop = bisect_right(stoppositions[frame], position)
+            if nextstop < len(stoppositions[frame]):
+                stopposition = stoppositions[frame][nextstop]
                 stopcodon = stop_codons[stopposition]
             else:
                 stopposition = len(sequence)
@@ -105,3 +132,219 @@ def find_orfs(
             if orf_data["length"] < maxlength and orf_data["length"] > minlength:
                 orf_list.append(orf_data)
     return orf_list
+
+
+def codon_codes(buffer):
+    """
+    Encodes every three consecutive bytes of a sequence buffer as one integer.
+
+    Parameters:
+    - buffer (numpy.ndarray): uint8 array with the characters of one or more sequences.
+
+    Returns:
+    - numpy.ndarray: int32 array with one entry per position p < len(buffer) - 2, the code of the
+      codon buffer[p:p + 3]. Codons are compared by their code, see `codon_code`.
+    """
+    codes = buffer[:-2].astype(np.int32) << 16
+    codes |= buffer[1:-1].astype(np.int32) << 8
+    codes |= buffer[2:]
+    return codes
+
+
+def codon_code(codon):
+    """Returns the code of a codon string, see `codon_codes`."""
+    if len(codon) != 3:
+        raise Exception(f"The codon {codon} does not consist of three nucleotides")
+    return int(codon_codes(np.frombuffer(codon.encode("ascii"), dtype=np.uint8))[0])
+
+
+def codon_positions(codes, codons, offsets):
+    """
+    Finds the occurrences of codons in a batch of concatenated sequences.
+
+    Parameters:
+    - codes (numpy.ndarray): Codon codes of the concatenated sequences, see `codon_codes`.
+    - codons (list): Codons to find.
+    - offsets (numpy.ndarray): Start of every sequence in the concatenation, followed by its total length.
+
+    Returns:
+    - tuple: Three arrays with one entry per occurrence, sorted on the position in the concatenation: the index
+      of the sequence, the position of the last nucleotide of the codon in the sequence (as in `find_all_positions`)
+      and the code of the codon. Codons that span two sequences are left out.
+    """
+    found = np.zeros(len(codes), dtype=bool)
+    for codon in set(codons):
+        found |= codes == codon_code(codon)
+    found = np.flatnonzero(found)
+    seqidx = np.searchsorted(offsets, found, side="right") - 1
+    position = found - offsets[seqidx] + 2
+    inside = position < offsets[seqidx + 1] - offsets[seqidx]
+    return seqidx[inside], position[inside], codes[found[inside]]
+
+
+def codon_keys(codons, size):
+    """
+    Combines the sequence, frame and position of codons into one integer key per codon.
+
+    Parameters:
+    - codons (tuple): Codons as returned by `codon_positions`.
+    - size (int): Total length of the concatenated sequences, larger than every position.
+
+    Returns:
+    - numpy.ndarray: The keys, which sort the codons on sequence, frame ((position - 2) % 3) and position.
+      Codons with the same sequence and frame share 'key // size'.
+    """
+    seqidx, position, _ = codons
+    return (seqidx * 3 + (position - 2) % 3) * size + position
+
+
+def decode_codons(codes):
+    """
+    Converts codon codes back to codon strings.
+
+    Parameters:
+    - codes (numpy.ndarray): Codon codes, see `codon_codes`.
+
+    Returns:
+    - polars.Series: The codon of every code.
+    """
+    unique, inverse = np.unique(codes, return_inverse=True)
+    codons = pl.Series(
+        [bytes([c >> 16, (c >> 8) & 255, c & 255]).decode("ascii") for c in unique.tolist()],
+        dtype=pl.String,
+    )
+    return codons.gather(inverse)
+
+
+def find_orfs_batch(tran_ids, sequences, starts, stops, minlength=0, maxlength=1000000):
+    """
+    Predict Open Reading Frames (ORFs) in a batch of nucleotide sequences with array operations.
+
+    Parameters:
+    - tran_ids (list): Identifiers of the transcript sequences, strings or integer keys.
+    - sequences (list): Nucleotide sequences, in the same order as `tran_ids`.
+    - starts (list): Start codons (e.g., ['ATG', 'CTG']).
+    - stops (list): Stop codons (e.g., ['TAA', 'TAG', 'TGA']).
+    - minlength (int, optional): Minimum length threshold for predicted ORFs. Defaults to 0.
+    - maxlength (int, optional): Maximum length threshold for predicted ORFs. Defaults to 1000000 (1 million).
+
+    Returns:
+    - DataFrame: A polars DataFrame with the columns of `ORFCOLUMNS`, one row per ORF, with the same ORFs
+      and values as `find_orfs` for every sequence, in the order of the sequences. The 'tran_id' column has
+      the type of `tran_ids`.
+
+    All sequences are concatenated into one uint8 array. The codon at every position is encoded as one integer,
+    so the start and stop codons of all sequences and all three frames are found with a few array comparisons.
+    Every start is then paired with the first stop after it in the same sequence and frame with one
+    `numpy.searchsorted` over the stops, sorted on sequence, frame and position. Starts without such a stop end
+    at the end of their sequence, with its last three nucleotides as stop codon, like in `find_orfs`.
+
+    Example:
+        orfs = find_orfs_batch(["ENST1"], ["ATGCATGACTAGCATTAA"], ["ATG"], ["TAA", "TAG", "TGA"])
+    """
+    lengths = np.fromiter((len(sequence) for sequence in sequences), dtype=np.int64, count=len(sequences))
+    if not lengths.sum():
+        return pl.DataFrame(schema=ORFCOLUMNS)
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    buffer = np.frombuffer("".join(sequences).encode("ascii"), dtype=np.uint8)
+    codes = codon_codes(np.concatenate([buffer, np.zeros(2, dtype=np.uint8)]))
+
+    startcodons = codon_positions(codes, starts, offsets)
+    stopcodons = codon_positions(codes, stops, offsets)
+
+    # sequence, frame and position of every codon as one integer key, sorted for the stops
+    stopkeys = codon_keys(stopcodons, len(buffer))
+    order = np.argsort(stopkeys)
+    stopkeys = stopkeys[order]
+    _, stopposition, stopcodes = [array[order] for array in stopcodons]
+    # starts in the order of find_orfs, per sequence by frame and position
+    startkeys = codon_keys(startcodons, len(buffer))
+    order = np.argsort(startkeys)
+    startkeys = startkeys[order]
+    startseq, startposition, startcodes = [array[order] for array in startcodons]
+
+    # first stop after every start, the padding stop at the end belongs to no sequence and frame
+    nextstop = np.searchsorted(stopkeys, startkeys, side="right")
+    stopkeys, stopposition, stopcodes = [
+        np.append(array, -1)[nextstop] for array in (stopkeys, stopposition, stopcodes)
+    ]
+    found = stopkeys // len(buffer) == startkeys // len(buffer)
+    # without an in-frame stop the ORF runs to the end of the sequence
+    stopposition = np.where(found, stopposition, lengths[startseq])
+    stopcode = np.where(found, stopcodes, codes[offsets[startseq + 1] - 3])
+
+    length = stopposition - startposition
+    keep = (length < maxlength) & (length > minlength)
+    tran_ids = pl.Series(tran_ids)
+    orfs = pl.DataFrame(
+        {
+            "tran_id": tran_ids.gather(startseq[keep]),
+            "start": startposition[keep] - 2,
+            "stop": stopposition[keep],
+            "length": length[keep],
+            "startorf": decode_codons(startcodes[keep]),
+            "stoporf": decode_codons(stopcode[keep]),
+        },
+        schema={**ORFCOLUMNS, "tran_id": tran_ids.dtype},
+    )
+    return orfs
+
+
+def transcript_keys(tran_ids, firstkey=0):
+    """
+    Numbers transcripts with integer keys.
+
+    Parameters:
+    - tran_ids (list): Transcript IDs.
+    - firstkey (int, optional): Key of the first transcript. Defaults to 0.
+
+    Returns:
+    - DataFrame: A polars DataFrame with the columns 'tran_key' (UInt32) and 'tran_id', one row per transcript,
+      with consecutive keys in the order of `tran_ids`.
+    """
+    return pl.DataFrame(
+        {
+            "tran_key": pl.int_range(firstkey, firstkey + len(tran_ids), dtype=pl.UInt32, eager=True),
+            "tran_id": pl.Series(tran_ids, dtype=pl.String),
+        }
+    )
+
+
+def compact_orfs(orfs):
+    """
+    Converts ORFs whose 'tran_id' column holds integer keys to the columns of `CANDIDATECOLUMNS`.
+
+    Parameters:
+    - orfs (DataFrame): ORFs with the columns of `ORFCOLUMNS`, as returned by `find_orfs_batch` for the keys
+      of `transcript_keys` instead of transcript IDs.
+
+    Returns:
+    - DataFrame: The ORFs with the columns of `CANDIDATECOLUMNS`.
+
+    The transcript IDs are stored once per transcript by `transcript_keys`, and the few different codons once
+    per chunk as categories, so every ORF only takes a few fixed-size integers.
+    """
+    return orfs.rename({"tran_id": "tran_key"}).cast(CANDIDATECOLUMNS)
+
+
+def restore_orfs(orfs, transcripts):
+    """
+    Restores the transcript IDs and the string columns of compact ORFs, for output.
+
+    Parameters:
+    - orfs (DataFrame or LazyFrame): ORFs with the columns of `CANDIDATECOLUMNS`, and optionally more columns
+      such as the ORF 'type'.
+    - transcripts (DataFrame): The transcript keys, see `transcript_keys`.
+
+    Returns:
+    - DataFrame or LazyFrame: The ORFs with the 'tran_id' column in place of 'tran_key', and the categorical
+      columns as strings, in the same order.
+    """
+    if isinstance(orfs, pl.LazyFrame):
+        transcripts = transcripts.lazy()
+    categories = [column for column in ["startorf", "stoporf", "type"] if column in orfs.columns]
+    return (
+        orfs.join(transcripts, on="tran_key", how="left")
+        .select("tran_id", pl.all().exclude("tran_key", "tran_id"))
+        .with_columns(pl.col(categories).cast(pl.String))
+    )
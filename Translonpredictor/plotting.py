@@ -7,18 +7,18 @@ import pyBigWig as bw
 import plotly.graph_objects as go
 
 from .bigwigtodf import transcriptreads
+from .transcriptmodels import TranscriptModelStore
 from .report import generate_report
 
 
-def pertranscriptplot(df, exon_df, bwfile):
+def pertranscriptplot(df, store, bwfile):
     """
     Generate plots and tables summarizing features and read counts for top ORFs of each type per transcript.
 
     Parameters:
     - df (DataFrame): Pandas DataFrame containing ORF information, including columns like 'tran_id', 'start', 'stop',
                      'length', 'startorf', 'stoporf', 'type', 'rise_up', 'step_down', 'hrf', 'avg', 'nzc', 'score'.
-    - exon_df (DataFrame): Pandas DataFrame containing exon information, with columns including 'tran_id', 'start',
-                           'stop', 'tran_start', 'tran_stop'.
+    - store (TranscriptModelStore): Exons of the transcripts, see `transcriptmodels.TranscriptModelStore`.
     - bwfile (str): Path to the BigWig file used for obtaining transcript read counts.
 
     Returns:
@@ -29,7 +29,7 @@ def pertranscriptplot(df, exon_df, bwfile):
 
     This function generates plots and tables summarizing features and read counts for top ORFs of each type per transcript.
     It iterates over each ORF type in the input DataFrame `df`, filters the top 10 ORFs based on the 'score' column, and
-    retrieves corresponding exon information from `exon_df`.
+    retrieves the exons of their transcripts from `store`.
 
     For each top ORF, it calculates transcript read counts using the `transcriptreads` function with data from `bwfile`.
     It then creates:
@@ -52,10 +52,9 @@ def pertranscriptplot(df, exon_df, bwfile):
         dflist = []
         for row in range(len(df_type_filtered)):
             tran = df_type_filtered["tran_id"][row]
-            exons = exon_df.filter(pl.col("tran_id") == tran)
-            if exons.is_empty():
+            if tran not in store:
                 continue
-            tran_reads = transcriptreads(bwfile, exons)
+            tran_reads = transcriptreads(bwfile, store, tran)
             if not tran_reads.is_empty():
                 coordinates = tran_reads.group_by("tran_start").agg(
                     pl.col("counts").sum()
@@ -132,7 +131,7 @@ def pertranscriptplot(df, exon_df, bwfile):
     return summary_plot, table, pertranlist
 
 
-def metageneplot(df, bwfile, exon_df, range_list):
+def metageneplot(df, bwfile, store, range_list):
     """
     Generate metagene plots for each type of ORF based on transcript read counts relative to exon coordinates.
 
@@ -140,8 +139,7 @@ def metageneplot(df, bwfile, exon_df, range_list):
     - df (DataFrame): Pandas DataFrame containing ORF information, including columns like 'tran_id', 'start', 'stop',
                      'type'.
     - bwfile (str): Path to the BigWig file used for obtaining transcript read counts.
-    - exon_df (DataFrame): Pandas DataFrame containing exon information, with columns including 'tran_id', 'start',
-                           'stop', 'tran_start', 'tran_stop'.
+    - store (TranscriptModelStore): Exons of the transcripts, see `transcriptmodels.TranscriptModelStore`.
     - range_list (list): List of integers representing the range of relative coordinates around exon boundaries
                          for plotting metagene profiles.
 
@@ -155,7 +153,7 @@ def metageneplot(df, bwfile, exon_df, range_list):
     For each ORF type:
     - It initializes dictionaries (`metagene_start_dict` and `metagene_stop_dict`) to accumulate counts of start and stop
       positions relative to exon boundaries within the specified `range_list`.
-    - For each transcript associated with the current ORF type, it retrieves exon information from `exon_df` and calculates
+    - For each transcript associated with the current ORF type, it retrieves the exons of the transcript from `store` and calculates
       transcript read counts using the `transcriptreads` function with data from `bwfile`.
     - It generates metagene profiles (`start_dict` and `stop_dict`) by aggregating read counts of start and stop positions
       relative to exon boundaries across all transcripts of the current ORF type.
@@ -175,10 +173,9 @@ def metageneplot(df, bwfile, exon_df, range_list):
         metagene_stop_dict = {i: 0 for i in range_list}
         for tran in df_type_filtered["tran_id"].unique():
             df_tran = df_type_filtered.filter(pl.col("tran_id") == tran)
-            exons = exon_df.filter(pl.col("tran_id") == tran)
-            if exons.is_empty():
+            if tran not in store:
                 continue
-            tran_reads = transcriptreads(bwfile, exons)
+            tran_reads = transcriptreads(bwfile, store, tran)
             if not tran_reads.is_empty():
                 starts = df_tran.get_column("start").to_list()
                 stops = df_tran.get_column("stop").to_list()
@@ -279,8 +276,8 @@ def plottop10(df, bigwig, exon, range_param, filename, parameters):
        plotting metagene profiles.
     2. Reads ORF data from the CSV file (`df`) into a Pandas DataFrame (`df`).
     3. Opens the BigWig file (`bigwig`) to obtain transcript read counts (`bwfile`).
-    4. Reads exon information from the CSV file (`exon`) into a Pandas DataFrame (`exon_df`). Splits certain columns
-       ('start', 'stop', 'tran_start', 'tran_stop') into lists of integers using `apply` and `split`.
+    4. Reads exon information from the CSV file (`exon`) into a `TranscriptModelStore` (`store`), which holds the
+       exon coordinates of all transcripts in integer arrays.
     5. Calls the `metageneplot` function to generate metagene profiles (`plotlist`) for each type of ORF based on
        transcript read counts relative to exon coordinates.
     6. Calls the `pertranscriptplot` function to generate individual transcript plots (`tranplot`), a summary table
@@ -294,14 +291,11 @@ def plottop10(df, bigwig, exon, range_param, filename, parameters):
     range_list = list(range(-range_param, range_param + 1))
     df = pl.read_csv(df, has_header=True, separator=",")
     bwfile = bw.open(bigwig)
-    exon_df = pl.read_csv(exon, has_header=True, separator=",")
-    exon_df = exon_df.with_columns(
-        pl.col("start", "stop", "tran_start", "tran_stop").apply(lambda x: x.split(","))
-    )
+    store = TranscriptModelStore.fromexonfile(exon)
 
-    plotlist = metageneplot(df, bwfile, exon_df, range_list)
+    plotlist = metageneplot(df, bwfile, store, range_list)
 
-    tranplot, table, pertranscript = pertranscriptplot(df, exon_df, bwfile)
+    tranplot, table, pertranscript = pertranscriptplot(df, store, bwfile)
     generate_report(plotlist, tranplot, parameters, table, filename, pertranscript)
 
     return
@@ -1,29 +1,363 @@
+import os
+import hashlib
 import pysam
 import polars as pl
 import oxbow as ox
 
+# Number of rows of an ORFs file read at once by `readorfs`
+ORFREADBATCH = 100_000
 
-def readbam(bampath):
+
+def cachedindex(bampath, indexdir):
+    """
+    Determines the path of the index of a BAM file in the index cache directory.
+
+    Parameters:
+    - bampath (str): Path to the BAM file.
+    - indexdir (str): Directory in which indexes are cached by `indexbam`.
+
+    Returns:
+    - str: Path of the cached '.bai' index.
+
+    BAM files of different samples often have the same name (e.g. 'Aligned.sortedByCoord.out.bam'),
+    so the cached index is named after a hash of the absolute path, the size and the modification
+    time of the BAM file. An index cached for another BAM file, or for an older version of the
+    same BAM file, therefore never matches.
+    """
+    stat = os.stat(bampath)
+    key = f"{os.path.abspath(bampath)}\0{stat.st_size}\0{stat.st_mtime_ns}"
+    digest = hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+    return os.path.join(indexdir, f"{os.path.basename(bampath)}.{digest}.bai")
+
+
+def findindex(bampath, indexdir=None):
+    """
+    Finds an existing index of a BAM file that is at least as recent as the BAM file itself.
+
+    Parameters:
+    - bampath (str): Path to the BAM file.
+    - indexdir (str, optional): Directory in which an index may have been cached by `indexbam`.
+
+    Returns:
+    - str: Path to a fresh '.bai' or '.csi' index, or None if there is none.
+
+    The index is looked for next to the BAM file ('sample.bam.bai', 'sample.bai',
+    'sample.bam.csi') and, if `indexdir` is given, under the name of `cachedindex`. An index
+    that is older than the BAM file is ignored.
+    """
+    candidates = [
+        f"{bampath}.bai",
+        f"{os.path.splitext(bampath)[0]}.bai",
+        f"{bampath}.csi",
+    ]
+    if indexdir:
+        candidates.append(cachedindex(bampath, indexdir))
+    bamtime = os.path.getmtime(bampath)
+    for indexpath in candidates:
+        if os.path.isfile(indexpath) and os.path.getmtime(indexpath) >= bamtime:
+            return indexpath
+    return None
+
+
+def indexbam(bampath, threads=1, indexdir=None):
+    """
+    Indexes a given BAM file using pysam, unless a fresh index already exists.
+
+    Parameters:
+    - bampath (str): Path to the coordinate sorted BAM file to be indexed.
+    - threads (int): Number of threads used by samtools to build the index. Default is 1.
+    - indexdir (str, optional): Directory for the index when the directory of the BAM file
+      is not writable. Default is '~/.cache/Translonpredictor'.
+
+    Returns:
+    - str: Path to the index file.
+
+    An existing '.bai' or '.csi' index that is at least as recent as the BAM file is reused
+    (see `findindex`). Otherwise the index is built next to the BAM file. Only if the directory
+    of the BAM file is read-only is the index looked for and built in `indexdir`, see `cachedindex`.
+
+    Example:
+        indexpath = indexbam("sample.bam", threads=8)
+    """
+    bamdir = os.path.dirname(os.path.abspath(bampath))
+    if os.access(bamdir, os.W_OK):
+        indexpath = findindex(bampath)
+        if indexpath:
+            return indexpath
+        indexpath = f"{bampath}.bai"
+    else:
+        if indexdir is None:
+            indexdir = os.path.join(os.path.expanduser("~"), ".cache", "Translonpredictor")
+        indexpath = findindex(bampath, indexdir)
+        if indexpath:
+            return indexpath
+        os.makedirs(indexdir, exist_ok=True)
+        indexpath = cachedindex(bampath, indexdir)
+    pysam.index("-@", str(threads), bampath, indexpath)
+    return indexpath
+
+
+def readrecords(bamfile, columns=None, filters=None):
+    """
+    Reads BAM records from an Arrow IPC buffer, keeping only the requested columns.
+
+    Parameters:
+    - bamfile (bytes): Arrow IPC buffer as returned by the oxbow BAM readers.
+    - columns (list, optional): Names of the columns to return. All columns are returned if not provided.
+    - filters (dict, optional): Filters applied to the records while they are read. Supported keys:
+      - "mapq" (int): Minimum mapping quality.
+      - "flagmask" (int): Records with any of these flag bits set are removed.
+      - "minlength" (int): Minimum read length ('end' - 'pos').
+      - "maxlength" (int): Maximum read length ('end' - 'pos').
+
+    Returns:
+    - df (DataFrame): Polars DataFrame containing the filtered records and requested columns.
+
+    Only the requested columns and the columns needed to evaluate the filters are read from
+    the buffer into the DataFrame. This is a column selection after decoding: oxbow has already
+    decoded every field, including 'seq', 'qual', 'cigar' and 'tags', into the buffer, so it
+    does not save decoding time, only the memory of the unused DataFrame columns. The filters
+    are applied straight after reading, before any of the records are handed to downstream
+    processing.
+
+    Example:
+        df = readrecords(ox.read_bam("sample.bam"), ["qname", "rname", "pos", "end"], {"mapq": 10})
+    """
+    filters = filters or {}
+    conditions = []
+    filtercolumns = []
+    if filters.get("mapq"):
+        conditions.append(pl.col("mapq") >= filters["mapq"])
+        filtercolumns.append("mapq")
+    if filters.get("flagmask"):
+        conditions.append((pl.col("flag") & filters["flagmask"]) == 0)
+        filtercolumns.append("flag")
+    if filters.get("minlength") is not None:
+        conditions.append((pl.col("end") - pl.col("pos")) >= filters["minlength"])
+        filtercolumns.extend(["pos", "end"])
+    if filters.get("maxlength") is not None:
+        conditions.append((pl.col("end") - pl.col("pos")) <= filters["maxlength"])
+        filtercolumns.extend(["pos", "end"])
+
+    if columns is None:
+        df = pl.read_ipc(bamfile)
+    else:
+        readcolumns = list(dict.fromkeys(list(columns) + filtercolumns))
+        df = pl.read_ipc(bamfile, columns=readcolumns)
+    if conditions:
+        df = df.filter(pl.all_horizontal(conditions))
+    if columns is not None:
+        df = df.select(columns)
+    return df
+
+
+def readoxbow(reader, bampath, index, *args, **kwargs):
+    """
+    Calls an oxbow BAM reader so that it uses the given index.
+
+    Parameters:
+    - reader (function): The oxbow reader, e.g. ox.read_bam or ox.read_bam_vpos.
+    - bampath (str): Path to the BAM file.
+    - index (str): Path to the index of the BAM file.
+    - *args, **kwargs: Further arguments passed to the reader.
+
+    Returns:
+    - bytes: Arrow IPC buffer returned by the reader.
+
+    oxbow only looks for an index next to a BAM file that is given as a path. An index
+    stored elsewhere (e.g. in the cache directory of `indexbam`) is therefore passed
+    together with the BAM file as file objects.
+    """
+    if index is None or index in (f"{bampath}.bai", f"{bampath}.csi"):
+        return reader(bampath, *args, **kwargs)
+    with open(bampath, "rb") as bamfile, open(index, "rb") as indexfile:
+        return reader(bamfile, *args, index=indexfile, **kwargs)
+
+
+def readbam(bampath, columns=None, filters=None, threads=1, indexdir=None):
     """
     Reads a given BAM file, extracts relevant information, and returns it as a DataFrame.
 
     Parameters:
     - bampath (str): Path to the BAM file to be processed.
+    - columns (list, optional): Names of the columns to keep, see `readrecords`.
+    - filters (dict, optional): Filters applied while reading, see `readrecords`.
+    - threads (int): Number of threads used to build a missing index, see `indexbam`. Default is 1.
+    - indexdir (str, optional): Directory for the index if the directory of the BAM file is not
+      writable, see `indexbam`.
 
     Returns:
     - df (DataFrame): Polars DataFrame containing the extracted information from the BAM file.
 
-    This function indexes the BAM file using pysam, reads the indexed file using ox.read_bam,
-    and then reads the data into a DataFrame using pl.read_ipc. The DataFrame containing the
-    relevant information extracted from the BAM file is returned for further processing.
+    ox.read_bam needs an index, so this function first reuses a fresh index or builds one with
+    `indexbam`. It then reads the BAM file using ox.read_bam, and reads the requested columns
+    into a DataFrame using `readrecords`. The DataFrame containing the relevant information
+    extracted from the BAM file is returned for further processing.
     """
-    pysam.index(bampath)
-    bamfile = ox.read_bam(bampath)
-    df = pl.read_ipc(bamfile)
+    index = indexbam(bampath, threads, indexdir)
+    bamfile = readoxbow(ox.read_bam, bampath, index)
+    df = readrecords(bamfile, columns, filters)
     return df
 
 
-"""def readofst(ofstpath):
-        docstring
+def readbambatches(bampath, batchsize=None, columns=None, filters=None, index=None):
+    """
+    Reads a given BAM file in batches so that only one batch is held in memory at a time.
+
+    Parameters:
+    - bampath (str): Path to the BAM file to be processed.
+    - batchsize (int, optional): Approximate size of each batch in compressed BAM bytes.
+      If not provided, the BAM file is read one reference sequence at a time.
+    - columns (list, optional): Names of the columns to keep, see `readrecords`.
+    - filters (dict, optional): Filters applied while reading, see `readrecords`.
+    - index (str, optional): Path to the index of the BAM file. Created with `indexbam` if not provided.
+
+    Yields:
+    - df (DataFrame): Polars DataFrame containing the records of one batch, with the same
+      columns as returned by `readbam`.
+
+    This function indexes the BAM file using `indexbam` if no index is provided. Without a batch size, every reference
+    sequence that has mapped reads is read separately using the region query of ox.read_bam.
+    With a batch size, the index is partitioned into chunks of virtual file offsets using
+    ox.partition_from_index_file and each chunk is read with ox.read_bam_vpos. Peak memory
+    therefore depends on the size of a batch rather than on the size of the library.
+
+    Example:
+        for df in readbambatches("sample.bam", batchsize=50_000_000):
+            ...
+    """
+    if index is None:
+        index = indexbam(bampath)
+    if batchsize:
+        partitions = ox.partition_from_index_file(index, batchsize)
+        for pos_lo, pos_hi in zip(partitions[:-1], partitions[1:]):
+            bamfile = readoxbow(ox.read_bam_vpos, bampath, index, pos_lo, pos_hi)
+            df = readrecords(bamfile, columns, filters)
+            if not df.is_empty():
+                yield df
+    else:
+        for contig in bamcontigs(bampath, index):
+            yield readbamregion(bampath, contig, columns, filters, index)
+
+
+def bamcontigs(bampath, index=None):
+    """
+    Lists the reference sequences of an indexed BAM file that have mapped reads.
+
+    Parameters:
+    - bampath (str): Path to the indexed BAM file.
+    - index (str, optional): Path to the index if it is not stored next to the BAM file.
+
+    Returns:
+    - list: Names of the reference sequences with at least one mapped read, in header order.
+    """
+    with pysam.AlignmentFile(bampath, "rb", index_filename=index) as bamfile:
+        contigs = [
+            stat.contig for stat in bamfile.get_index_statistics() if stat.mapped > 0
+        ]
+    return contigs
+
+
+def readbamregion(bampath, region, columns=None, filters=None, index=None):
+    """
+    Reads the records of one region of an indexed BAM file into a DataFrame.
+
+    Parameters:
+    - bampath (str): Path to the indexed BAM file.
+    - region (str): Region to read, e.g. a reference sequence name or 'chr1:1000-2000'.
+    - columns (list, optional): Names of the columns to keep, see `readrecords`.
+    - filters (dict, optional): Filters applied while reading, see `readrecords`.
+    - index (str, optional): Path to the index if it is not stored next to the BAM file.
+
+    Returns:
+    - df (DataFrame): Polars DataFrame with the same columns as returned by `readbam`.
+    """
+    bamfile = readoxbow(ox.read_bam, bampath, index, region=region)
+    df = readrecords(bamfile, columns, filters)
+    return df
 
-        """
+
+def readofst(ofstpath):
+    """
+    Reads the A-site offset of every read length from a file.
+
+    Parameters:
+    - ofstpath (str): Path to a tab-separated file with the columns 'length' and 'offset', as
+      written by `filewriter.saveoffsets`.
+
+    Returns:
+    - dict: Dictionary containing the offset for each read length.
+
+    Example:
+        offsets = readofst("sample_offsets.tsv")
+    """
+    offset_df = pl.read_csv(
+        ofstpath, separator="\t", dtypes={"length": pl.Int64, "offset": pl.Int64}
+    )
+    return dict(zip(offset_df["length"].to_list(), offset_df["offset"].to_list()))
+
+
+def readorfs(orfs, batchsize=ORFREADBATCH):
+    """
+    Reads the ORFs of a file transcript by transcript.
+
+    Parameters:
+    - orfs (str): Path to a CSV file with ORFs, such as the annotated ORFs written by
+      `filewriter.saveorfsandexons`.
+    - batchsize (int): Approximate number of rows read at once. Default is `ORFREADBATCH`.
+
+    Yields:
+    - tuple: A transcript ID and a DataFrame with its ORFs. The coordinates 'start', 'stop' and
+      'length' are Int32, and the codons and ORF types are categories.
+
+    The file is read in batches, so only a batch of ORFs is held in memory. The ORFs of a
+    transcript that continue in the next batch are held back until that batch is read. If the
+    ORFs of a transcript are not consecutive in the file, the transcript is yielded once for
+    every batch it occurs in.
+
+    Example:
+        for tran, orf_df in readorfs("sample_annotated_orfs.csv"):
+            print(tran, orf_df.height)
+    """
+    # the batched reader fails on partial dtypes, so every column is read as a string and
+    # the coordinates are cast afterwards
+    reader = pl.read_csv_batched(orfs, batch_size=batchsize, infer_schema_length=0)
+    rest = None
+    while True:
+        batches = reader.next_batches(1)
+        if not batches:
+            break
+        batch = batches[0] if rest is None else pl.concat([rest, batches[0]])
+        # the last transcript of the batch may continue in the next batch
+        ids = batch["tran_id"]
+        last = ids.ne_missing(ids.shift(1)).arg_true()[-1]
+        batch, rest = batch[:last], batch[last:]
+        for orf_df in compactorfs(batch).partition_by("tran_id", maintain_order=True):
+            yield orf_df["tran_id"][0], orf_df
+    if rest is not None and not rest.is_empty():
+        yield rest["tran_id"][0], compactorfs(rest)
+
+
+def compactorfs(orf_df):
+    """
+    Casts the columns of ORFs read as strings to compact types.
+
+    Parameters:
+    - orf_df (DataFrame): ORFs with string columns.
+
+    Returns:
+    - DataFrame: The ORFs with Int32 coordinates ('start', 'stop' and 'length') and categorical
+      codons and ORF types ('startorf', 'stoporf' and 'type'), as far as these columns exist.
+    """
+    return orf_df.with_columns(
+        [
+            pl.col(column).cast(pl.Int32)
+            for column in ["start", "stop", "length"]
+            if column in orf_df.columns
+        ]
+        + [
+            pl.col(column).cast(pl.Categorical)
+            for column in ["startorf", "stoporf", "type"]
+            if column in orf_df.columns
+        ]
+    )
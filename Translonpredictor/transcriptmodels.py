@@ -0,0 +1,272 @@
+"""This script contains the transcript model store, which holds the exon structure of all transcripts in numpy arrays"""
+
+import numpy as np
+import polars as pl
+
+# Distance between transcripts when the exons of all transcripts are placed on one integer axis
+TRANSCRIPTSHIFT = 2**32
+
+# Integer codes of the strands
+STRANDS = {"+": 1, "-": -1}
+
+
+class TranscriptModelStore:
+    """
+    Stores the exons of all transcripts in compressed sparse row (CSR) numpy arrays.
+
+    The exons of transcript i are the entries offsets[i] to offsets[i + 1] of the exon arrays
+    'start', 'stop', 'tran_start' and 'tran_stop', in the order of the annotation. Every
+    transcript has a chromosome code (an index into 'chroms') and a strand code (1 for '+',
+    -1 for '-', 0 if unknown). Exon boundaries use the same coordinates as the exon DataFrame
+    of `findexonscds.getexons_and_cds`.
+
+    Positions are converted between the genome and the transcripts for many transcripts at
+    once, without any Python lists per transcript. On the negative strand, transcript positions
+    increase towards the genomic start of an exon, see `exontotranscript`. Transcripts with an
+    unknown strand are converted as if they were on the positive strand.
+
+    Example:
+        store = TranscriptModelStore.fromexonfile("sample_exons.csv")
+        tranidx = store.transcriptindex(["ENST00000456328"] * 2)
+        store.genometotranscript(tranidx, np.array([12010, 12700]))
+    """
+
+    def __init__(
+        self, transcripts, chroms, chrcode, strand, offsets, start, stop, tran_start, tran_stop
+    ):
+        self.transcripts = list(transcripts)
+        self.chroms = list(chroms)
+        self.chrcode = np.asarray(chrcode, dtype=np.int32)
+        self.strand = np.asarray(strand, dtype=np.int8)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.start = np.asarray(start, dtype=np.int64)
+        self.stop = np.asarray(stop, dtype=np.int64)
+        self.tran_start = np.asarray(tran_start, dtype=np.int64)
+        self.tran_stop = np.asarray(tran_stop, dtype=np.int64)
+        self.positions = {tran: idx for idx, tran in enumerate(self.transcripts)}
+
+        # transcript of every exon, and the exons sorted on transcript and genomic start
+        self.exontran = np.repeat(
+            np.arange(len(self.transcripts), dtype=np.int64), np.diff(self.offsets)
+        )
+        self.order = np.lexsort((self.start, self.exontran))
+        self.keys = (self.exontran * TRANSCRIPTSHIFT + self.start)[self.order]
+
+    @classmethod
+    def fromexons(cls, exon_df):
+        """
+        Builds the store from an exon DataFrame with one row per transcript.
+
+        Parameters:
+            exon_df (polars.DataFrame): DataFrame with the columns 'tran_id', 'chr', 'start', 'stop',
+                                        'tran_start' and 'tran_stop', as returned by
+                                        `findexonscds.getexons_and_cds`. 'chr' is either a string or
+                                        a list with the chromosome of every exon, and an optional
+                                        'strand' column is used in the same way.
+
+        Returns:
+            TranscriptModelStore: The store containing the exons of every row of `exon_df`.
+        """
+        columns = ["start", "stop", "tran_start", "tran_stop"]
+        # the chromosome and strand of a transcript are those of its first exon
+        transcripts = exon_df.select(
+            ["tran_id"]
+            + [
+                pl.col(column).list.first() if exon_df.schema[column] == pl.List else pl.col(column)
+                for column in ["chr", "strand"]
+                if column in exon_df.columns
+            ]
+        )
+        chroms = transcripts.select("chr").unique(maintain_order=True)["chr"].cast(pl.String)
+        chrcode = (
+            transcripts.select(pl.col("chr").cast(pl.String))
+            .join(chroms.to_frame().with_row_index("chrcode"), on="chr", how="left")["chrcode"]
+        )
+        if "strand" in transcripts.columns:
+            strand = transcripts["strand"].replace(STRANDS, default=0, return_dtype=pl.Int8)
+        else:
+            strand = np.zeros(transcripts.height, dtype=np.int8)
+
+        lengths = exon_df.select(pl.col("start").list.len())["start"].to_numpy()
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        exons = exon_df.select(columns).explode(columns).cast(pl.Int64)
+        return cls(
+            transcripts["tran_id"].to_list(),
+            chroms.to_list(),
+            chrcode.to_numpy(),
+            strand,
+            offsets,
+            *[exons[column].to_numpy() for column in columns],
+        )
+
+    @classmethod
+    def fromexonfile(cls, exon):
+        """
+        Builds the store from an exons file written by `filewriter.saveorfsandexons`.
+
+        Parameters:
+            exon (str): Path to the CSV file containing exon annotations, with the exon
+                        coordinates of every transcript joined by commas. The strands are read
+                        from the 'strand' column, files without it get strand 0.
+
+        Returns:
+            TranscriptModelStore: The store containing the exons of every transcript in the file.
+        """
+        columns = ["start", "stop", "tran_start", "tran_stop"]
+        exon_df = pl.read_csv(
+            exon, has_header=True, separator=",", dtypes={column: pl.String for column in columns}
+        ).with_columns(pl.col(columns).str.split(",").cast(pl.List(pl.Int64)))
+        return cls.fromexons(exon_df)
+
+    def __len__(self):
+        return len(self.transcripts)
+
+    def __contains__(self, tran):
+        return tran in self.positions
+
+    def transcriptindex(self, tran_ids):
+        """
+        Looks up the index of transcripts in the store.
+
+        Parameters:
+            tran_ids (list): Transcript IDs.
+
+        Returns:
+            numpy.ndarray: The index of every transcript, -1 for transcripts that are not in the store.
+        """
+        return np.array([self.positions.get(tran, -1) for tran in tran_ids], dtype=np.int64)
+
+    def chrom(self, tranidx):
+        """Returns the chromosome name of the transcript with index `tranidx`."""
+        return self.chroms[self.chrcode[tranidx]]
+
+    def exons(self, tranidx):
+        """
+        Returns the exons of one transcript.
+
+        Parameters:
+            tranidx (int): Index of the transcript.
+
+        Returns:
+            numpy.ndarray: The indices of the exons of the transcript in the exon arrays.
+        """
+        return np.arange(self.offsets[tranidx], self.offsets[tranidx + 1])
+
+    def findexons(self, tranidx, positions):
+        """
+        Finds the exons that contain genomic positions.
+
+        Parameters:
+            tranidx (numpy.ndarray): Index of the transcript of every position.
+            positions (numpy.ndarray): Genomic positions.
+
+        Returns:
+            numpy.ndarray: Index of the exon of the transcript that contains every position
+                           (start <= position <= stop), -1 if no exon contains the position.
+        """
+        tranidx = np.asarray(tranidx, dtype=np.int64)
+        positions = np.asarray(positions, dtype=np.int64)
+        if not len(self.keys):
+            return np.full(len(positions), -1, dtype=np.int64)
+        found = np.searchsorted(self.keys, tranidx * TRANSCRIPTSHIFT + positions, side="right") - 1
+        exonidx = self.order[np.maximum(found, 0)]
+        valid = (
+            (found >= 0)
+            & (tranidx >= 0)
+            & (self.exontran[exonidx] == tranidx)
+            & (self.stop[exonidx] >= positions)
+        )
+        return np.where(valid, exonidx, -1)
+
+    def exontotranscript(self, exonidx, positions, end=False, reverse=False):
+        """
+        Converts genomic positions within known exons to transcript positions.
+
+        Parameters:
+            exonidx (numpy.ndarray): Index of the exon of every position.
+            positions (numpy.ndarray): Genomic positions.
+            end (bool): Count from the stop of the exon instead of its start, as for the stop of a
+                        read or interval. Default is False.
+            reverse (bool): Count in the opposite direction, as for transcripts on the negative
+                            strand. Default is False.
+
+        Returns:
+            numpy.ndarray: The transcript positions.
+
+        Without `reverse`, a position is 'tran_start + (position - start)' of its exon, or
+        'tran_stop - (stop - position)' with `end`. With `reverse`, it is
+        'tran_stop - (position - start)', or 'tran_start + (stop - position)' with `end`.
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        if not reverse and not end:
+            return self.tran_start[exonidx] + (positions - self.start[exonidx])
+        if not reverse:
+            return self.tran_stop[exonidx] - (self.stop[exonidx] - positions)
+        if not end:
+            return self.tran_stop[exonidx] - (positions - self.start[exonidx])
+        return self.tran_start[exonidx] + (self.stop[exonidx] - positions)
+
+    def isreverse(self, tranidx):
+        """Returns whether the transcripts with index `tranidx` are on the negative strand."""
+        return self.strand[np.maximum(tranidx, 0)] == STRANDS["-"] if len(self.strand) else False
+
+    def genometotranscript(self, tranidx, positions, end=False):
+        """
+        Converts genomic positions to transcript positions.
+
+        Parameters:
+            tranidx (numpy.ndarray): Index of the transcript of every position.
+            positions (numpy.ndarray): Genomic positions.
+            end (bool): Convert the positions as stops, see `exontotranscript`. Default is False.
+
+        Returns:
+            numpy.ndarray: The transcript positions, -1 for positions outside the exons of their transcript.
+
+        Positions on transcripts on the negative strand are converted with `reverse`, see
+        `exontotranscript`.
+        """
+        tranidx = np.asarray(tranidx, dtype=np.int64)
+        exonidx = self.findexons(tranidx, positions)
+        exonidx, found = np.maximum(exonidx, 0), exonidx >= 0
+        converted = np.where(
+            self.isreverse(tranidx),
+            self.exontotranscript(exonidx, positions, end, reverse=True),
+            self.exontotranscript(exonidx, positions, end),
+        )
+        return np.where(found, converted, -1)
+
+    def transcripttogenome(self, tranidx, positions):
+        """
+        Converts transcript positions to genomic positions.
+
+        Parameters:
+            tranidx (numpy.ndarray): Index of the transcript of every position.
+            positions (numpy.ndarray): Transcript positions.
+
+        Returns:
+            numpy.ndarray: The genomic positions, -1 for positions outside their transcript.
+
+        A transcript position is 'start + (position - tran_start)' of the exon that contains it,
+        or 'start + (tran_stop - position)' on the negative strand, the inverse of
+        `genometotranscript`.
+        """
+        tranidx = np.asarray(tranidx, dtype=np.int64)
+        positions = np.asarray(positions, dtype=np.int64)
+        # the transcript coordinates increase along the exons of a transcript
+        keys = self.exontran * TRANSCRIPTSHIFT + self.tran_start
+        if not len(keys):
+            return np.full(len(positions), -1, dtype=np.int64)
+        found = np.searchsorted(keys, tranidx * TRANSCRIPTSHIFT + positions, side="right") - 1
+        exonidx = np.maximum(found, 0)
+        valid = (
+            (found >= 0)
+            & (tranidx >= 0)
+            & (self.exontran[exonidx] == tranidx)
+            & (self.tran_stop[exonidx] >= positions)
+        )
+        converted = np.where(
+            self.isreverse(tranidx),
+            self.start[exonidx] + (self.tran_stop[exonidx] - positions),
+            self.start[exonidx] + (positions - self.tran_start[exonidx]),
+        )
+        return np.where(valid, converted, -1)
@@ -0,0 +1,114 @@
+import pytest
+
+from Translonpredictor.batch import readsamplesheet
+
+#########################################################################################################################################
+#test readsamplesheet
+def test_readsamplesheet(tmp_path):
+    sheet = tmp_path / "samples.tsv"
+    sheet.write_text("sample\tbam\tbigwig\nliver\tliver.bam\t\nbrain\t\tbrain.bw\n")
+    assert readsamplesheet(str(sheet)) == [
+        {"sample": "liver", "bam": "liver.bam", "bigwig": None, "offsets": None},
+        {"sample": "brain", "bam": None, "bigwig": "brain.bw", "offsets": None},
+    ]
+
+#test that samples without reads are rejected
+def test_readsamplesheet_missing(tmp_path):
+    sheet = tmp_path / "samples.tsv"
+    sheet.write_text("sample\tbam\nliver\tliver.bam\nbrain\t\n")
+    with pytest.raises(Exception):
+        readsamplesheet(str(sheet))
+
+#########################################################################################################################################
+import os
+import random
+import pysam
+
+from Translonpredictor.batch import preparecandidates, runbatch
+
+#test data, an annotation with a coding transcript on either strand and their sequences
+gtf = """chr1\tsrc\texon\t100\t200\t.\t+\t.\tgene_id "G1"; transcript_id "T1";
+chr1\tsrc\texon\t300\t400\t.\t+\t.\tgene_id "G1"; transcript_id "T1";
+chr1\tsrc\tCDS\t150\t200\t.\t+\t.\tgene_id "G1"; transcript_id "T1";
+chr1\tsrc\tCDS\t300\t350\t.\t+\t.\tgene_id "G1"; transcript_id "T1";
+chr2\tsrc\texon\t100\t300\t.\t-\t.\tgene_id "G2"; transcript_id "T2";
+chr2\tsrc\tCDS\t120\t250\t.\t-\t.\tgene_id "G2"; transcript_id "T2";
+"""
+random.seed(1)
+transcripts = {tran: "".join(random.choice("ACGT") for _ in range(length)) for tran, length in [("T1", 202), ("T2", 201)]}
+
+#writes a sorted BAM file without an index, with 28 nt reads starting at every 3rd position of the exons
+def writebam(path):
+    header = {"HD": {"VN": "1.6", "SO": "coordinate"}, "SQ": [{"SN": "chr1", "LN": 1000}, {"SN": "chr2", "LN": 500}]}
+    with pysam.AlignmentFile(path, "wb", header=header) as bamfile:
+        for chrom, starts in [("chr1", list(range(100, 170, 3)) + list(range(300, 370, 3))), ("chr2", range(100, 270, 3))]:
+            for start in starts:
+                read = pysam.AlignedSegment(bamfile.header)
+                read.query_name = f"read{chrom}{start}_x{start % 5 + 1}"
+                read.reference_name = chrom
+                read.reference_start = start
+                read.cigarstring = "28M"
+                read.query_sequence = "A" * 28
+                read.query_qualities = pysam.qualitystring_to_array("I" * 28)
+                read.set_tag("NH", 1)
+                bamfile.write(read)
+    return path
+
+#test that the samples of a batch are scored from unindexed BAM files in worker processes
+def test_runbatch(tmp_path):
+    (tmp_path / "ann.gtf").write_text(gtf)
+    (tmp_path / "transcripts.fa").write_text("".join(f">{tran}\n{sequence}\n" for tran, sequence in transcripts.items()))
+    (tmp_path / "chrom.sizes").write_text("chr1\t1000\nchr2\t500\n")
+    (tmp_path / "offsets.tsv").write_text("length\toffset\n28\t12\n")
+    samples = [
+        {"sample": "A", "bam": writebam(str(tmp_path / "A.bam")), "bigwig": None, "offsets": str(tmp_path / "offsets.tsv")},
+        {"sample": "B", "bam": writebam(str(tmp_path / "B.bam")), "bigwig": None, "offsets": None},
+    ]
+    outfilename = str(tmp_path / "batch")
+    orfs, exon = preparecandidates(None, str(tmp_path / "transcripts.fa"), str(tmp_path / "ann.gtf"), ["ATG"], ["TAA", "TAG", "TGA"], 0, 1000000, outfilename)
+    settings = {
+        "filters": {"mapq": 0, "flagmask": 0, "minlength": None, "maxlength": None},
+        "countpattern": "collapsed",
+        "streaming": False,
+        "batchsize": None,
+        "indexdir": None,
+        "offsetsample": None,
+        "writebedgraph": True,
+        "scoretype": False,
+        "sru_range": 15,
+        "range_param": 30,
+        "parameters": {},
+    }
+    scored = runbatch(samples, orfs, exon, str(tmp_path / "ann.gtf"), str(tmp_path / "chrom.sizes"), outfilename, settings, threads=2)
+    assert scored == {"A": f"{outfilename}_A_orfs_scored.csv", "B": f"{outfilename}_B_orfs_scored.csv"}
+    assert os.path.exists(str(tmp_path / "A.bam.bai")) and os.path.exists(str(tmp_path / "B.bam.bai"))
+    assert os.path.exists(f"{outfilename}_B_offsets.tsv")
+    assert (tmp_path / "batch_A.bedGraph").read_text().startswith("chr1\t")
+    assert (tmp_path / "batch_B.bedGraph").read_text().startswith("chr1\t")
+
+#########################################################################################################################################
+from Translonpredictor import batch
+
+#test that a failing sample is raised with its name and the traceback of the worker, and interrupts are not caught
+def test_scoresampleworker(monkeypatch):
+    def failing(sample, *args):
+        raise ValueError("no reads")
+    monkeypatch.setattr(batch, "scoresample", failing)
+    with pytest.raises(Exception) as error:
+        batch.scoresampleworker({"sample": "A"})
+    assert type(error.value) is Exception
+    assert "Sample A failed" in str(error.value)
+    assert "Traceback" in str(error.value) and "ValueError: no reads" in str(error.value)
+
+    def panicking(sample, *args):
+        import oxbow as ox
+        ox.read_bam(b"not a path")
+    monkeypatch.setattr(batch, "scoresample", panicking)
+    with pytest.raises(Exception, match="Sample A failed"):
+        batch.scoresampleworker({"sample": "A"})
+
+    def interrupted(sample, *args):
+        raise KeyboardInterrupt
+    monkeypatch.setattr(batch, "scoresample", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        batch.scoresampleworker({"sample": "A"})
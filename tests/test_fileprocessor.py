@@ -0,0 +1,294 @@
+import os
+import polars as pl
+import pyBigWig
+import polars.testing as plt
+
+from Translonpredictor.fileprocessor import mergecounts, asitecalc, readcounts, bamtranscript, exonindex, bamrelativetocds, change_point_analysis, beddftobigwig
+from Translonpredictor.filewriter import saveoffsets
+from Translonpredictor.readfiles import readofst
+from Translonpredictor.coordmap import buildcoordmap, savecoordmap, loadcoordmap, coordmapexons, getcoordmap
+from Translonpredictor.findexonscds import annotationcachepath
+
+#########################################################################################################################################
+#test data
+reads = pl.DataFrame(
+    {"chr": ["chr1", "chr1", "chr1", "chr2", "chr1"],
+    "start": [100, 100, 130, 100, 100],
+    "length": [28, 28, 29, 28, 30],
+    "count": [2, 3, 1, 4, 5]}
+)
+offsets = {28: 12, 29: 13, 30: 15}
+
+#########################################################################################################################################
+#test mergecounts
+def test_mergecounts():
+    merged = mergecounts([reads[:2], reads[2:]], ["chr", "start", "length"])
+    expected = reads.group_by("chr", "start", "length").agg(pl.col("count").sum())
+    plt.assert_frame_equal(merged, expected, check_row_order=False)
+
+#test that A-sites from merged partial counts equal A-sites from all reads at once
+def test_asitecalc_batches():
+    merged = mergecounts(
+        [reads[:1], reads[1:3], reads[3:]], ["chr", "start", "length"]
+    )
+    plt.assert_frame_equal(asitecalc(merged, offsets), asitecalc(reads, offsets))
+
+#test asitecalc, including lazy input and read lengths without an offset
+def test_asitecalc():
+    bed = asitecalc(reads, offsets)
+    assert bed.rows() == [("chr1", 112, 113, 5), ("chr1", 115, 116, 5), ("chr1", 143, 144, 1), ("chr2", 112, 113, 4)]
+    plt.assert_frame_equal(asitecalc(reads.lazy(), offsets).collect(), bed)
+    assert asitecalc(reads, {28: 12})["count"].sum() == 9
+
+#########################################################################################################################################
+#test data
+names = pl.DataFrame({"qname": ["r1_x15", "r2_x1", "r3", "r4_umicount=7"]})
+
+#test readcounts
+def test_readcounts():
+    assert names.with_columns(readcounts("collapsed"))["count"].to_list() == [15, 1, 1, 1]
+    assert names.with_columns(readcounts("none"))["count"].to_list() == [1, 1, 1, 1]
+    assert names.with_columns(readcounts(r"_umicount=(\d+)"))["count"].to_list() == [1, 1, 1, 7]
+
+#########################################################################################################################################
+#test data
+exons = pl.DataFrame(
+    {"chr": [["chr1", "chr1"], ["chr1"], ["chr2"]],
+    "tran_id": ["T1", "T2", "T3"],
+    "start": [[1000, 2000], [1000], [500]],
+    "stop": [[1500, 300000], [1500], [900]],
+    "tran_start": [[0, 501], [0], [0]],
+    "tran_stop": [[500, 298501], [500], [400]]}
+)
+bam = pl.DataFrame(
+    {"count": [1, 2, 3, 4],
+    "chr": ["chr1", "chr1", "chr1", "chr3"],
+    "start": [1100, 1490, 226000, 100],
+    "stop": [1128, 1510, 226028, 128],
+    "length": [28, 20, 28, 28]}
+)
+
+#test bamtranscript, including a read past the old 225 kb window boundary
+def test_bamtranscript():
+    result = bamtranscript(bam, exons).sort("tran_id", "start")
+    assert result["tran_id"].to_list() == ["T1", "T1", "T2"]
+    assert result["tran_start_bam"].to_list() == [100, 224501, 100]
+    assert result["tran_stop_bam"].to_list() == [128, 224529, 128]
+
+#test that a stored and memory-mapped coordinate map gives the same transcript coordinates
+def test_coordmap(tmp_path):
+    coordmap = loadcoordmap(savecoordmap(buildcoordmap(exons), str(tmp_path / "ann.coordmap")))
+    assert coordmapexons(coordmap, "chr2")["tran_id"].to_list() == ["T3"]
+    assert coordmapexons(coordmap, "chr3").is_empty()
+    result = bamtranscript(bam, None, exonindex(coordmap))
+    plt.assert_frame_equal(result, bamtranscript(bam, exons), check_row_order=False)
+
+#test data, an annotation with a coding transcript on either strand
+gtf = """chr1\tsrc\texon\t100\t200\t.\t+\t.\tgene_id "G1"; transcript_id "T1";
+chr1\tsrc\texon\t300\t400\t.\t+\t.\tgene_id "G1"; transcript_id "T1";
+chr1\tsrc\tCDS\t150\t200\t.\t+\t.\tgene_id "G1"; transcript_id "T1";
+chr1\tsrc\tCDS\t300\t350\t.\t+\t.\tgene_id "G1"; transcript_id "T1";
+chr2\tsrc\texon\t100\t300\t.\t-\t.\tgene_id "G2"; transcript_id "T2";
+chr2\tsrc\tCDS\t120\t250\t.\t-\t.\tgene_id "G2"; transcript_id "T2";
+"""
+
+#test that the coordinate map is stored in the compiled annotation of the annotation file
+def test_getcoordmap(tmp_path):
+    (tmp_path / "ann.gtf").write_text(gtf)
+    coordmap = getcoordmap(str(tmp_path / "ann.gtf"))
+    assert sorted(coordmap["transcripts"]) == ["T1", "T2"]
+    cachepath = annotationcachepath(str(tmp_path / "ann.gtf"))
+    assert sorted(os.listdir(tmp_path)) == ["ann.gtf", os.path.basename(cachepath)]
+    assert sorted(os.listdir(cachepath)) == ["cds.parquet", "coordmap", "exons.parquet"]
+    assert getcoordmap(str(tmp_path / "ann.gtf"))["transcripts"] == coordmap["transcripts"]
+
+#test that a new cache version compiles the annotation and its coordinate map again
+def test_annotationcacheversion(tmp_path, monkeypatch):
+    from Translonpredictor import findexonscds
+    (tmp_path / "ann.gtf").write_text(gtf)
+    getcoordmap(str(tmp_path / "ann.gtf"))
+    oldpath = annotationcachepath(str(tmp_path / "ann.gtf"))
+    monkeypatch.setattr(findexonscds, "ANNOTATIONCACHEVERSION", findexonscds.ANNOTATIONCACHEVERSION + 1)
+    newpath = annotationcachepath(str(tmp_path / "ann.gtf"))
+    assert newpath != oldpath and not os.path.exists(newpath)
+    getcoordmap(str(tmp_path / "ann.gtf"))
+    assert sorted(os.listdir(newpath)) == ["cds.parquet", "coordmap", "exons.parquet"]
+
+#test that storing a coordinate map again keeps the stored map and leaves no temporary files
+def test_savecoordmap_existing(tmp_path):
+    path = savecoordmap(buildcoordmap(exons), str(tmp_path / "ann.coordmap"))
+    savecoordmap(buildcoordmap(exons.head(1)), path)
+    assert loadcoordmap(path)["transcripts"] == exons["tran_id"].to_list()
+    assert os.listdir(tmp_path) == ["ann.coordmap"]
+
+#test data
+cds = pl.DataFrame({"tran_id": ["T1", "T3"], "tran_start": [150, 10], "tran_stop": [400, 300]})
+
+#test bamrelativetocds, reads on transcripts without a CDS are dropped
+def test_bamrelativetocds():
+    result = bamrelativetocds(bamtranscript(bam, exons), cds).sort("start")
+    assert result["tran_id"].to_list() == ["T1", "T1"]
+    assert result["bamcds_start"].to_list() == [-50, 224351]
+    assert "tran_start_bam" not in result.columns
+
+#########################################################################################################################################
+#test data, coverage of length 28 rises at -12 and of length 30 at -14, length 25 has no reads near the CDS start
+metagene = pl.DataFrame(
+    [(pos, length, 50 if pos >= rise else 2) for length, rise in [(28, -12), (30, -14)] for pos in range(-40, 30)]
+    + [(100, 25, 5)],
+    schema=["bamcds_start", "length", "count"],
+    orient="row",
+)
+
+#test change_point_analysis
+def test_change_point_analysis():
+    assert change_point_analysis(metagene) == {25: 15, 28: 15, 30: 17}
+    assert change_point_analysis(metagene.clear()) == {}
+
+#test that offsets written by saveoffsets are read back by readofst
+def test_offsetsfile(tmp_path):
+    offsetfile = saveoffsets({28: 15, 30: 17}, str(tmp_path / "sample"))
+    assert readofst(offsetfile) == {28: 15, 30: 17}
+
+#test that A-site counts written by beddftobigwig are read back from the bigWig file
+def test_beddftobigwig(tmp_path):
+    (tmp_path / "chrom.sizes").write_text("chr1\t1000\nchr2\t500\n")
+    bigwig = beddftobigwig(asitecalc(reads, offsets), str(tmp_path / "chrom.sizes"), str(tmp_path / "sample"))
+    bwfile = pyBigWig.open(bigwig)
+    assert bwfile.chroms() == {"chr1": 1000, "chr2": 500}
+    assert bwfile.intervals("chr1") == ((112, 113, 5.0), (115, 116, 5.0), (143, 144, 1.0))
+    assert bwfile.intervals("chr2") == ((112, 113, 4.0),)
+
+#########################################################################################################################################
+import pysam
+
+from Translonpredictor.readfiles import readbam, indexbam
+
+#writes a sorted BAM file without an index, with reads given as (name, chromosome, 0-based start, length)
+#and optionally the mapping quality and flag of the read
+def writebam(path, bamreads):
+    header = {"HD": {"VN": "1.6", "SO": "coordinate"}, "SQ": [{"SN": "chr1", "LN": 1000}, {"SN": "chr2", "LN": 500}]}
+    with pysam.AlignmentFile(path, "wb", header=header) as bamfile:
+        for name, chrom, start, length, *mapqflag in bamreads:
+            mapq, flag = mapqflag + [30, 0][len(mapqflag):]
+            read = pysam.AlignedSegment(bamfile.header)
+            read.query_name = name
+            read.reference_name = chrom
+            read.reference_start = start
+            read.cigarstring = f"{length}M"
+            read.query_sequence = "A" * length
+            read.query_qualities = pysam.qualitystring_to_array("I" * length)
+            read.mapping_quality = mapq
+            read.flag = flag
+            read.set_tag("NH", 1)
+            bamfile.write(read)
+    return path
+
+#test that readbam indexes a BAM file that has no index yet
+def test_readbam_unindexed(tmp_path):
+    bampath = writebam(str(tmp_path / "sample.bam"), [("read1_x2", "chr1", 99, 28), ("read2_x1", "chr1", 129, 29), ("read3_x4", "chr2", 99, 28)])
+    assert not os.path.exists(f"{bampath}.bai")
+    df = readbam(bampath, ["qname", "rname", "pos", "end"])
+    assert os.path.exists(f"{bampath}.bai")
+    assert df.rows() == [("read1_x2", "chr1", 100, 127), ("read2_x1", "chr1", 130, 158), ("read3_x4", "chr2", 100, 127)]
+
+#test that every filter of readrecords drops its records and only the requested columns are returned
+def test_readbam_filters(tmp_path):
+    bampath = writebam(
+        str(tmp_path / "sample.bam"),
+        [("read1_x1", "chr1", 99, 28), ("lowmapq_x1", "chr1", 109, 28, 5), ("duplicate_x1", "chr1", 119, 28, 30, 1024),
+        ("short_x1", "chr1", 129, 20), ("long_x1", "chr1", 139, 40)],
+    )
+    names = lambda filters: readbam(bampath, ["qname"], filters)["qname"].to_list()
+    assert names(None) == ["read1_x1", "lowmapq_x1", "duplicate_x1", "short_x1", "long_x1"]
+    assert names({"mapq": 10}) == ["read1_x1", "duplicate_x1", "short_x1", "long_x1"]
+    assert names({"flagmask": 1024}) == ["read1_x1", "lowmapq_x1", "short_x1", "long_x1"]
+    assert names({"minlength": 25}) == ["read1_x1", "lowmapq_x1", "duplicate_x1", "long_x1"]
+    assert names({"maxlength": 30}) == ["read1_x1", "lowmapq_x1", "duplicate_x1", "short_x1"]
+    filters = {"mapq": 10, "flagmask": 1024, "minlength": 25, "maxlength": 30}
+    df = readbam(bampath, ["qname", "pos"], filters)
+    assert df.columns == ["qname", "pos"] and df.rows() == [("read1_x1", 100)]
+    assert "seq" in readbam(bampath, filters=filters).columns
+
+#test that a fresh index is reused and an index older than its BAM file is rebuilt
+def test_indexbam_stale(tmp_path):
+    bampath = writebam(str(tmp_path / "sample.bam"), [("read1_x2", "chr1", 99, 28)])
+    indexpath = indexbam(bampath)
+    assert indexpath == f"{bampath}.bai"
+    os.utime(indexpath, (1, 1))
+    writebam(bampath, [("read2_x1", "chr2", 49, 30)])
+    assert indexbam(bampath) == indexpath and os.path.getmtime(indexpath) > 2
+    stamp = os.path.getmtime(indexpath)
+    assert indexbam(bampath) == indexpath and os.path.getmtime(indexpath) == stamp
+    assert readbam(bampath, ["qname", "rname"]).rows() == [("read2_x1", "chr2")]
+
+#test that BAM files with the same name in read-only directories get their own cached index
+def test_indexbam_readonly(tmp_path, monkeypatch):
+    monkeypatch.setattr(os, "access", lambda path, mode: False)
+    os.makedirs(tmp_path / "w1")
+    os.makedirs(tmp_path / "w2")
+    first = writebam(str(tmp_path / "w1" / "s.bam"), [("read1_x2", "chr1", 99, 28)])
+    second = writebam(str(tmp_path / "w2" / "s.bam"), [("read2_x1", "chr2", 49, 30), ("read3_x1", "chr2", 59, 30)])
+    indexdir = str(tmp_path / "cache")
+    firstindex, secondindex = indexbam(first, indexdir=indexdir), indexbam(second, indexdir=indexdir)
+    assert firstindex != secondindex
+    assert os.path.dirname(firstindex) == indexdir and not os.path.exists(f"{first}.bai")
+    assert indexbam(first, indexdir=indexdir) == firstindex
+    assert readbam(first, ["qname"], indexdir=indexdir)["qname"].to_list() == ["read1_x2"]
+    assert readbam(second, ["qname"], indexdir=indexdir)["qname"].to_list() == ["read2_x1", "read3_x1"]
+
+#########################################################################################################################################
+from Translonpredictor.fileprocessor import sampleoffsets
+
+#writes reads of length 27 at a genomic position of T1 as a batch of BAM records, and records which batches are read
+def samplebatches(positions, reads, consumed):
+    for batch, pos in enumerate(positions):
+        consumed.append(batch)
+        yield pl.DataFrame({"qname": [f"read{i}_x1" for i in range(reads)], "rname": ["chr1"] * reads, "pos": [pos] * reads, "end": [pos + 27] * reads})
+
+#test that reads past the subsample size are not counted and the remaining batches are not read
+def test_sampleoffsets_samplesize(tmp_path):
+    (tmp_path / "ann.gtf").write_text(gtf)
+    consumed = []
+    offsets = sampleoffsets(samplebatches([138, 142, 142], 5, consumed), str(tmp_path / "ann.gtf"), 5)
+    assert offsets == {27: 18} and consumed == [0]
+    consumed = []
+    assert sampleoffsets(samplebatches([138, 142, 142], 5, consumed), str(tmp_path / "ann.gtf"), 20) != offsets
+    assert consumed == [0, 1, 2]
+
+#test that the subsample, and so the offsets, are the same on every run
+def test_sampleoffsets_deterministic(tmp_path):
+    (tmp_path / "ann.gtf").write_text(gtf)
+    runs = [sampleoffsets(samplebatches([138, 142, 138, 142], 3, []), str(tmp_path / "ann.gtf"), 7) for run in range(3)]
+    assert runs[0] == runs[1] == runs[2]
+
+#test that stable offsets only end the sampling once every read length has enough reads
+def test_sampleoffsets_stable(tmp_path):
+    (tmp_path / "ann.gtf").write_text(gtf)
+    consumed = []
+    sampleoffsets(samplebatches([138] * 10, 1, consumed), str(tmp_path / "ann.gtf"), 100, minreads=1)
+    assert consumed == [0, 1, 2]
+    consumed = []
+    sampleoffsets(samplebatches([138] * 10, 1, consumed), str(tmp_path / "ann.gtf"), 100, minreads=5)
+    assert consumed == [0, 1, 2, 3, 4]
+    consumed = []
+    sampleoffsets(samplebatches([138] * 10, 1, consumed), str(tmp_path / "ann.gtf"), 100)
+    assert len(consumed) == 10
+
+#########################################################################################################################################
+from Translonpredictor.fileprocessor import bamtobed, paralleltobed
+
+#test that reads on both chromosomes give the same bedGraph when every chromosome is processed in its own worker
+def test_paralleltobed(tmp_path):
+    (tmp_path / "ann.gtf").write_text(gtf)
+    reads = [(f"read{i}_x{i % 3 + 1}", "chr1", start, length) for i, (start, length) in enumerate([(130, 28), (136, 28), (138, 29), (140, 30), (160, 28), (180, 29), (310, 28), (330, 30)])]
+    reads += [(f"read{i}_x2", "chr2", start, length) for i, (start, length) in enumerate([(150, 28), (160, 29), (200, 30), (230, 28)], 10)]
+    bampath = writebam(str(tmp_path / "sample.bam"), reads)
+    offsetsfile = saveoffsets({28: 12, 29: 13, 30: 14}, str(tmp_path / "sample"))
+    for offsets in [offsetsfile, None]:
+        single, exon, cds = bamtobed(bampath, str(tmp_path / "ann.gtf"), offsets)
+        assert not single.is_empty()
+        parallel, exon, cds = bamtobed(bampath, str(tmp_path / "ann.gtf"), offsets, threads=2)
+        plt.assert_frame_equal(parallel, single)
+    merged, exon, cds = paralleltobed(bampath, str(tmp_path / "ann.gtf"), readofst(offsetsfile), 2, mergeevery=1)
+    plt.assert_frame_equal(merged, bamtobed(bampath, str(tmp_path / "ann.gtf"), offsetsfile)[0])
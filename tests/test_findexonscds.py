@@ -0,0 +1,45 @@
+import pytest
+import polars as pl
+
+from Translonpredictor.findexonscds import transcriptid, exontranscriptcoords
+
+#########################################################################################################################################
+#test that the transcript ID is extracted from the attributes of every GFF3 and GTF dialect
+@pytest.mark.parametrize(
+    "attributes, tran_id",
+    [
+        ("ID=transcript:ENST00000456328;Parent=gene:ENSG00000223972;biotype=lncRNA", "ENST00000456328"),
+        ("ID=exon:ENSE00002234944;Parent=transcript:ENST00000456328;rank=1", "ENST00000456328"),
+        ("gene_id=G1;transcript_id=T1.2;gene_name=x", "T1.2"),
+        ('gene_id "G1"; transcript_id "T1.2"; gene_name "x";', "T1.2"),
+        ("gene_id G1; transcript_id T1 ; gene_name x;", "T1"),
+        ('transcript_id "T1";', "T1"),
+        ('gene_id "G1"; gene_name "x";', ""),
+    ],
+)
+def test_transcriptid(attributes, tran_id):
+    df = pl.DataFrame({"attributes": [attributes]})
+    assert df.select(transcriptid())["tran_id"].to_list() == [tran_id]
+
+#########################################################################################################################################
+#test data, multi-exon transcripts on either strand with their exons in file order
+posexons = pl.DataFrame(
+    {"tran_id": ["T1", "T2"],
+    "start": [[100, 300], [10, 50, 100]],
+    "stop": [[200, 350], [19, 59, 104]]}
+)
+negexons = pl.DataFrame(
+    {"tran_id": ["T3", "T4"],
+    "start": [[500, 700], [10, 30, 60]],
+    "stop": [[600, 750], [20, 40, 65]]}
+)
+
+#test that transcript coordinates are numbered along the exons, from the last exon in the genome on the negative strand
+def test_exontranscriptcoords():
+    pos = exontranscriptcoords(posexons, posstrand=True)
+    assert pos["tran_start"].to_list() == [[0, 101], [0, 10, 20]]
+    assert pos["tran_stop"].to_list() == [[100, 151], [9, 19, 24]]
+    neg = exontranscriptcoords(negexons, posstrand=False)
+    assert neg["tran_start"].to_list() == [[0, 51], [0, 6, 17]]
+    assert neg["tran_stop"].to_list() == [[50, 151], [5, 16, 27]]
+    assert neg.select(["tran_id", "start", "stop"]).equals(negexons)
@@ -47,4 +47,131 @@ def orfrelativeposition(annotation, df, exondf):
             for orf in orfpair:
                 orftype.append("Non Coding")
     df = df.with_columns((pl.Series(orftype)).alias("type"))
-    return df, exon_coords
\ No newline at end of file
+    return df, exon_coords
+#########################################################################################################################################
+import polars as pl
+
+from Translonpredictor.getcandidates import chromosometranscripts
+
+#test that exons are joined in genomic order and transcripts on the negative strand are reverse complemented
+def test_chromosometranscripts(tmp_path):
+    (tmp_path / "genome.fa").write_text(">chr1\nAAACCCGGGT\nTTacgt\n")
+    exons = pl.DataFrame(
+        {"tran_id": ["T1", "T2"],
+        "strand": ["+", "-"],
+        "start": [[1, 7], [4, 11]],
+        "stop": [[3, 12], [6, 14]]}
+    )
+    sequences = chromosometranscripts(str(tmp_path / "genome.fa"), "chr1", exons)
+    assert sequences == [("T1", "AAAGGGTTT"), ("T2", "gtAAGGG")]
+
+#########################################################################################################################################
+from Translonpredictor.getcandidates import preporfs
+
+#test data, near-cognate starts, a start without an in-frame stop, a short and an empty transcript
+transcripts = [("T1", "ATGCATGACTAGCATCAGCATCAGCATATGGACGAATTAAGTTAA"), ("T2", "CCCTGAAATTGACTGGG"), ("T3", "AT"), ("T4", "")]
+
+#test that the numpy engine finds the same ORFs as the automaton engine
+def test_preporfs_engines():
+    for minlength, maxlength in [(0, 1000000), (5, 20)]:
+        automaton = preporfs(transcripts, ["ATG", "CTG"], ["TAA", "TAG", "TGA"], minlength, maxlength)
+        numpy = preporfs(transcripts, ["ATG", "CTG"], ["TAA", "TAG", "TGA"], minlength, maxlength, engine="numpy")
+        assert numpy.sort(numpy.columns).rows() == automaton.sort(automaton.columns).rows()
+    assert ("T2", 2, 17, 13, "CTG", "GGG") in automaton.rows()
+
+#########################################################################################################################################
+import random
+
+from Translonpredictor.orffinder import find_orfs, find_all_positions
+from Translonpredictor.getcandidates import create_automaton
+
+#function to compare with, find_orfs with the linear search over all stops of the frame it had before the binary search
+def find_orfs_linear(sequence, tran_id, startautomaton, stopautomaton, minlength=0, maxlength=1000000):
+    orf_list = []
+    startpositions, start_codons = find_all_positions(sequence, startautomaton)
+    stoppositions, stop_codons = find_all_positions(sequence, stopautomaton)
+    for frame, startpositions in startpositions.items():
+        for position in startpositions:
+            valid_stops = [i for i in stoppositions[frame] if i > position]
+            if valid_stops:
+                stopposition = min(valid_stops)
+                stopcodon = stop_codons[stopposition]
+            else:
+                stopposition = len(sequence)
+                stopcodon = sequence[-3:]
+            orf_data = {"tran_id": tran_id, "start": position - 2, "stop": stopposition, "length": stopposition - position, "startorf": start_codons[position], "stoporf": stopcodon}
+            if orf_data["length"] < maxlength and orf_data["length"] > minlength:
+                orf_list.append(orf_data)
+    return orf_list
+
+#test that the binary search finds the same ORFs as the linear search, with starts in overlapping frames and starts without an in-frame stop
+def test_find_orfs():
+    starts, stops = create_automaton(["ATG", "CTG"]), create_automaton(["TAA", "TAG", "TGA"])
+    random.seed(1)
+    sequences = [sequence for tran, sequence in transcripts] + ["ATGATGCTGAATGTAGATGA", "CATGATGATGTTTTAG"]
+    sequences += ["".join(random.choice("ACGT") for i in range(random.randint(0, 300))) for j in range(50)]
+    for sequence in sequences:
+        for minlength, maxlength in [(0, 1000000), (5, 30)]:
+            assert find_orfs(sequence, "T1", starts, stops, minlength, maxlength) == find_orfs_linear(sequence, "T1", starts, stops, minlength, maxlength)
+    #the ORFs in frame 0 and the last ORF in frame 1 have no in-frame stop and end at the end of the sequence
+    orfs = find_orfs("ATGATGCTGAATGTAGATGA", "T1", starts, stops)
+    assert [(orf["start"], orf["stop"], orf["startorf"], orf["stoporf"]) for orf in orfs] == [
+        (0, 20, "ATG", "TGA"), (3, 20, "ATG", "TGA"), (6, 20, "CTG", "TGA"), (10, 15, "ATG", "TAG"), (16, 20, "ATG", "TGA")]
+
+#########################################################################################################################################
+from Translonpredictor.getcandidates import streamorfs, orftype, classify_orf, gettranscripts, workerpool
+from Translonpredictor.orffinder import restore_orfs
+
+#test that the streamed ORFs are the ORFs of preporfs, with the ORFs of a transcript consecutive
+def test_streamorfs(tmp_path):
+    orfs = preporfs(transcripts, ["ATG", "CTG"], ["TAA", "TAG", "TGA"], 0, 1000000)
+    streamed, keys = streamorfs(transcripts, ["ATG", "CTG"], ["TAA", "TAG", "TGA"], 0, 1000000, str(tmp_path / "sample_candidates.parquet"))
+    assert isinstance(streamed, pl.LazyFrame)
+    assert keys["tran_id"].to_list() == ["T1", "T2", "T3", "T4"]
+    assert streamed.schema["tran_key"] == pl.UInt32 and streamed.schema["start"] == pl.Int32
+    assert restore_orfs(streamed, keys).collect().rows() == orfs.rows()
+
+#test that transcript extraction and the ORF scan sharing one pool find the ORFs of a single process
+def test_workerpool(tmp_path):
+    (tmp_path / "genome.fa").write_text(">chr1\nCCATGAAATTTGGGTAACCATGCCCTGACC\n>chr2\nGGTTACAAACCCATGGTCTCAGG\n")
+    (tmp_path / "ann.gtf").write_text(
+        'chr1\tsrc\texon\t1\t30\t.\t+\t.\tgene_id "G1"; transcript_id "T1";\n'
+        'chr2\tsrc\texon\t1\t23\t.\t-\t.\tgene_id "G2"; transcript_id "T2";\n'
+    )
+    seq, ann = str(tmp_path / "genome.fa"), str(tmp_path / "ann.gtf")
+    orfs = preporfs(gettranscripts(seq, ann), ["ATG"], ["TAA", "TAG", "TGA"], 0, 1000000)
+    with workerpool(2) as executor:
+        transcript = gettranscripts(seq, ann, threads=2, executor=executor)
+        streamed, keys = streamorfs(transcript, ["ATG"], ["TAA", "TAG", "TGA"], 0, 1000000, str(tmp_path / "sample_candidates.parquet"), threads=2, executor=executor)
+    assert orfs.height > 0
+    assert restore_orfs(streamed, keys).collect().rows() == orfs.rows()
+
+#test that the ORFs and their order are the same for one and two threads, over more chunks than are scanned at once
+def test_orfchunks_threads(tmp_path, monkeypatch):
+    from Translonpredictor import getcandidates
+    transcriptchunks = getcandidates.transcriptchunks
+    monkeypatch.setattr(getcandidates, "transcriptchunks", lambda transcript: transcriptchunks(transcript, 500))
+    random.seed(2)
+    #transcript IDs out of sorted order, so the order of the streamed ORFs is that of the transcripts
+    sequences = [(f"T{tran}", "".join(random.choice("ACGT") for i in range(random.randint(50, 300)))) for tran in random.sample(range(10**6), 60)]
+    for engine in ["automaton", "numpy"]:
+        single = preporfs(sequences, ["ATG", "CTG"], ["TAA", "TAG", "TGA"], 0, 1000000, engine)
+        assert preporfs(sequences, ["ATG", "CTG"], ["TAA", "TAG", "TGA"], 0, 1000000, engine, threads=2).rows() == single.rows()
+        streamed = [
+            restore_orfs(*streamorfs(sequences, ["ATG", "CTG"], ["TAA", "TAG", "TGA"], 0, 1000000, str(tmp_path / f"{threads}.parquet"), engine, threads)).collect()
+            for threads in [1, 2]
+        ]
+        assert streamed[0].rows() == streamed[1].rows()
+        assert streamed[0]["tran_id"].unique(maintain_order=True).to_list() == [tran for tran, sequence in sequences if tran in single["tran_id"]]
+
+#test that the vectorised ORF types are those of classify_orf
+def test_orftype():
+    orfs = pl.DataFrame(
+        {"start": [1, 10, 50, 5, 15, 12, 5, 5, 10],
+        "stop": [8, 40, 60, 20, 45, 30, 45, 40, 20],
+        "tran_start": [10] * 9,
+        "tran_stop": [40] * 9}
+    )
+    types = orfs.select(orftype().alias("type"))["type"].to_list()
+    assert types == [classify_orf(row) for row in orfs.iter_rows(named=True)]
+    assert types == ["uORF", "CDS", "dORF", "uoORF", "doORF", "iORF", "uoORF", "uoORF", "iORF"]
@@ -0,0 +1,66 @@
+import numpy as np
+import polars as pl
+
+from Translonpredictor.transcriptmodels import TranscriptModelStore
+
+#########################################################################################################################################
+#test data, T2 is on the negative strand with its exons in transcript order
+exons = pl.DataFrame(
+    {"chr": [["chr1", "chr1"], ["chr2", "chr2"]],
+    "tran_id": ["T1", "T2"],
+    "strand": [["+", "+"], ["-", "-"]],
+    "start": [[100, 300], [700, 500]],
+    "stop": [[200, 350], [750, 600]],
+    "tran_start": [[0, 101], [0, 51]],
+    "tran_stop": [[100, 151], [50, 151]]}
+)
+store = TranscriptModelStore.fromexons(exons)
+
+#test the transcript lookup
+def test_transcriptindex():
+    assert len(store) == 2 and "T2" in store and "T3" not in store
+    assert store.transcriptindex(["T2", "T3", "T1"]).tolist() == [1, -1, 0]
+    assert store.chrom(1) == "chr2"
+    assert store.strand.tolist() == [1, -1]
+    assert store.exons(1).tolist() == [2, 3]
+
+#test that positions outside the exons of their transcript are not converted
+def test_genometotranscript():
+    tranidx = store.transcriptindex(["T1", "T1", "T1", "T3", "T2"])
+    positions = np.array([150, 250, 310, 150, 550])
+    assert store.findexons(tranidx, positions).tolist() == [0, -1, 1, -1, 3]
+    assert store.genometotranscript(tranidx, positions).tolist() == [50, -1, 111, -1, 101]
+
+#test that positions on the negative strand are counted from the genomic stop of the transcript
+def test_genometotranscript_reverse():
+    tranidx = store.transcriptindex(["T2"] * 4)
+    positions = np.array([520, 590, 710, 750])
+    assert store.genometotranscript(tranidx, positions).tolist() == [131, 61, 40, 0]
+
+#test that transcript positions are converted back to the same genomic positions
+def test_transcripttogenome():
+    tranidx = store.transcriptindex(["T1"] * 4 + ["T2"] * 3)
+    positions = np.array([100, 150, 199, 349, 520, 590, 710])
+    converted = store.genometotranscript(tranidx, positions)
+    assert store.transcripttogenome(tranidx, converted).tolist() == positions.tolist()
+    assert store.transcripttogenome(tranidx[4:], [131, 61, 40]).tolist() == [520, 590, 710]
+    assert store.transcripttogenome(tranidx[:1], [500]).tolist() == [-1]
+
+#test the conversion on the negative strand
+def test_exontotranscript():
+    assert store.exontotranscript([2, 3], [700, 600], reverse=True).tolist() == [50, 51]
+    assert store.exontotranscript([2, 3], [750, 500], end=True, reverse=True).tolist() == [0, 151]
+
+#test that the store reads the exons file written by saveorfsandexons, with and without strands
+def test_fromexonfile(tmp_path):
+    exonfile = exons.with_columns(
+        pl.col("chr", "strand").list.first(),
+        pl.col("start", "stop", "tran_start", "tran_stop").list.eval(pl.element().cast(pl.String)).list.join(","),
+    )
+    exonfile.write_csv(tmp_path / "sample_exons.csv")
+    filestore = TranscriptModelStore.fromexonfile(str(tmp_path / "sample_exons.csv"))
+    assert filestore.transcripts == ["T1", "T2"]
+    assert filestore.tran_stop.tolist() == store.tran_stop.tolist()
+    assert filestore.strand.tolist() == [1, -1]
+    exonfile.drop("strand").write_csv(tmp_path / "old_exons.csv")
+    assert TranscriptModelStore.fromexonfile(str(tmp_path / "old_exons.csv")).strand.tolist() == [0, 0]